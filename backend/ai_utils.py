@@ -1,10 +1,12 @@
 # ai_utils.py
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 from dotenv import load_dotenv # This is typically not relative
 import os
 import asyncio
 import time
 from fastapi import HTTPException
+from llm_scheduler import llm_scheduler, PRIORITY_INTERACTIVE
 
 # Load environment variables from .env
 load_dotenv()
@@ -16,38 +18,139 @@ if GEMINI_API_KEY:
 else:
     raise ValueError("Missing GEMINI_API_KEY in environment")
 
-async def call_gemini_api(prompt: str, retries=3):
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")  # or "gemini-2.5-pro"
+
+# max_output_tokens is set per call by output_token_budget
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+}
+
+# Output budget scales with the prompt: tokens per input token, clamped to [min, max]
+GEMINI_MIN_OUTPUT_TOKENS = int(os.getenv("GEMINI_MIN_OUTPUT_TOKENS", "4096"))
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "32768"))
+GEMINI_OUTPUT_TOKENS_PER_INPUT_TOKEN = float(os.getenv("GEMINI_OUTPUT_TOKENS_PER_INPUT_TOKEN", "2"))
+# Follow-up requests allowed when a response stops at MAX_TOKENS
+GEMINI_MAX_CONTINUATIONS = int(os.getenv("GEMINI_MAX_CONTINUATIONS", "2"))
+
+FINISH_REASON_MAX_TOKENS = 2
+CONTINUE_INSTRUCTION = "Your previous response was cut off. Continue exactly where it stopped, without repeating anything."
+
+_gemini_model = None
+
+def init_gemini_client():
+    """
+    Create the long-lived model once per worker. Must run inside the event
+    loop (app startup) so the shared async gRPC channel is bound to the loop
+    that serves requests. Concurrency is capped by llm_scheduler.
+    """
+    global _gemini_model
+    if _gemini_model is None:
+        _gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        # Warm the library's shared async client so every call reuses one channel
+        genai_client.get_default_generative_async_client()
+    return _gemini_model
+
+def output_token_budget(prompt: str) -> int:
+    """max_output_tokens for a prompt, assuming roughly 4 characters per token"""
+    input_tokens = len(prompt) / 4
+    budget = int(input_tokens * GEMINI_OUTPUT_TOKENS_PER_INPUT_TOKEN)
+    return max(GEMINI_MIN_OUTPUT_TOKENS, min(GEMINI_MAX_OUTPUT_TOKENS, budget))
+
+def continuation_contents(prompt: str, partial: str, instruction: str) -> list:
+    """Chat history that shows the model its own truncated answer and asks for the rest"""
+    return [
+        {"role": "user", "parts": [prompt]},
+        {"role": "model", "parts": [partial]},
+        {"role": "user", "parts": [instruction]},
+    ]
+
+async def call_gemini_api(prompt: str, retries=3, priority: int = PRIORITY_INTERACTIVE, generation_config: dict = None, resume=None):
+    """
+    Returns (text, latency_ms). A response cut off at MAX_TOKENS is kept and
+    continued with a follow-up turn instead of being regenerated; `resume`
+    maps the partial text to (text to keep, follow-up instruction) so callers
+    can cut back to the last complete unit. Pieces are stitched in order.
+    """
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")  # or "gemini-2.5-pro"
-        
-        for attempt in range(retries):
+        model = init_gemini_client()
+        generation_config = {
+            **(generation_config or GENERATION_CONFIG),
+            "max_output_tokens": output_token_budget(prompt)
+        }
+        contents = prompt
+        pieces = []
+        latency_ms = 0.0
+        continuations = 0
+        attempt = 0
+
+        while True:
             try:
-                start_time = time.time()
-                response = await asyncio.to_thread(
-                    model.generate_content,
-                    prompt,
-                    generation_config={
-                        "max_output_tokens": 8000,
-                        "temperature": 0.7,
-                        "top_p": 0.95,
-                    }
-                )
-                latency_ms = (time.time() - start_time) * 1000  # Convert to milliseconds
-                if response.candidates and response.candidates[0].content.parts:
-                    return response.text, latency_ms
-                else:
-                    reason = getattr(response.candidates[0] if response.candidates else None, 'finish_reason', "NO_CANDIDATES")
-                    if reason == 2:  # MAX_TOKENS
-                        print(f"Attempt {attempt + 1}: Hit MAX_TOKENS. Retrying...")
-                        if attempt < retries - 1:
-                            await asyncio.sleep(2 ** attempt)
-                            continue
-                    else:
-                        raise Exception(f"Empty response. Finish reason: {reason}")
+                # Queue for a slot in this caller's priority lane (raises 429 when saturated)
+                async with llm_scheduler.slot(priority):
+                    start_time = time.time()
+                    response = await model.generate_content_async(
+                        contents,
+                        generation_config=generation_config
+                    )
+                latency_ms += (time.time() - start_time) * 1000  # Convert to milliseconds
+
+                candidate = response.candidates[0] if response.candidates else None
+                reason = getattr(candidate, 'finish_reason', "NO_CANDIDATES")
+                text = response.text if candidate and candidate.content.parts else ""
+
+                if reason == FINISH_REASON_MAX_TOKENS and text and continuations < GEMINI_MAX_CONTINUATIONS:
+                    kept, instruction = resume(text) if resume else (text, CONTINUE_INSTRUCTION)
+                    if not kept:
+                        kept, instruction = text, CONTINUE_INSTRUCTION
+                    pieces.append(kept)
+                    continuations += 1
+                    print(f"Hit MAX_TOKENS, continuing ({continuations}/{GEMINI_MAX_CONTINUATIONS})")
+                    contents = continuation_contents(prompt, "".join(pieces), instruction)
+                    continue
+
+                if text:
+                    pieces.append(text)
+                if pieces:
+                    return "".join(pieces), latency_ms
+
+                if reason == FINISH_REASON_MAX_TOKENS:
+                    # Budget was used up before any text (e.g. by thinking): retry with more room
+                    generation_config["max_output_tokens"] = min(
+                        GEMINI_MAX_OUTPUT_TOKENS, generation_config["max_output_tokens"] * 2
+                    )
+                    raise Exception("Hit MAX_TOKENS before any output")
+                raise Exception(f"Empty response. Finish reason: {reason}")
+            except HTTPException:
+                raise
             except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                if attempt == retries - 1:
+                attempt += 1
+                print(f"Attempt {attempt} failed: {e}")
+                if attempt >= retries:
                     raise
-                await asyncio.sleep(2 ** attempt)
+                await asyncio.sleep(2 ** (attempt - 1))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gemini API error: {str(e)}")
+
+async def stream_gemini_api(prompt: str, generation_config: dict = None):
+    """
+    Yield response text chunks as Gemini generates them. The caller is
+    responsible for holding an llm_scheduler slot for the whole stream.
+    """
+    model = init_gemini_client()
+    try:
+        response = await model.generate_content_async(
+            prompt,
+            generation_config={
+                **(generation_config or GENERATION_CONFIG),
+                "max_output_tokens": output_token_budget(prompt)
+            },
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.candidates and chunk.candidates[0].content.parts:
+                yield chunk.text
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API error: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,122 @@
+# analytics_rollup.py
+from datetime import date, datetime
+from sqlalchemy import func, literal, select, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import (
+    SessionLocal, AnalyticsDailyRollup, CodeSession, AISuggestion, AcceptedSuggestion,
+    RejectedSuggestion, ModifiedSuggestion, SuggestionLatency
+)
+
+ROLLUP_KEY = ["day", "user_id", "language", "error_category", "severity", "outcome"]
+
+async def session_owner(db: AsyncSession, session_id: str) -> int | None:
+    """user_id the analytics attribute a session's events to (same as the CodeSession join)"""
+    result = await db.execute(select(CodeSession.user_id).where(CodeSession.session_id == session_id))
+    return result.scalar()
+
+class RollupBatch:
+    """
+    Collects rollup increments for one transaction and writes them with a
+    single multi-row upsert. Increments are merged per key first because
+    Postgres rejects an upsert that touches the same row twice.
+    """
+
+    def __init__(self):
+        self._rows = {}
+
+    def add(self, outcome: str, user_id: int | None, language: str | None, error_category: str | None = None,
+            severity: str | None = None, day: date | None = None, count: int = 1, latency_ms: float | None = None):
+        key = (
+            day or datetime.utcnow().date(),
+            user_id or 0,
+            language or "",
+            error_category or "",
+            severity or "",
+            outcome
+        )
+        row = self._rows.setdefault(key, {"event_count": 0, "latency_sum_ms": 0.0, "latency_count": 0})
+        row["event_count"] += count
+        if latency_ms is not None:
+            row["latency_sum_ms"] += latency_ms
+            row["latency_count"] += 1
+
+    async def flush(self, db: AsyncSession):
+        """Stage the upsert in the caller's transaction; the caller commits"""
+        if not self._rows:
+            return
+        # Rows in key order, so concurrent flushes lock shared rows in the same order instead of deadlocking
+        values = [dict(zip(ROLLUP_KEY, key), **totals) for key, totals in sorted(self._rows.items())]
+        statement = pg_insert(AnalyticsDailyRollup).values(values)
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=ROLLUP_KEY,
+            set_={
+                "event_count": AnalyticsDailyRollup.event_count + statement.excluded.event_count,
+                "latency_sum_ms": AnalyticsDailyRollup.latency_sum_ms + statement.excluded.latency_sum_ms,
+                "latency_count": AnalyticsDailyRollup.latency_count + statement.excluded.latency_count,
+            }
+        ))
+        self._rows = {}
+
+def backfill_rollup(db: Session):
+    """
+    Rebuild analytics_daily_rollup from the raw event tables with one
+    INSERT ... SELECT per source table, inside a single transaction
+    """
+    columns = ROLLUP_KEY + ["event_count", "latency_sum_ms", "latency_count"]
+    owner = func.coalesce(CodeSession.user_id, 0)
+
+    def grouped(model, outcome, severity=None):
+        day = func.date(model.created_at)
+        severity_col = func.coalesce(severity, "") if severity is not None else literal("")
+        return (
+            select(
+                day, owner, func.coalesce(model.language, ""), func.coalesce(model.error_category, ""),
+                severity_col, literal(outcome), func.count(), literal(0.0), literal(0)
+            )
+            .select_from(model)
+            .outerjoin(CodeSession, CodeSession.session_id == model.session_id)
+            .group_by(day, owner, func.coalesce(model.language, ""), func.coalesce(model.error_category, ""), severity_col)
+        )
+
+    latency_day = func.date(SuggestionLatency.created_at)
+    latency_language = func.coalesce(CodeSession.language, "")
+    latency_select = (
+        select(
+            latency_day, owner, latency_language, literal(""), literal(""), literal("latency"),
+            func.count(), func.sum(SuggestionLatency.latency_ms), func.count()
+        )
+        .select_from(SuggestionLatency)
+        .outerjoin(CodeSession, CodeSession.session_id == SuggestionLatency.session_id)
+        .group_by(latency_day, owner, latency_language)
+    )
+
+    sources = [
+        grouped(AISuggestion, "suggested", AISuggestion.severity),
+        grouped(AcceptedSuggestion, "accepted"),
+        grouped(RejectedSuggestion, "rejected"),
+        grouped(ModifiedSuggestion, "modified"),
+        latency_select,
+    ]
+    try:
+        db.query(AnalyticsDailyRollup).delete()
+        for source in sources:
+            db.execute(insert(AnalyticsDailyRollup).from_select(columns, source))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return db.query(AnalyticsDailyRollup).count()
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: python analytics_rollup.py backfill")
+        sys.exit(1)
+    db = SessionLocal()
+    try:
+        rows = backfill_rollup(db)
+        print(f"Rebuilt analytics_daily_rollup: {rows} rows")
+    finally:
+        db.close()
@@ -2,61 +2,88 @@
 from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from datetime import datetime, timedelta
-from database import get_db, AISuggestion, AcceptedSuggestion, RejectedSuggestion, ModifiedSuggestion, SuggestionLatency, CodeSession, UserPattern, User
+from datetime import datetime
+from database import get_db, AISuggestion, AcceptedSuggestion, RejectedSuggestion, ModifiedSuggestion, CodeSession, UserPattern, User, AnalyticsDailyRollup
 from schemas import AnalyticsFilter
 
-def build_query(db_model, filter: AnalyticsFilter, db: Session):
-    query = db.query(db_model)
+# All dashboard views read from the pre-aggregated daily rollup (see analytics_rollup.py)
+Rollup = AnalyticsDailyRollup
+
+def build_rollup_query(filter: AnalyticsFilter, db: Session, outcomes: list, *entities):
+    query = db.query(*entities).filter(Rollup.outcome.in_(outcomes))
     
-    # If user_id is provided, filter by user_id through CodeSession
     if filter.user_id is not None:
-        print(f"DEBUG: Building query for {db_model.__tablename__}, user_id: {filter.user_id}")
-        
-        # Get session IDs for this user
-        user_sessions = db.query(CodeSession.session_id).filter(CodeSession.user_id == filter.user_id).all()
-        session_ids = [session[0] for session in user_sessions]
-        
-        print(f"DEBUG: Found {len(session_ids)} sessions for user {filter.user_id}: {session_ids}")
-        
-        if session_ids:
-            query = query.filter(db_model.session_id.in_(session_ids))
-        else:
-            # If no sessions found, return empty query
-            query = query.filter(db_model.session_id == "non_existent_session_id")
+        query = query.filter(Rollup.user_id == filter.user_id)
     
     if filter.language:
-        query = query.filter(db_model.language == filter.language)
+        query = query.filter(Rollup.language == filter.language)
     
     if filter.start_date:
         try:
-            start_dt = datetime.strptime(filter.start_date, '%Y-%m-%d')
-            query = query.filter(db_model.created_at >= start_dt)
+            start_day = datetime.strptime(filter.start_date, '%Y-%m-%d').date()
+            query = query.filter(Rollup.day >= start_day)
         except ValueError:
             pass  # Ignore invalid date
     
     if filter.end_date:
         try:
-            end_dt = datetime.strptime(filter.end_date, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(db_model.created_at < end_dt)
+            end_day = datetime.strptime(filter.end_date, '%Y-%m-%d').date()
+            query = query.filter(Rollup.day <= end_day)
         except ValueError:
             pass  # Ignore invalid date
     
     return query
 
+def outcome_counts(filter: AnalyticsFilter, db: Session, outcomes: list):
+    """
+    Totals per outcome overall and per user from one grouped query:
+    returns ({outcome: count}, {user_id: {outcome: count}})
+    """
+    rows = build_rollup_query(
+        filter, db, outcomes,
+        Rollup.user_id, Rollup.outcome, func.sum(Rollup.event_count).label('count')
+    ).group_by(Rollup.user_id, Rollup.outcome).all()
+    
+    totals = {outcome: 0 for outcome in outcomes}
+    by_user = {}
+    for row in rows:
+        totals[row.outcome] += int(row.count or 0)
+        user_totals = by_user.setdefault(row.user_id, {outcome: 0 for outcome in outcomes})
+        user_totals[row.outcome] += int(row.count or 0)
+    return totals, by_user
+
+def daily_outcome_counts(filter: AnalyticsFilter, db: Session, outcomes: list):
+    """
+    Per-day counts per outcome overall and per user from one grouped query:
+    returns ({outcome: {day: count}}, {user_id: {outcome: {day: count}}})
+    """
+    rows = build_rollup_query(
+        filter, db, outcomes,
+        Rollup.user_id, Rollup.outcome, Rollup.day, func.sum(Rollup.event_count).label('count')
+    ).group_by(Rollup.user_id, Rollup.outcome, Rollup.day).order_by(Rollup.day).all()
+    
+    totals = {outcome: {} for outcome in outcomes}
+    by_user = {}
+    for row in rows:
+        count = int(row.count or 0)
+        if not count:
+            continue
+        totals[row.outcome][row.day] = totals[row.outcome].get(row.day, 0) + count
+        user_days = by_user.setdefault(row.user_id, {outcome: {} for outcome in outcomes})
+        user_days[row.outcome][row.day] = user_days[row.outcome].get(row.day, 0) + count
+    return totals, by_user
+
+def get_developers(db: Session):
+    return db.query(User).filter(User.role == 'developer').all()
+
 def get_suggestions_stats(filter: AnalyticsFilter, db: Session = Depends(get_db)):
     try:
         print(f"DEBUG: Getting suggestions stats for user_id: {filter.user_id}")
         
-        # Build queries for each suggestion type
-        accepted_query = build_query(AcceptedSuggestion, filter, db)
-        rejected_query = build_query(RejectedSuggestion, filter, db)
-        modified_query = build_query(ModifiedSuggestion, filter, db)
-
-        # Get counts
-        accepted = accepted_query.count()
-        rejected = rejected_query.count()
-        modified = modified_query.count()
+        totals, by_user = outcome_counts(filter, db, ['accepted', 'rejected', 'modified'])
+        accepted = totals['accepted']
+        rejected = totals['rejected']
+        modified = totals['modified']
 
         print(f"DEBUG: Counts - Accepted: {accepted}, Rejected: {rejected}, Modified: {modified}")
 
@@ -70,24 +97,14 @@ def get_suggestions_stats(filter: AnalyticsFilter, db: Session = Depends(get_db)
         # Get per-developer stats if no user_id filter (admin view)
         developer_stats = []
         if filter.user_id is None:
-            developers = db.query(User).filter(User.role == 'developer').all()
-            for dev in developers:
-                dev_filter = AnalyticsFilter(
-                    user_id=dev.id, 
-                    language=filter.language, 
-                    start_date=filter.start_date, 
-                    end_date=filter.end_date
-                )
-                dev_accepted = build_query(AcceptedSuggestion, dev_filter, db).count()
-                dev_rejected = build_query(RejectedSuggestion, dev_filter, db).count()
-                dev_modified = build_query(ModifiedSuggestion, dev_filter, db).count()
-                
+            for dev in get_developers(db):
+                dev_totals = by_user.get(dev.id, {})
                 developer_stats.append({
                     'user_id': dev.id,
                     'username': dev.username,
-                    'accepted': dev_accepted,
-                    'rejected': dev_rejected,
-                    'modified': dev_modified
+                    'accepted': dev_totals.get('accepted', 0),
+                    'rejected': dev_totals.get('rejected', 0),
+                    'modified': dev_totals.get('modified', 0)
                 })
 
         result = {
@@ -109,13 +126,10 @@ def get_detection_accuracy(filter: AnalyticsFilter, db: Session = Depends(get_db
     try:
         print(f"DEBUG: Getting detection accuracy for user_id: {filter.user_id}")
         
-        ai_suggestion_query = build_query(AISuggestion, filter, db)
-        accepted_query = build_query(AcceptedSuggestion, filter, db)
-        modified_query = build_query(ModifiedSuggestion, filter, db)
-
-        total_suggestions = ai_suggestion_query.count()
-        accepted = accepted_query.count()
-        modified = modified_query.count()
+        totals, by_user = outcome_counts(filter, db, ['suggested', 'accepted', 'modified'])
+        total_suggestions = totals['suggested']
+        accepted = totals['accepted']
+        modified = totals['modified']
 
         print(f"DEBUG: Detection accuracy - Total: {total_suggestions}, Accepted: {accepted}, Modified: {modified}")
 
@@ -125,18 +139,10 @@ def get_detection_accuracy(filter: AnalyticsFilter, db: Session = Depends(get_db
         # Get per-developer accuracy if no user_id filter (admin view)
         developer_accuracy = []
         if filter.user_id is None:
-            developers = db.query(User).filter(User.role == 'developer').all()
-            for dev in developers:
-                dev_filter = AnalyticsFilter(
-                    user_id=dev.id, 
-                    language=filter.language, 
-                    start_date=filter.start_date, 
-                    end_date=filter.end_date
-                )
-                dev_total = build_query(AISuggestion, dev_filter, db).count()
-                dev_accepted = build_query(AcceptedSuggestion, dev_filter, db).count()
-                dev_modified = build_query(ModifiedSuggestion, dev_filter, db).count()
-                dev_relevant = dev_accepted + dev_modified
+            for dev in get_developers(db):
+                dev_totals = by_user.get(dev.id, {})
+                dev_total = dev_totals.get('suggested', 0)
+                dev_relevant = dev_totals.get('accepted', 0) + dev_totals.get('modified', 0)
                 dev_accuracy = (dev_relevant / dev_total * 100) if dev_total else 0
                 
                 developer_accuracy.append({
@@ -160,162 +166,90 @@ def get_detection_accuracy(filter: AnalyticsFilter, db: Session = Depends(get_db
 
 def get_latency_stats(filter: AnalyticsFilter, db: Session = Depends(get_db)):
     try:
-        query = build_query(SuggestionLatency, filter, db)
-        
-        # If filtering by user, join with CodeSession
-        if filter.user_id is not None:
-            query = query.join(CodeSession, CodeSession.session_id == SuggestionLatency.session_id)
-        
-        query = query.with_entities(
-            func.date(SuggestionLatency.created_at).label('date'),
-            func.avg(SuggestionLatency.latency_ms).label('latency')
-        ).group_by('date').order_by('date')
+        rows = build_rollup_query(
+            filter, db, ['latency'],
+            Rollup.user_id, Rollup.day,
+            func.sum(Rollup.latency_sum_ms).label('latency_sum'),
+            func.sum(Rollup.latency_count).label('latency_count')
+        ).group_by(Rollup.user_id, Rollup.day).order_by(Rollup.day).all()
         
-        results = query.all()
+        # Averages are sum / count so per-user rows combine exactly into the overall series
+        overall = {}
+        by_user = {}
+        for row in rows:
+            if not row.latency_count:
+                continue
+            day_sum, day_count = overall.get(row.day, (0.0, 0))
+            overall[row.day] = (day_sum + row.latency_sum, day_count + row.latency_count)
+            by_user.setdefault(row.user_id, []).append({
+                'date': str(row.day),
+                'latency': float(row.latency_sum / row.latency_count)
+            })
         
         # Get per-developer latency if no user_id filter (admin view)
         developer_latency = []
         if filter.user_id is None:
-            developers = db.query(User).filter(User.role == 'developer').all()
-            for dev in developers:
-                dev_filter = AnalyticsFilter(
-                    user_id=dev.id, 
-                    language=filter.language, 
-                    start_date=filter.start_date, 
-                    end_date=filter.end_date
-                )
-                dev_query = build_query(SuggestionLatency, dev_filter, db)
-                dev_query = dev_query.with_entities(
-                    func.date(SuggestionLatency.created_at).label('date'),
-                    func.avg(SuggestionLatency.latency_ms).label('latency')
-                ).group_by('date').order_by('date')
-                
-                dev_results = dev_query.all()
+            for dev in get_developers(db):
                 developer_latency.append({
                     'user_id': dev.id,
                     'username': dev.username,
-                    'latency': [{'date': str(item.date), 'latency': float(item.latency or 0)} for item in dev_results if item.date]
+                    'latency': by_user.get(dev.id, [])
                 })
         
         return {
-            'overall_latency': [{'date': str(item.date), 'latency': float(item.latency or 0)} for item in results if item.date],
+            'overall_latency': [{'date': str(day), 'latency': float(day_sum / day_count)} for day, (day_sum, day_count) in sorted(overall.items())],
             'developer_latency': developer_latency
         }
     except Exception as e:
         print(f"Error in get_latency_stats: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+def effectiveness_series(accepted_by_date: dict, modified_by_date: dict, total_by_date: dict) -> list:
+    """Daily (accepted + modified) / generated percentage, sorted by date"""
+    effectiveness_data = []
+    
+    # Create a combined dictionary for accepted + modified
+    combined_dict = {}
+    for date, count in accepted_by_date.items():
+        combined_dict[date] = combined_dict.get(date, 0) + count
+    for date, count in modified_by_date.items():
+        combined_dict[date] = combined_dict.get(date, 0) + count
+    
+    for date, count in combined_dict.items():
+        total = total_by_date.get(date, 0)
+        effectiveness = (count / total * 100) if total else 0
+        effectiveness_data.append({
+            'date': str(date), 
+            'effectiveness': float(effectiveness)
+        })
+    
+    # Sort by date
+    effectiveness_data.sort(key=lambda x: x['date'])
+    return effectiveness_data
+
 def get_learning_effectiveness(filter: AnalyticsFilter, db: Session = Depends(get_db)):
     try:
+        totals, by_user = daily_outcome_counts(filter, db, ['suggested', 'accepted', 'modified'])
+        
         # For single user
         if filter.user_id is not None:
-            # Get accepted and modified suggestions count by date
-            accepted_query = build_query(AcceptedSuggestion, filter, db)
-            modified_query = build_query(ModifiedSuggestion, filter, db)
-            
-            # Combine accepted and modified counts by date
-            accepted_by_date = accepted_query.with_entities(
-                func.date(AcceptedSuggestion.created_at).label('date'),
-                func.count().label('count')
-            ).group_by('date').all()
-            
-            modified_by_date = modified_query.with_entities(
-                func.date(ModifiedSuggestion.created_at).label('date'),
-                func.count().label('count')
-            ).group_by('date').all()
-            
-            # Get total suggestions by date
-            total_suggestions_query = build_query(AISuggestion, filter, db)
-            total_by_date = total_suggestions_query.with_entities(
-                func.date(AISuggestion.created_at).label('date'),
-                func.count().label('total_count')
-            ).group_by('date').all()
-            
-            # Combine the data
-            effectiveness_data = []
-            total_dict = {item.date: item.total_count for item in total_by_date}
-            
-            # Create a combined dictionary for accepted + modified
-            combined_dict = {}
-            for item in accepted_by_date:
-                combined_dict[item.date] = combined_dict.get(item.date, 0) + item.count
-            for item in modified_by_date:
-                combined_dict[item.date] = combined_dict.get(item.date, 0) + item.count
-            
-            for date, count in combined_dict.items():
-                total = total_dict.get(date, 0)
-                effectiveness = (count / total * 100) if total else 0
-                effectiveness_data.append({
-                    'date': str(date), 
-                    'effectiveness': float(effectiveness)
-                })
-            
-            # Sort by date
-            effectiveness_data.sort(key=lambda x: x['date'])
-            
             return {
-                'effectiveness': effectiveness_data,
+                'effectiveness': effectiveness_series(totals['accepted'], totals['modified'], totals['suggested']),
                 'developer_effectiveness': []
             }
         
         # For all developers (admin view)
         developer_effectiveness = []
-        developers = db.query(User).filter(User.role == 'developer').all()
-        
-        for dev in developers:
-            dev_filter = AnalyticsFilter(
-                user_id=dev.id, 
-                language=filter.language, 
-                start_date=filter.start_date, 
-                end_date=filter.end_date
-            )
-            
-            # Get accepted and modified counts for this developer
-            accepted_query = build_query(AcceptedSuggestion, dev_filter, db)
-            modified_query = build_query(ModifiedSuggestion, dev_filter, db)
-            
-            accepted_by_date = accepted_query.with_entities(
-                func.date(AcceptedSuggestion.created_at).label('date'),
-                func.count().label('count')
-            ).group_by('date').all()
-            
-            modified_by_date = modified_query.with_entities(
-                func.date(ModifiedSuggestion.created_at).label('date'),
-                func.count().label('count')
-            ).group_by('date').all()
-            
-            # Get total suggestions for this developer
-            total_suggestions_query = build_query(AISuggestion, dev_filter, db)
-            total_by_date = total_suggestions_query.with_entities(
-                func.date(AISuggestion.created_at).label('date'),
-                func.count().label('total_count')
-            ).group_by('date').all()
-            
-            # Combine data
-            effectiveness_data = []
-            total_dict = {item.date: item.total_count for item in total_by_date}
-            
-            combined_dict = {}
-            for item in accepted_by_date:
-                combined_dict[item.date] = combined_dict.get(item.date, 0) + item.count
-            for item in modified_by_date:
-                combined_dict[item.date] = combined_dict.get(item.date, 0) + item.count
-            
-            for date, count in combined_dict.items():
-                total = total_dict.get(date, 0)
-                effectiveness = (count / total * 100) if total else 0
-                effectiveness_data.append({
-                    'date': str(date), 
-                    'effectiveness': float(effectiveness)
-                })
-            
-            # Sort by date
-            effectiveness_data.sort(key=lambda x: x['date'])
-            
+        for dev in get_developers(db):
+            dev_days = by_user.get(dev.id, {})
             developer_effectiveness.append({
                 'user_id': dev.id,
                 'username': dev.username,
-                'effectiveness': effectiveness_data
+                'effectiveness': effectiveness_series(
+                    dev_days.get('accepted', {}),
+                    dev_days.get('modified', {}),
+                    dev_days.get('suggested', {})
+                )
             })
         
         return {
@@ -327,100 +261,72 @@ def get_learning_effectiveness(filter: AnalyticsFilter, db: Session = Depends(ge
         print(f"Error in get_learning_effectiveness: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-def get_trends(db_model, filter: AnalyticsFilter, db: Session):
-    query = build_query(db_model, filter, db)
-    query = query.with_entities(
-        func.date(db_model.created_at).label('date'),
-        func.count().label('count')
-    ).group_by('date').order_by('date')
-    
-    results = query.all()
-    return [{'date': str(item.date), 'count': item.count} for item in results if item.date]
+def trend_points(counts_by_day: dict) -> list:
+    return [{'date': str(day), 'count': count} for day, count in sorted(counts_by_day.items())]
 
 def get_trends_stats(filter: AnalyticsFilter, db: Session = Depends(get_db)):
     try:
-        accepted = get_trends(AcceptedSuggestion, filter, db)
-        rejected = get_trends(RejectedSuggestion, filter, db)
-        modified = get_trends(ModifiedSuggestion, filter, db)
+        totals, by_user = daily_outcome_counts(filter, db, ['accepted', 'rejected', 'modified'])
 
         # Get per-developer trends if no user_id filter (admin view)
         developer_trends = {'accepted': [], 'rejected': [], 'modified': []}
         if filter.user_id is None:
-            developers = db.query(User).filter(User.role == 'developer').all()
-            for dev in developers:
-                dev_filter = AnalyticsFilter(
-                    user_id=dev.id, 
-                    language=filter.language, 
-                    start_date=filter.start_date, 
-                    end_date=filter.end_date
-                )
-                dev_accepted = get_trends(AcceptedSuggestion, dev_filter, db)
-                dev_rejected = get_trends(RejectedSuggestion, dev_filter, db)
-                dev_modified = get_trends(ModifiedSuggestion, dev_filter, db)
-                
-                developer_trends['accepted'].append({
-                    'username': dev.username, 
-                    'data': dev_accepted
-                })
-                developer_trends['rejected'].append({
-                    'username': dev.username, 
-                    'data': dev_rejected
-                })
-                developer_trends['modified'].append({
-                    'username': dev.username, 
-                    'data': dev_modified
-                })
+            for dev in get_developers(db):
+                dev_days = by_user.get(dev.id, {})
+                for outcome in ('accepted', 'rejected', 'modified'):
+                    developer_trends[outcome].append({
+                        'username': dev.username, 
+                        'data': trend_points(dev_days.get(outcome, {}))
+                    })
 
         return {
-            'accepted': accepted,
-            'rejected': rejected,
-            'modified': modified,
+            'accepted': trend_points(totals['accepted']),
+            'rejected': trend_points(totals['rejected']),
+            'modified': trend_points(totals['modified']),
             'developer_trends': developer_trends
         }
     except Exception as e:
         print(f"Error in get_trends_stats: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+def suggested_counts_by(column, filter: AnalyticsFilter, db: Session):
+    """Generated-suggestion counts grouped by a rollup column, overall and per user"""
+    rows = build_rollup_query(
+        filter, db, ['suggested'],
+        Rollup.user_id, column.label('value'), func.sum(Rollup.event_count).label('count')
+    ).group_by(Rollup.user_id, column).all()
+    
+    overall = {}
+    by_user = {}
+    for row in rows:
+        count = int(row.count or 0)
+        if not count:
+            continue
+        overall[row.value] = overall.get(row.value, 0) + count
+        user_counts = by_user.setdefault(row.user_id, {})
+        user_counts[row.value] = user_counts.get(row.value, 0) + count
+    return overall, by_user
+
 def get_error_types(filter: AnalyticsFilter, db: Session = Depends(get_db)):
     try:
         # Overall error types by severity
-        query = build_query(AISuggestion, filter, db)
-        query = query.with_entities(
-            AISuggestion.severity,
-            func.count().label('count')
-        ).group_by(AISuggestion.severity)
-        
-        results = query.all()
+        overall, by_user = suggested_counts_by(Rollup.severity, filter, db)
         overall_error_types = [{
-            'severity': item.severity or 'Unknown', 
-            'count': item.count
-        } for item in results]
+            'severity': severity or 'Unknown', 
+            'count': count
+        } for severity, count in overall.items()]
 
         # Per-developer error types if no user_id filter (admin view)
         developer_error_types = []
         if filter.user_id is None:
-            developers = db.query(User).filter(User.role == 'developer').all()
-            for dev in developers:
-                dev_filter = AnalyticsFilter(
-                    user_id=dev.id, 
-                    language=filter.language, 
-                    start_date=filter.start_date, 
-                    end_date=filter.end_date
-                )
-                dev_query = build_query(AISuggestion, dev_filter, db)
-                dev_query = dev_query.with_entities(
-                    AISuggestion.severity,
-                    func.count().label('count')
-                ).group_by(AISuggestion.severity)
-                
-                dev_results = dev_query.all()
+            for dev in get_developers(db):
                 developer_error_types.append({
                     'user_id': dev.id,
                     'username': dev.username,
                     'error_types': [{
-                        'severity': item.severity or 'Unknown', 
-                        'count': item.count
-                    } for item in dev_results]
+                        'severity': severity or 'Unknown', 
+                        'count': count
+                    } for severity, count in by_user.get(dev.id, {}).items()]
                 })
 
         return {
@@ -433,44 +339,24 @@ def get_error_types(filter: AnalyticsFilter, db: Session = Depends(get_db)):
 
 def get_error_categories(filter: AnalyticsFilter, db: Session = Depends(get_db)):
     try:
-        # Overall error categories from AISuggestion table
-        query = build_query(AISuggestion, filter, db)
-        query = query.with_entities(
-            AISuggestion.error_category,
-            func.count().label('count')
-        ).group_by(AISuggestion.error_category)
-        
-        results = query.all()
+        # Overall error categories from generated suggestions
+        overall, by_user = suggested_counts_by(Rollup.error_category, filter, db)
         overall_error_categories = [{
-            'category': item.error_category or 'Other Issue', 
-            'count': item.count
-        } for item in results]
+            'category': category or 'Other Issue', 
+            'count': count
+        } for category, count in overall.items()]
 
         # Per-developer error categories if no user_id filter (admin view)
         developer_error_categories = []
         if filter.user_id is None:
-            developers = db.query(User).filter(User.role == 'developer').all()
-            for dev in developers:
-                dev_filter = AnalyticsFilter(
-                    user_id=dev.id, 
-                    language=filter.language, 
-                    start_date=filter.start_date, 
-                    end_date=filter.end_date
-                )
-                dev_query = build_query(AISuggestion, dev_filter, db)
-                dev_query = dev_query.with_entities(
-                    AISuggestion.error_category,
-                    func.count().label('count')
-                ).group_by(AISuggestion.error_category)
-                
-                dev_results = dev_query.all()
+            for dev in get_developers(db):
                 developer_error_categories.append({
                     'user_id': dev.id,
                     'username': dev.username,
                     'error_categories': [{
-                        'category': item.error_category or 'Other Issue', 
-                        'count': item.count
-                    } for item in dev_results]
+                        'category': category or 'Other Issue', 
+                        'count': count
+                    } for category, count in by_user.get(dev.id, {}).items()]
                 })
 
         return {
@@ -8,6 +8,12 @@ import logging
 # FastAPI App
 app = FastAPI()
 
+# Create the shared Gemini client once per worker, inside the serving event loop
+@app.on_event("startup")
+async def init_ai_client():
+    from ai_utils import init_gemini_client
+    init_gemini_client()
+
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -39,6 +45,12 @@ async def test_ai_connection():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+# LLM queue depth, wait times and rejections per priority lane
+@app.get("/debug/llm-scheduler")
+async def llm_scheduler_stats():
+    from llm_scheduler import llm_scheduler
+    return llm_scheduler.stats()
+
 # Add a root endpoint to fix 404
 @app.get("/")
 async def read_root():
@@ -0,0 +1,151 @@
+# benchmark_categorize_error.py
+"""
+Compare the Aho-Corasick classifier in error_categorizer with the old
+if/elif categorize_error: accuracy on a hand-labelled corpus, where the
+two disagree (they should not), and throughput.
+
+Usage: python benchmark_categorize_error.py [repeat] [corpus.jsonl]
+Runs offline; needs nothing from .env.
+"""
+import json
+import os
+import sys
+import time
+from collections import Counter
+from error_categorizer import categorize_error
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "error_category_corpus.jsonl")
+# Typical improved-code body, for timing on whole review blocks like parse_review_blocks sees
+SAMPLE_IMPROVED_CODE = """def load_orders(customer_id, since=None):
+    query = Order.query.filter_by(customer_id=customer_id)
+    if since is not None:
+        query = query.filter(Order.created_at >= since)
+    orders = []
+    for order in query.order_by(Order.created_at).all():
+        totals = [line.quantity * line.unit_price for line in order.lines]
+        orders.append({"id": order.id, "total": sum(totals), "items": len(totals)})
+    return orders"""
+
+def legacy_categorize_error(suggestion_text: str, language: str) -> str:
+    """The categorize_error this classifier replaced, kept for comparison"""
+    text = suggestion_text.lower()
+    
+    # Syntax errors
+    if any(keyword in text for keyword in ['syntax', 'parse', 'invalid syntax', 'unexpected token', 
+                                          'missing parenthesis', 'unclosed', 'unexpected indent',
+                                          'indentation error', 'syntax error']):
+        return 'Syntax Error'
+    
+    # Runtime errors
+    elif any(keyword in text for keyword in ['runtime', 'exception', 'error', 'crash', 'undefined',
+                                           'null reference', 'type error', 'reference error',
+                                           'range error', 'not defined', 'is not defined']):
+        return 'Runtime Error'
+    
+    # Logical errors
+    elif any(keyword in text for keyword in ['logic', 'incorrect', 'wrong result', 'unexpected behavior',
+                                           'infinite loop', 'off by one', 'wrong calculation',
+                                           'incorrect condition', 'wrong variable']):
+        return 'Logical Error'
+    
+    # Performance issues
+    elif any(keyword in text for keyword in ['performance', 'slow', 'optimize', 'efficiency', 'memory',
+                                           'time complexity', 'space complexity', 'bottleneck',
+                                           'inefficient', 'leak', 'garbage collection']):
+        return 'Performance Issue'
+    
+    # Security issues
+    elif any(keyword in text for keyword in ['security', 'vulnerability', 'injection', 'xss', 'sql injection',
+                                           'cross-site', 'authentication', 'authorization', 'encryption',
+                                           'secure', 'unsafe', 'dangerous']):
+        return 'Security Issue'
+    
+    # Code style issues
+    elif any(keyword in text for keyword in ['style', 'formatting', 'indentation', 'naming convention',
+                                           'code style', 'readability', 'consistent', 'convention',
+                                           'pep8', 'lint', 'format']):
+        return 'Code Style'
+    
+    # Best practices
+    elif any(keyword in text for keyword in ['best practice', 'clean code', 'maintainability', 'readability',
+                                           'refactor', 'duplicate code', 'dry', 'single responsibility',
+                                           'separation of concerns', 'modular']):
+        return 'Best Practice'
+    
+    # Language-specific errors
+    elif language == 'python':
+        if any(keyword in text for keyword in ['import error', 'module not found', 'name error',
+                                             'attribute error', 'key error', 'value error',
+                                             'index error', 'indentation error']):
+            return 'Python Specific Error'
+    
+    elif language == 'javascript':
+        if any(keyword in text for keyword in ['typeerror', 'referenceerror', 'syntaxerror',
+                                             'rangeerror', 'evalerror', 'urierror']):
+            return 'JavaScript Specific Error'
+    
+    elif language == 'java':
+        if any(keyword in text for keyword in ['nullpointerexception', 'arrayindexoutofboundsexception',
+                                             'classcastexception', 'illegalargumentexception',
+                                             'stackoverflowerror', 'outofmemoryerror']):
+            return 'Java Specific Error'
+    
+    # Default category
+    return 'Other Issue'
+
+def load_corpus(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def review_block(row: dict) -> str:
+    return (
+        f"- **Line(s):** 12-20\n- **Severity:** Medium\n- **Issue:** {row['text']}\n"
+        f"- **Improved Code (if applicable):** ```{row['language']}\n{SAMPLE_IMPROVED_CODE}\n```"
+    )
+
+def report_accuracy(corpus: list):
+    legacy = [legacy_categorize_error(row["text"], row["language"]) for row in corpus]
+    compiled = [categorize_error(row["text"], row["language"]) for row in corpus]
+    labels = [row["category"] for row in corpus]
+
+    total = len(corpus)
+    print(f"== accuracy ({total} labelled suggestions) ==")
+    print(f"legacy     {sum(a == b for a, b in zip(legacy, labels)) / total:6.1%}")
+    print(f"compiled   {sum(a == b for a, b in zip(compiled, labels)) / total:6.1%}")
+    print(f"agreement  {sum(a == b for a, b in zip(legacy, compiled)) / total:6.1%}")
+
+    misses = Counter(label for label, guess in zip(labels, compiled) if label != guess)
+    if misses:
+        print("compiled misses by label: " + ", ".join(f"{label} {count}" for label, count in misses.most_common()))
+
+    print("\n== disagreements (label | legacy | compiled) ==")
+    for row, old, new in zip(corpus, legacy, compiled):
+        if old != new:
+            print(f"[{row['category']} | {old} | {new}] {row['text'][:90]}")
+
+def time_it(label: str, count: int, fn):
+    start_time = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start_time
+    print(f"{label:18s} {elapsed * 1000:9.1f} ms  {count / elapsed:12.0f} texts/s")
+
+def report_throughput(corpus: list, repeat: int, shape: str):
+    rows = corpus * repeat
+    # Build the per-language automatons before timing
+    categorize_error("warm up", "")
+    for language in {row["language"] for row in corpus}:
+        categorize_error("warm up", language)
+
+    print(f"\n== throughput on {shape} ({len(rows)} texts) ==")
+    time_it("legacy", len(rows), lambda: [legacy_categorize_error(r["text"], r["language"]) for r in rows])
+    time_it("compiled", len(rows), lambda: [categorize_error(r["text"], r["language"]) for r in rows])
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    corpus = load_corpus(sys.argv[2] if len(sys.argv) > 2 else CORPUS_PATH)
+    report_accuracy(corpus)
+    report_throughput(corpus, repeat, "issue lines")
+    report_throughput([{**row, "text": review_block(row)} for row in corpus], repeat, "review blocks")
+
+if __name__ == "__main__":
+    main()
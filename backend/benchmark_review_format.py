@@ -0,0 +1,105 @@
+# benchmark_review_format.py
+"""
+Compare the markdown and structured JSON review formats on the same code:
+output tokens, end-to-end latency and how many suggestions parse cleanly.
+
+Usage: python benchmark_review_format.py [runs] [file ...]
+Needs the same .env as the server (GEMINI_API_KEY, DATABASE_URL).
+"""
+import asyncio
+import os
+import re
+import sys
+import time
+from statistics import mean, median
+from ai_utils import init_gemini_client, output_token_budget
+from suggestion_routes import build_review_prompt, parse_review_output, review_generation_config
+from git_routes import LANGUAGE_MAP
+from rejection_index import RejectionIndex
+
+SAMPLE_CODE = {
+    "python": '''import sqlite3
+
+def get_user(name):
+    conn = sqlite3.connect("users.db")
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM users WHERE name = '" + name + "'")
+    rows = cur.fetchall()
+    result = []
+    for i in range(len(rows)):
+        result.append(rows[i])
+    return result[0]
+
+def average(values):
+    total = 0
+    for v in values:
+        total = total + v
+    return total / len(values)
+''',
+    "javascript": '''function fetchAll(urls, cb) {
+  var results = [];
+  for (var i = 0; i < urls.length; i++) {
+    fetch(urls[i]).then(function (res) {
+      results.push(res.json());
+      if (results.length == urls.length) cb(results);
+    });
+  }
+}
+
+document.getElementById("out").innerHTML = location.hash.substring(1);
+''',
+}
+
+async def run_once(code: str, language: str, output_format: str) -> dict:
+    model = init_gemini_client()
+    prompt = build_review_prompt(code, language, "No prior patterns.", RejectionIndex(), output_format=output_format)
+    start_time = time.time()
+    generation_config = {**review_generation_config(output_format), "max_output_tokens": output_token_budget(prompt)}
+    response = await model.generate_content_async(prompt, generation_config=generation_config)
+    latency_ms = (time.time() - start_time) * 1000
+    text = response.text
+    parsed = parse_review_output(text, language, set(), output_format=output_format)
+    if output_format == "json":
+        severity_fallbacks = 0  # severity is schema-constrained
+    else:
+        severity_fallbacks = sum(
+            1 for item in parsed if not re.search(r'\*\*Severity:\*\*\s*(High|Medium|Low)', item["text"])
+        )
+    usage = response.usage_metadata
+    return {
+        "latency_ms": latency_ms,
+        "output_tokens": usage.candidates_token_count,
+        "prompt_tokens": usage.prompt_token_count,
+        "suggestions": len(parsed),
+        "severity_fallbacks": severity_fallbacks,
+        "finish_reason": response.candidates[0].finish_reason.name if response.candidates else "NO_CANDIDATES",
+    }
+
+def summarize(output_format: str, results: list):
+    latencies = [r["latency_ms"] for r in results]
+    tokens = [r["output_tokens"] for r in results]
+    print(f"\n== {output_format} ({len(results)} runs) ==")
+    print(f"output tokens   mean {mean(tokens):8.0f}  median {median(tokens):8.0f}")
+    print(f"latency ms      mean {mean(latencies):8.0f}  median {median(latencies):8.0f}  max {max(latencies):8.0f}")
+    print(f"ms per suggestion    {sum(latencies) / max(1, sum(r['suggestions'] for r in results)):8.0f}")
+    print(f"suggestions     mean {mean(r['suggestions'] for r in results):8.1f}")
+    print(f"severity fallbacks   {sum(r['severity_fallbacks'] for r in results)}")
+    print(f"finish reasons       {sorted(set(r['finish_reason'] for r in results))}")
+
+async def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    samples = [(code, language) for language, code in SAMPLE_CODE.items()]
+    for path in sys.argv[2:]:
+        with open(path, encoding="utf-8") as f:
+            samples.append((f.read(), LANGUAGE_MAP.get(os.path.splitext(path)[1].lower(), "javascript")))
+
+    for output_format in ("markdown", "json"):
+        results = []
+        for code, language in samples:
+            for _ in range(runs):
+                # Sequential on purpose: measure latency, not throughput
+                results.append(await run_once(code, language, output_format))
+        summarize(output_format, results)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+# benchmark_review_writes.py
+"""
+Compare the ways a repository review can store its files' rows, as the app
+issues them: one transaction per file (GIT_REVIEW_CONCURRENCY files at a
+time), and ReviewWriteQueue's groups of files_per_flush files per
+transaction, written with multi-row INSERT or with COPY. Each file brings
+its AISuggestion/SuggestionLatency/RepoFile rows and its source in
+code_blobs. The rows are committed like the app's, then deleted after
+each method.
+
+Usage: python benchmark_review_writes.py [files] [suggestions_per_file] [files_per_flush]
+Needs DATABASE_URL (from .env) pointing at a Postgres with the app's tables.
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import delete
+from database import AsyncSessionLocal, AISuggestion, SuggestionLatency, RepoFile, Repository, CodeBlob
+from review_writes import ReviewWriteBatch, ReviewWriteQueue, REVIEW_COPY_MIN_ROWS, REVIEW_FILES_PER_FLUSH
+from code_blobs import content_sha256
+from git_routes import GIT_REVIEW_CONCURRENCY
+
+SESSION_ID = "benchmark-review-writes"
+SAMPLE_SUGGESTION = (
+    "- **Line(s):** 12-20\n- **Severity:** Medium\n- **Issue:** Query runs once per order\n"
+    "- **Improved Code (if applicable):** ```python\norders = load_orders(customer_id)\n```"
+)
+SAMPLE_CONTENT = "def load_orders(customer_id):\n    return Order.query.filter_by(customer_id=customer_id).all()\n" * 20
+
+def file_source(f: int) -> str:
+    return f"# {SESSION_ID} src/module_{f}.py\n{SAMPLE_CONTENT}"
+
+def file_writes(f: int, suggestions: int, repo_id: int) -> ReviewWriteBatch:
+    """One reviewed file's rows, as git_routes and process_code_for_review collect them"""
+    now = datetime.utcnow()
+    file_path = f"src/module_{f}.py"
+    writes = ReviewWriteBatch()
+    writes.add(
+        RepoFile, repo_id=repo_id, session_id=SESSION_ID, file_path=file_path,
+        content_sha256=writes.add_code(file_source(f)), language="python", created_at=now
+    )
+    writes.add(SuggestionLatency, session_id=SESSION_ID, latency_ms=1500.0, created_at=now)
+    writes.extend(AISuggestion, [{
+        "session_id": SESSION_ID, "suggestion_id": s + 1, "suggestion_text": SAMPLE_SUGGESTION,
+        "severity": "Medium", "error_category": "Performance Issue", "line_start": 12, "line_end": 20,
+        "improved_code": "orders = load_orders(customer_id)", "language": "python",
+        "file_path": file_path, "created_at": now
+    } for s in range(suggestions)])
+    return writes
+
+async def write_per_file(batches: list):
+    semaphore = asyncio.Semaphore(GIT_REVIEW_CONCURRENCY)
+
+    async def write_one(writes: ReviewWriteBatch):
+        async with semaphore, AsyncSessionLocal() as db:
+            await writes.flush(db)
+            await db.commit()
+
+    await asyncio.gather(*(write_one(writes) for writes in batches))
+
+async def write_grouped(batches: list, files_per_flush: int, copy_min_rows: int):
+    async def stage(db):
+        pass
+
+    queue = ReviewWriteQueue(AsyncSessionLocal, files_per_flush=files_per_flush, copy_min_rows=copy_min_rows)
+    for f, writes in enumerate(batches):
+        queue.add(f"src/module_{f}.py", writes, stage)
+    await queue.close()
+    if queue.failed:
+        raise RuntimeError(next(iter(queue.failed.values())))
+
+async def clean_up(files: int):
+    async with AsyncSessionLocal() as db:
+        for model in (AISuggestion, SuggestionLatency, RepoFile):
+            await db.execute(delete(model).where(model.session_id == SESSION_ID))
+        await db.execute(delete(CodeBlob).where(CodeBlob.sha256.in_([content_sha256(file_source(f)) for f in range(files)])))
+        await db.commit()
+
+async def time_method(label: str, files: int, suggestions: int, repo_id: int, write):
+    batches = [file_writes(f, suggestions, repo_id) for f in range(files)]
+    count = sum(len(writes) for writes in batches)
+    start_time = time.perf_counter()
+    await write(batches)
+    elapsed = time.perf_counter() - start_time
+    await clean_up(files)
+    print(f"{label:28s} {elapsed * 1000:9.1f} ms  {count / elapsed:10.0f} rows/s")
+
+async def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    suggestions = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    files_per_flush = int(sys.argv[3]) if len(sys.argv) > 3 else REVIEW_FILES_PER_FLUSH
+    no_copy = files * (suggestions + 2) + 1
+
+    # RepoFile rows need a repository; it is deleted at the end
+    async with AsyncSessionLocal() as db:
+        repository = Repository(repo_url=f"https://github.com/{SESSION_ID}", repo_name=SESSION_ID)
+        db.add(repository)
+        await db.commit()
+        repo_id = repository.id
+
+    print(f"== {files} files x {suggestions} suggestions, groups of {files_per_flush} files ==")
+    try:
+        # One warm-up round so connection setup and statement preparation aren't timed
+        await time_method("warm up", files, suggestions, repo_id, write_per_file)
+        await time_method("one transaction per file", files, suggestions, repo_id, write_per_file)
+        await time_method("grouped multi-row insert", files, suggestions, repo_id,
+                          lambda batches: write_grouped(batches, files_per_flush, no_copy))
+        await time_method(f"grouped, copy >= {REVIEW_COPY_MIN_ROWS} rows", files, suggestions, repo_id,
+                          lambda batches: write_grouped(batches, files_per_flush, REVIEW_COPY_MIN_ROWS))
+    finally:
+        await clean_up(files)
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Repository).where(Repository.id == repo_id))
+            await db.commit()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+# blob_reviews.py
+import asyncio
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import BlobReview, CodeBlob
+from code_blobs import code_blob_row, decompress_code
+from review_writes import store_code_blobs
+
+# Prompt context of shared reviews: no single user's feedback may shape a review every user reuses
+BLOB_REVIEW_CONTEXT = "No prior feedback available."
+# Rows kept in blob_reviews; reviews of other prompt versions and the oldest
+# beyond this are pruned every BLOB_REVIEW_PRUNE_EVERY stores per worker
+BLOB_REVIEW_MAX_ROWS = int(os.getenv("BLOB_REVIEW_MAX_ROWS", "100000"))
+BLOB_REVIEW_PRUNE_EVERY = int(os.getenv("BLOB_REVIEW_PRUNE_EVERY", "500"))
+
+class BlobReviewStore:
+    """
+    Base reviews of repository files keyed by (git blob SHA, language, prompt
+    version), shared by all users. A blob's content never changes, so stored
+    reviews don't expire; the file content is kept in code_blobs so a hit
+    needs neither an LLM call nor a GitHub fetch.
+    """
+
+    def __init__(self, max_rows: int):
+        self.max_rows = max_rows
+        self.counters = {"hits": 0, "misses": 0, "reviews": 0, "joined": 0, "stores": 0, "pruned": 0}
+        self._inflight = {}  # (blob_sha, language, prompt_version) -> Future with the suggestions
+        self._stores_since_prune = 0
+
+    async def load_many(self, db: AsyncSession, blobs: list, prompt_version: str) -> dict:
+        """
+        Stored reviews of [(blob_sha, language)] in one query:
+        {(blob_sha, language): {"suggestions", "code"}} for the hits
+        """
+        wanted = set(blobs)
+        if not wanted:
+            return {}
+        result = await db.execute(
+            select(BlobReview.blob_sha, BlobReview.language, BlobReview.suggestions, CodeBlob.data)
+            .join(CodeBlob, CodeBlob.sha256 == BlobReview.content_sha256)
+            .where(BlobReview.blob_sha.in_({blob_sha for blob_sha, _ in wanted}), BlobReview.prompt_version == prompt_version)
+        )
+        found = {
+            (row.blob_sha, row.language): {"suggestions": row.suggestions, "code": decompress_code(row.data)}
+            for row in result.all()
+            if (row.blob_sha, row.language) in wanted
+        }
+        self.counters["hits"] += len(found)
+        self.counters["misses"] += len(wanted) - len(found)
+        return found
+
+    async def get(self, db: AsyncSession, blob_sha: str, language: str, prompt_version: str) -> Optional[list]:
+        result = await db.execute(
+            select(BlobReview.suggestions).where(
+                BlobReview.blob_sha == blob_sha,
+                BlobReview.language == language,
+                BlobReview.prompt_version == prompt_version
+            )
+        )
+        return result.scalars().first()
+
+    async def put(self, db: AsyncSession, blob_sha: str, language: str, prompt_version: str, code: str, suggestions: list):
+        """Stage the review and its file content (plus a periodic prune); the caller commits"""
+        blob = code_blob_row(code)
+        await store_code_blobs(db, [blob])
+        # The first review stored for a blob is the one everyone gets
+        await db.execute(
+            pg_insert(BlobReview).values(
+                blob_sha=blob_sha,
+                language=language,
+                prompt_version=prompt_version,
+                content_sha256=blob["sha256"],
+                suggestions=suggestions,
+                created_at=datetime.utcnow()
+            ).on_conflict_do_nothing(index_elements=[BlobReview.blob_sha, BlobReview.language, BlobReview.prompt_version])
+        )
+        self.counters["stores"] += 1
+        self._stores_since_prune += 1
+        if self._stores_since_prune >= BLOB_REVIEW_PRUNE_EVERY:
+            self._stores_since_prune = 0
+            await self.prune(db, prompt_version)
+
+    async def prune(self, db: AsyncSession, prompt_version: str):
+        """Delete reviews made with other prompt versions and everything beyond the newest max_rows"""
+        outdated = await db.execute(delete(BlobReview).where(BlobReview.prompt_version != prompt_version))
+        overflow = (
+            select(BlobReview.created_at)
+            .order_by(BlobReview.created_at.desc())
+            .offset(self.max_rows)
+            .limit(1)
+            .scalar_subquery()
+        )
+        evicted = await db.execute(delete(BlobReview).where(BlobReview.created_at <= overflow))
+        self.counters["pruned"] += outdated.rowcount + evicted.rowcount
+
+    async def get_or_review(self, db: AsyncSession, blob_sha: str, language: str, prompt_version: str, code: str,
+                            review: Callable[[], Awaitable[list]]) -> list:
+        """
+        Stored review of the blob, else the result of review(), stored for
+        everyone after it. The same blob already being reviewed in this
+        worker (a file copied across paths, or two users at once) is awaited
+        instead of reviewed again. The caller commits the stored row.
+        """
+        key = (blob_sha, language, prompt_version)
+        while key in self._inflight:
+            pending = self._inflight[key]
+            self.counters["joined"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only retry when the review we joined was cancelled, not this request
+                if not pending.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            suggestions = await self.get(db, blob_sha, language, prompt_version)
+            if suggestions is None:
+                self.counters["reviews"] += 1
+                suggestions = await review()
+                await self.put(db, blob_sha, language, prompt_version, code, suggestions)
+            future.set_result(suggestions)
+            return suggestions
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; don't warn when there were none
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {**self.counters, "inflight": len(self._inflight), "max_rows": self.max_rows}
+
+blob_reviews = BlobReviewStore(BLOB_REVIEW_MAX_ROWS)
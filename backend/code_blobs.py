@@ -0,0 +1,25 @@
+# code_blobs.py
+import hashlib
+import os
+import zstandard
+
+# zstd level for stored source; source compresses well and is written once per distinct content
+CODE_BLOB_ZSTD_LEVEL = int(os.getenv("CODE_BLOB_ZSTD_LEVEL", "10"))
+
+def content_sha256(text: str) -> str:
+    """Key of a source text in code_blobs: SHA-256 of its exact UTF-8 bytes"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def compress_code(text: str) -> bytes:
+    return zstandard.ZstdCompressor(level=CODE_BLOB_ZSTD_LEVEL).compress(text.encode("utf-8"))
+
+def decompress_code(data: bytes) -> str:
+    return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+
+def code_blob_row(text: str) -> dict:
+    """code_blobs row for a source text"""
+    return {
+        "sha256": content_sha256(text),
+        "data": compress_code(text),
+        "size": len(text.encode("utf-8"))
+    }
@@ -0,0 +1,156 @@
+# code_chunker.py
+import ast
+import os
+
+# Files longer than this are split; chunks are packed up to this many lines
+CODE_CHUNK_MAX_LINES = int(os.getenv("CODE_CHUNK_MAX_LINES", "300"))
+
+BRACE_LANGUAGES = {'javascript', 'java', 'cpp', 'go', 'rust', 'csharp', 'php'}
+# Lines that belong to the declaration below them
+LEADING_PREFIXES = ("#", "//", "/*", "*", "@", "///")
+MAX_SPLIT_LEVEL = 3
+
+def python_depths(code: str, line_count: int) -> list:
+    """
+    Nesting level of each line that starts a statement (decorators included),
+    None elsewhere. Raises SyntaxError for code ast can't parse.
+    """
+    depths = [None] * line_count
+    tree = ast.parse(code)
+
+    def visit(body: list, level: int):
+        for node in body:
+            decorators = getattr(node, "decorator_list", [])
+            start = min([node.lineno] + [d.lineno for d in decorators]) - 1
+            if start < line_count and depths[start] is None:
+                depths[start] = level
+            for field in ("body", "orelse", "finalbody", "handlers"):
+                children = getattr(node, field, None)
+                if isinstance(children, list) and children and isinstance(children[0], (ast.stmt, ast.excepthandler)):
+                    visit(children, level + 1)
+
+    visit(tree.body, 0)
+    return depths
+
+def brace_depths(lines: list, language: str) -> list:
+    """
+    Brace nesting level at the start of each line, skipping strings and
+    comments. Blank lines and lines that open with a closer get None.
+    """
+    line_comments = ("//", "#") if language == "php" else ("//",)
+    depths = []
+    depth = 0
+    quote = None
+    in_block_comment = False
+    for line in lines:
+        stripped = line.strip()
+        starts_unit = stripped and not stripped.startswith(("}", ")", "]")) and quote is None and not in_block_comment
+        depths.append(depth if starts_unit else None)
+
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if in_block_comment:
+                if line.startswith("*/", i):
+                    in_block_comment = False
+                    i += 1
+            elif quote:
+                if ch == "\\":
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif line.startswith("/*", i):
+                in_block_comment = True
+                i += 1
+            elif line.startswith(line_comments, i):
+                break
+            elif ch == "'" and language == "rust":
+                # Rust lifetimes ('a) are not char literals
+                if line[i + 1:i + 2] == "\\" or line[i + 2:i + 3] == "'":
+                    quote = ch
+            elif ch in "\"'`":
+                quote = ch
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth = max(0, depth - 1)
+            i += 1
+        # Only template literals / raw strings span lines
+        if quote and quote != "`":
+            quote = None
+    return depths
+
+def indent_depths(lines: list) -> list:
+    """Indentation level of each non-blank line, for code that doesn't parse"""
+    depths = []
+    for line in lines:
+        if not line.strip():
+            depths.append(None)
+            continue
+        indent = len(line.expandtabs(4)) - len(line.expandtabs(4).lstrip())
+        depths.append(indent // 4)
+    return depths
+
+def line_depths(code: str, lines: list, language: str) -> list:
+    language = language.lower()
+    if language in BRACE_LANGUAGES:
+        return brace_depths(lines, language)
+    if language == "python":
+        try:
+            return python_depths(code, len(lines))
+        except SyntaxError:
+            pass
+    return indent_depths(lines)
+
+def attach_leading_lines(lines: list, boundary: int, lower: int) -> int:
+    """Move a boundary up over the comments/decorators/annotations directly above it"""
+    while boundary - 1 >= lower and lines[boundary - 1].strip().startswith(LEADING_PREFIXES):
+        boundary -= 1
+    return boundary
+
+def split_range(lines: list, depths: list, start: int, end: int, level: int, max_lines: int) -> list:
+    """Split [start, end) into units no longer than max_lines, preferring boundaries at `level`"""
+    if end - start <= max_lines:
+        return [(start, end)]
+    if level > MAX_SPLIT_LEVEL:
+        return [(i, min(i + max_lines, end)) for i in range(start, end, max_lines)]
+
+    boundaries = []
+    for i in range(start + 1, end):
+        if depths[i] == level:
+            boundary = attach_leading_lines(lines, i, boundaries[-1] if boundaries else start + 1)
+            if boundary not in boundaries:
+                boundaries.append(boundary)
+
+    units = []
+    edges = [start] + boundaries + [end]
+    for unit_start, unit_end in zip(edges, edges[1:]):
+        units.extend(split_range(lines, depths, unit_start, unit_end, level + 1, max_lines))
+    return units
+
+def split_code(code: str, language: str, max_lines: int = CODE_CHUNK_MAX_LINES) -> list:
+    """
+    Split source into chunks of at most max_lines on top-level function/class
+    boundaries (nested members for oversized units, hard cuts as last resort).
+    Returns [{"start_line", "end_line", "code"}] with 1-based inclusive lines.
+    """
+    lines = code.split("\n")
+    if len(lines) <= max_lines:
+        return [{"start_line": 1, "end_line": len(lines), "code": code}]
+
+    depths = line_depths(code, lines, language)
+    units = split_range(lines, depths, 0, len(lines), 0, max_lines)
+
+    # Pack neighbouring units back together up to the size limit
+    packed = []
+    for unit_start, unit_end in units:
+        if packed and unit_end - packed[-1][0] <= max_lines:
+            packed[-1] = (packed[-1][0], unit_end)
+        else:
+            packed.append((unit_start, unit_end))
+
+    return [
+        {"start_line": start + 1, "end_line": end, "code": "\n".join(lines[start:end])}
+        for start, end in packed
+        if "\n".join(lines[start:end]).strip()
+    ]
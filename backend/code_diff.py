@@ -0,0 +1,47 @@
+# code_diff.py
+import difflib
+
+def diff_code(old_code: str, new_code: str) -> tuple[dict, list]:
+    """
+    Line-level diff of two versions of a file. Returns (line_map, changed):
+    line_map maps each unchanged old line number to its new line number,
+    changed lists the new-file (start, end) line ranges that were inserted
+    or replaced. A pure deletion is marked on the line where it happened.
+    Line numbers are 1-based and ranges inclusive.
+    """
+    old_lines = old_code.split("\n")
+    new_lines = new_code.split("\n")
+    # autojunk would treat blank lines and braces as noise in large files
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+
+    line_map = {}
+    changed = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                line_map[i1 + k + 1] = j1 + k + 1
+        elif j2 > j1:
+            changed.append((j1 + 1, j2))
+        else:
+            point = min(max(j1, 1), len(new_lines))
+            changed.append((point, point))
+    return line_map, changed
+
+def overlaps(start: int, end: int, ranges: list) -> bool:
+    return any(start <= range_end and range_start <= end for range_start, range_end in ranges)
+
+def review_windows(changed: list, total_lines: int, context_lines: int) -> list:
+    """
+    Widen each changed range by context_lines on both sides and merge the
+    ones that touch. Returns [(start, end, changed ranges inside)].
+    """
+    windows = []
+    for start, end in sorted(changed):
+        window_start = max(1, start - context_lines)
+        window_end = min(total_lines, end + context_lines)
+        if windows and window_start <= windows[-1][1] + 1:
+            previous_start, previous_end, inside = windows[-1]
+            windows[-1] = (previous_start, max(previous_end, window_end), inside + [(start, end)])
+        else:
+            windows.append((window_start, window_end, [(start, end)]))
+    return windows
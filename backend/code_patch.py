@@ -0,0 +1,115 @@
+# code_patch.py
+import difflib
+import os
+import re
+
+# How far (in lines) a hunk may sit from the suggestion's Line(s) and still be applied
+PATCH_SEARCH_LINES = int(os.getenv("PATCH_SEARCH_LINES", "5"))
+# Below this similarity between replaced lines and improved code the patch is
+# considered a guess and the LLM applies the suggestion instead
+PATCH_MIN_SIMILARITY = float(os.getenv("PATCH_MIN_SIMILARITY", "0.5"))
+
+LINE_FIELD = re.compile(r'\*\*Line\(s\):\*\*([^\n]*)')
+IMPROVED_CODE = re.compile(r'\*\*Improved Code[^\n]*?\*\*\s*```[^\n]*\n(.*?)\n?\s*```', re.DOTALL)
+
+def parse_suggestion_patch(suggestion_text: str) -> tuple[int, int, list] | None:
+    """
+    (start, end, improved code lines) from a suggestion's Line(s) and
+    Improved Code fields, None for general suggestions or ones without code
+    """
+    line_match = LINE_FIELD.search(suggestion_text)
+    code_match = IMPROVED_CODE.search(suggestion_text)
+    if not line_match or not code_match or not code_match.group(1).strip():
+        return None
+    numbers = [int(n) for n in re.findall(r'\d+', line_match.group(1))]
+    if not numbers or min(numbers) < 1:
+        return None
+    return min(numbers), max(numbers), code_match.group(1).split("\n")
+
+def leading_indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+def reindent(snippet: list, region: list) -> list:
+    """Shift the snippet so its base indentation matches the lines it replaces"""
+    targets = [leading_indent(line) for line in region if line.strip()]
+    indents = [leading_indent(line) for line in snippet if line.strip()]
+    if not targets or not indents:
+        return snippet
+    target, base = min(targets, key=len), min(indents, key=len)
+    if base == target:
+        return snippet
+    return [target + line[len(base):] if line.strip() else "" for line in snippet]
+
+def normalized(lines: list) -> list:
+    return [" ".join(line.split()) for line in lines]
+
+def hunk_region(plain_lines: list, plain_snippet: list, start: int, end: int) -> tuple[int, int]:
+    """
+    0-based [first, last) lines the snippet replaces when its Line(s) are
+    start-end: the range itself, widened over unchanged lines the snippet
+    repeats as context before and after it (e.g. a whole function quoted
+    for a one-line fix). Takes whitespace-normalized lines.
+    """
+    first, last = start - 1, end
+    lead = 0
+    for k in range(min(len(plain_snippet), first), 0, -1):
+        if plain_snippet[:k] == plain_lines[first - k:first]:
+            lead = k
+            break
+    trail = 0
+    for k in range(min(len(plain_snippet) - lead, len(plain_lines) - last), 0, -1):
+        if plain_snippet[-k:] == plain_lines[last:last + k]:
+            trail = k
+            break
+    return first - lead, last + trail
+
+def region_similarity(plain_region: list, plain_snippet: list) -> float:
+    return difflib.SequenceMatcher(None, "\n".join(plain_region), "\n".join(plain_snippet), autojunk=False).ratio()
+
+def apply_suggestion_patch(code: str, suggestion_text: str) -> str | None:
+    """apply_patch with the Line(s) and Improved Code fields of a suggestion's text"""
+    patch = parse_suggestion_patch(suggestion_text)
+    if patch is None:
+        return None
+    start, end, snippet = patch
+    return apply_patch(code, start, end, "\n".join(snippet))
+
+def apply_patch(code: str, start: int, end: int, improved_code: str) -> str | None:
+    """
+    Apply a suggestion's improved code to its lines start-end, without an
+    LLM call. Line numbers may be off by up to PATCH_SEARCH_LINES; the
+    position whose lines best resemble the improved code wins. Returns None
+    when there is no code or range, the code is shorter than its line range,
+    or no position is similar enough.
+    """
+    if start < 1 or end < start or not improved_code.strip():
+        return None
+    snippet = improved_code.strip("\n").split("\n")
+
+    newline = "\r\n" if "\r\n" in code else "\n"
+    lines = code.split(newline)
+    if start > len(lines):
+        return None
+    end = min(end, len(lines))
+    # A snippet shorter than its range may be a rewrite of all of it or a fix to
+    # part of it; only the LLM can tell, so such suggestions are left to it
+    if len(snippet) < end - start + 1:
+        return None
+
+    plain_lines, plain_snippet = normalized(lines), normalized(snippet)
+    best = None
+    # Stated position first, then alternately further above and below; the
+    # whole stated range is always replaced, widened only by matched context
+    for offset in sorted(range(-PATCH_SEARCH_LINES, PATCH_SEARCH_LINES + 1), key=abs):
+        if start + offset < 1 or end + offset > len(lines):
+            continue
+        first, last = hunk_region(plain_lines, plain_snippet, start + offset, end + offset)
+        score = region_similarity(plain_lines[first:last], plain_snippet)
+        if best is None or score > best[0]:
+            best = (score, first, last)
+
+    if best is None or best[0] < PATCH_MIN_SIMILARITY:
+        return None
+    _, first, last = best
+    patched = lines[:first] + reindent(snippet, lines[first:last]) + lines[last:]
+    return newline.join(patched)
@@ -1,5 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float, func, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, Date, DateTime, Boolean, Float, LargeBinary, func, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 from typing import List, Optional
@@ -26,6 +28,35 @@ engine = create_engine(
     connect_args=connect_args
 )
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+def make_async_database_url(url: str):
+    """
+    Same database through asyncpg. asyncpg does not understand libpq's
+    sslmode query parameter, so it is moved into connect_args instead.
+    Behind Supabase's pooler (pgbouncer in transaction mode) consecutive
+    statements can run on different server connections, so asyncpg's
+    prepared statement cache is turned off there.
+    """
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+    sslmode = async_url.query.get("sslmode")
+    async_url = async_url.difference_update_query(["sslmode"])
+    async_connect_args = {"ssl": sslmode or "require"} if sslmode or "supabase" in url else {}
+    if "supabase" in url:
+        async_connect_args["statement_cache_size"] = 0
+    return async_url, async_connect_args
+
+# Async engine for async def handlers, so DB round trips don't block the event loop
+ASYNC_DATABASE_URL, async_connect_args = make_async_database_url(DATABASE_URL)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=5,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    connect_args=async_connect_args
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Database Models
@@ -47,13 +78,22 @@ class Repository(Base):
     repo_name = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class CodeBlob(Base):
+    """Source text stored once per distinct content, zstd-compressed"""
+    __tablename__ = "code_blobs"
+    sha256 = Column(String(64), primary_key=True)  # content_sha256 of the source
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)  # Uncompressed bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class RepoFile(Base):
     __tablename__ = "repo_files"
     id = Column(Integer, primary_key=True, index=True)
     repo_id = Column(Integer, ForeignKey("repositories.id"), nullable=False)
     session_id = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
-    content = Column(Text, nullable=False)
+    content_sha256 = Column(String(64), nullable=True, index=True)  # File content in code_blobs
+    legacy_content = Column("content", Text, nullable=True)  # Inline content of rows migrate_code_blobs.py hasn't moved yet
     language = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -61,25 +101,37 @@ class CodeSession(Base):
     __tablename__ = "code_sessions"
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, unique=True, index=True, nullable=False)
-    user_id = Column(Integer, nullable=True)  # Optional if user is logged in
+    user_id = Column(Integer, nullable=True, index=True)  # Optional if user is logged in
     created_at = Column(DateTime, default=datetime.utcnow)
     language = Column(String)
-    code = Column(Text)
+    code_sha256 = Column(String(64), nullable=True, index=True)  # Submitted code in code_blobs
+    legacy_code = Column("code", Text, nullable=True)  # Inline code of rows migrate_code_blobs.py hasn't moved yet
 
 class AISuggestion(Base):
     __tablename__ = "ai_suggestions"
+    __table_args__ = (
+        Index("ix_ai_suggestions_session_created", "session_id", "created_at"),
+        Index("ix_ai_suggestions_language_created", "language", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, nullable=False)
     suggestion_id = Column(Integer)
     suggestion_text = Column(Text)
     severity = Column(String)  # New column for severity (High, Medium, Low)
     error_category = Column(String)  # New column for error category
+    line_start = Column(Integer, nullable=True)  # Affected line range, null for general suggestions
+    line_end = Column(Integer, nullable=True)
+    improved_code = Column(Text, nullable=True)  # Suggested replacement snippet, if any
     language = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
     file_path = Column(String, nullable=True)  # New column to track file path for repo files
 
 class AcceptedSuggestion(Base):
     __tablename__ = "accepted_suggestions"
+    __table_args__ = (
+        Index("ix_accepted_suggestions_session_created", "session_id", "created_at"),
+        Index("ix_accepted_suggestions_language_created", "language", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, nullable=False)
     suggestion_id = Column(Integer)
@@ -92,6 +144,10 @@ class AcceptedSuggestion(Base):
 
 class RejectedSuggestion(Base):
     __tablename__ = "rejected_suggestions"
+    __table_args__ = (
+        Index("ix_rejected_suggestions_session_created", "session_id", "created_at"),
+        Index("ix_rejected_suggestions_language_created", "language", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, nullable=False)
     suggestion_id = Column(Integer)
@@ -104,6 +160,10 @@ class RejectedSuggestion(Base):
 
 class ModifiedSuggestion(Base):
     __tablename__ = "modified_suggestions"
+    __table_args__ = (
+        Index("ix_modified_suggestions_session_created", "session_id", "created_at"),
+        Index("ix_modified_suggestions_language_created", "language", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, nullable=False)
     suggestion_id = Column(Integer)
@@ -125,17 +185,110 @@ class UserPattern(Base):
 
 class SuggestionLatency(Base):
     __tablename__ = "suggestion_latency"
+    __table_args__ = (
+        Index("ix_suggestion_latency_session_created", "session_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, nullable=False)
     latency_ms = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class ReviewCacheEntry(Base):
+    __tablename__ = "review_cache"
+    cache_key = Column(String(64), primary_key=True)  # SHA-256 of code, language, prompt version and user context
+    language = Column(String)
+    suggestions = Column(JSONB, nullable=False)  # Parsed suggestions as returned to the client
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class BlobReview(Base):
+    """Base review of a repository file, shared by everyone who reviews the same git blob"""
+    __tablename__ = "blob_reviews"
+    blob_sha = Column(String(64), primary_key=True)  # git blob SHA from the repository tree
+    language = Column(String, primary_key=True)
+    prompt_version = Column(String, primary_key=True)
+    content_sha256 = Column(String(64), nullable=False)  # File content in code_blobs
+    suggestions = Column(JSONB, nullable=False)  # Parsed suggestions before per-user rejection filtering
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class FollowupCacheEntry(Base):
+    """Memoized accept/modify follow-up LLM output, shared by all workers"""
+    __tablename__ = "followup_cache"
+    cache_key = Column(String(64), primary_key=True)  # SHA-256 of the follow-up kind and its prompt inputs
+    kind = Column(String, nullable=False)  # 'accept' or 'modify'
+    language = Column(String)
+    output = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class FollowupJob(Base):
+    """Background follow-up generation (modify follow-ups, accepts a patch can't apply), polled by the client"""
+    __tablename__ = "followup_jobs"
+    job_id = Column(String(32), primary_key=True)
+    kind = Column(String, nullable=False)  # 'modify' or 'accept'
+    session_id = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, running, done, failed
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ReviewSnapshot(Base):
+    """Last reviewed code and suggestions per session and file, the baseline for incremental re-review"""
+    __tablename__ = "review_snapshots"
+    __table_args__ = (
+        UniqueConstraint("session_id", "file_path", name="uq_review_snapshots_session_file"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, nullable=False)
+    file_path = Column(String, nullable=False, default="")  # '' for the editor
+    language = Column(String)
+    code_sha256 = Column(String(64), nullable=False)  # Reviewed code in code_blobs
+    suggestions = Column(JSONB, nullable=False)  # Parsed suggestions of that review
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class PreferenceProfile(Base):
+    """Running feedback counters and recent examples per 'user:<id>' or 'session:<id>' scope"""
+    __tablename__ = "preference_profiles"
+    scope = Column(String, primary_key=True)
+    counters = Column(JSONB, nullable=False)  # {error_category: {"accepted": n, "rejected": n, "modified": n}}
+    examples = Column(JSONB, nullable=False)  # {"accepted": [...], "rejected": [...], "modified": [...]}, newest first
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalyticsDailyRollup(Base):
+    """
+    Pre-aggregated analytics counters, one row per
+    (day, user_id, language, error_category, severity, outcome).
+    Key columns use 0 / '' instead of NULL so upserts always hit the unique key.
+    """
+    __tablename__ = "analytics_daily_rollup"
+    __table_args__ = (
+        UniqueConstraint("day", "user_id", "language", "error_category", "severity", "outcome", name="uq_analytics_daily_rollup_key"),
+        Index("ix_analytics_daily_rollup_outcome_day", "outcome", "day"),
+        Index("ix_analytics_daily_rollup_user_day", "user_id", "day"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    user_id = Column(Integer, nullable=False, default=0)  # 0 when the session has no user
+    language = Column(String, nullable=False, default="")
+    error_category = Column(String, nullable=False, default="")
+    severity = Column(String, nullable=False, default="")
+    outcome = Column(String, nullable=False)  # 'suggested', 'accepted', 'rejected', 'modified', 'latency'
+    event_count = Column(Integer, nullable=False, default=0)
+    latency_sum_ms = Column(Float, nullable=False, default=0)
+    latency_count = Column(Integer, nullable=False, default=0)
+
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# create_all doesn't change tables that already exist: columns added to them since are
+# created by migrate_columns.py, their indexes by migrate_indexes.py
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
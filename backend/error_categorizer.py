@@ -0,0 +1,76 @@
+# error_categorizer.py
+from functools import lru_cache
+import ahocorasick
+
+# Keywords per category; dict order is the priority (same order the old if/elif chain used)
+CATEGORY_KEYWORDS = {
+    'Syntax Error': ['syntax', 'parse', 'invalid syntax', 'unexpected token', 'missing parenthesis', 'unclosed',
+                     'unexpected indent', 'indentation error', 'syntax error'],
+    'Runtime Error': ['runtime', 'exception', 'error', 'crash', 'undefined', 'null reference', 'type error',
+                      'reference error', 'range error', 'not defined', 'is not defined'],
+    'Logical Error': ['logic', 'incorrect', 'wrong result', 'unexpected behavior', 'infinite loop', 'off by one',
+                      'wrong calculation', 'incorrect condition', 'wrong variable'],
+    'Performance Issue': ['performance', 'slow', 'optimize', 'efficiency', 'memory', 'time complexity',
+                          'space complexity', 'bottleneck', 'inefficient', 'leak', 'garbage collection'],
+    'Security Issue': ['security', 'vulnerability', 'injection', 'xss', 'sql injection', 'cross-site',
+                       'authentication', 'authorization', 'encryption', 'secure', 'unsafe', 'dangerous'],
+    'Code Style': ['style', 'formatting', 'indentation', 'naming convention', 'code style', 'readability',
+                   'consistent', 'convention', 'pep8', 'lint', 'format'],
+    'Best Practice': ['best practice', 'clean code', 'maintainability', 'readability', 'refactor', 'duplicate code',
+                      'dry', 'single responsibility', 'separation of concerns', 'modular'],
+}
+
+LANGUAGE_KEYWORDS = {
+    'python': ('Python Specific Error', ['import error', 'module not found', 'name error', 'attribute error',
+                                         'key error', 'value error', 'index error', 'indentation error']),
+    'javascript': ('JavaScript Specific Error', ['typeerror', 'referenceerror', 'syntaxerror', 'rangeerror',
+                                                 'evalerror', 'urierror']),
+    'java': ('Java Specific Error', ['nullpointerexception', 'arrayindexoutofboundsexception', 'classcastexception',
+                                     'illegalargumentexception', 'stackoverflowerror', 'outofmemoryerror']),
+}
+
+DEFAULT_CATEGORY = 'Other Issue'
+
+@lru_cache(maxsize=None)
+def compiled_matcher(language: str) -> tuple:
+    """
+    Aho-Corasick automaton over every keyword that applies to a language,
+    each keyword mapped to its category's rank: the category's position in
+    the old if/elif chain, language categories last. Returns (automaton,
+    categories by rank).
+    """
+    categories = list(CATEGORY_KEYWORDS)
+    keyword_ranks = {}
+    for rank, category in enumerate(categories):
+        for keyword in CATEGORY_KEYWORDS[category]:
+            keyword_ranks.setdefault(keyword, rank)
+    if language in LANGUAGE_KEYWORDS:
+        category, keywords = LANGUAGE_KEYWORDS[language]
+        categories.append(category)
+        for keyword in keywords:
+            keyword_ranks.setdefault(keyword, len(categories) - 1)
+
+    automaton = ahocorasick.Automaton()
+    for keyword, rank in keyword_ranks.items():
+        automaton.add_word(keyword, rank)
+    automaton.make_automaton()
+    return automaton, categories
+
+def categorize_error(suggestion_text: str, language: str) -> str:
+    """
+    Categorize the error type based on suggestion text and language: the
+    first category of the old if/elif chain with a keyword anywhere in the
+    text, found in one pass instead of a substring check per keyword
+    """
+    automaton, categories = compiled_matcher((language or "").lower())
+    best = len(categories)
+    for _, rank in automaton.iter(suggestion_text.lower()):
+        if rank < best:
+            best = rank
+            if best == 0:
+                break
+    return categories[best] if best < len(categories) else DEFAULT_CATEGORY
+
+def categorize_errors(texts: list, language: str) -> list:
+    """Categorize a whole review's suggestions"""
+    return [categorize_error(text, language) for text in texts]
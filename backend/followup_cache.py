@@ -0,0 +1,174 @@
+# followup_cache.py
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import FollowupCacheEntry
+from review_cache import ReviewCache, normalize_code
+
+FOLLOWUP_CACHE_MAX_ENTRIES = int(os.getenv("FOLLOWUP_CACHE_MAX_ENTRIES", "1024"))
+FOLLOWUP_CACHE_MAX_BYTES = int(os.getenv("FOLLOWUP_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+FOLLOWUP_CACHE_TTL_SECONDS = int(os.getenv("FOLLOWUP_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# Rows kept in followup_cache; older ones are pruned every FOLLOWUP_CACHE_PRUNE_EVERY stores per worker
+FOLLOWUP_CACHE_MAX_ROWS = int(os.getenv("FOLLOWUP_CACHE_MAX_ROWS", "20000"))
+FOLLOWUP_CACHE_PRUNE_EVERY = int(os.getenv("FOLLOWUP_CACHE_PRUNE_EVERY", "100"))
+
+def make_followup_cache_key(kind: str, *inputs: str) -> str:
+    """
+    Content-addressed key for a follow-up call: hash of the kind (with its
+    prompt version) and the prompt inputs, code normalized like review keys
+    """
+    payload = json.dumps([kind] + [normalize_code(value or "") for value in inputs], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class FollowupCache(ReviewCache):
+    """
+    Same two tiers as the review cache, holding the text of accept/modify
+    follow-up calls in the followup_cache table. Identical calls already
+    running in this worker are awaited instead of repeated (double clicks).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int, max_rows: int):
+        super().__init__(max_entries, max_bytes, ttl_seconds, max_rows)
+        self.counters["joined"] = 0
+        self._inflight = {}  # key -> Future with the output
+
+    async def get(self, key: str, db: AsyncSession) -> Optional[str]:
+        output = self._get_memory(key)
+        if output is not None:
+            return output
+
+        result = await db.execute(
+            select(FollowupCacheEntry.output, FollowupCacheEntry.created_at).where(FollowupCacheEntry.cache_key == key)
+        )
+        row = result.first()
+        if row and row.created_at and row.created_at >= datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            with self._lock:
+                self.counters["db_hits"] += 1
+            self._put_memory(key, row.output)
+            return row.output
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    async def get_many(self, keys: list, db: AsyncSession) -> dict:
+        """get() for several keys with at most one query; returns only the hits"""
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            output = self._get_memory(key)
+            if output is not None:
+                found[key] = output
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+
+        result = await db.execute(
+            select(FollowupCacheEntry.cache_key, FollowupCacheEntry.output).where(
+                FollowupCacheEntry.cache_key.in_(missing),
+                FollowupCacheEntry.created_at >= datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+            )
+        )
+        rows = result.all()
+        for row in rows:
+            self._put_memory(row.cache_key, row.output)
+            found[row.cache_key] = row.output
+        with self._lock:
+            self.counters["db_hits"] += len(rows)
+            self.counters["misses"] += len(missing) - len(rows)
+        return found
+
+    async def put(self, key: str, output: str, kind: str, language: str, db: AsyncSession):
+        """Store in memory and stage the DB row (plus a periodic prune); the caller's commit persists it"""
+        self._put_memory(key, output)
+        # Upsert: another worker may store the same follow-up at the same time
+        statement = pg_insert(FollowupCacheEntry).values(
+            cache_key=key,
+            kind=kind,
+            language=language,
+            output=output,
+            created_at=datetime.utcnow()
+        )
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[FollowupCacheEntry.cache_key],
+            set_={"output": statement.excluded.output, "created_at": statement.excluded.created_at}
+        ))
+        with self._lock:
+            self.counters["stores"] += 1
+            self._stores_since_prune += 1
+            prune = self._stores_since_prune >= FOLLOWUP_CACHE_PRUNE_EVERY
+            if prune:
+                self._stores_since_prune = 0
+        if prune:
+            await self.prune(db)
+
+    async def prune(self, db: AsyncSession):
+        """Delete expired rows and everything beyond the newest max_rows"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        expired = await db.execute(delete(FollowupCacheEntry).where(FollowupCacheEntry.created_at < cutoff))
+        overflow = (
+            select(FollowupCacheEntry.cache_key)
+            .order_by(FollowupCacheEntry.created_at.desc())
+            .offset(self.max_rows)
+            .scalar_subquery()
+        )
+        evicted = await db.execute(delete(FollowupCacheEntry).where(FollowupCacheEntry.cache_key.in_(overflow)))
+        with self._lock:
+            self.counters["pruned"] += expired.rowcount + evicted.rowcount
+
+    async def get_or_generate(self, key: str, kind: str, language: str, db: AsyncSession,
+                              generate: Callable[[], Awaitable[str]]) -> str:
+        """
+        Cached output for key, else the output of generate(), stored for next
+        time. Errors are not cached. Call once the caller's own writes are
+        committed: a failed cache write is rolled back and only logged.
+        The caller commits the stored row.
+        """
+        while key in self._inflight:
+            pending = self._inflight[key]
+            with self._lock:
+                self.counters["joined"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only retry when the call we joined was cancelled, not this request
+                if not pending.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            output = await self.get(key, db)
+            if output is None:
+                output = await generate()
+                try:
+                    await self.put(key, output, kind, language, db)
+                except Exception as e:
+                    print(f"DEBUG: Failed to store follow-up cache entry: {str(e)}")
+                    await db.rollback()
+            future.set_result(output)
+            return output
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; don't warn when there were none
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {**super().stats(), "inflight": len(self._inflight)}
+
+followup_cache = FollowupCache(
+    FOLLOWUP_CACHE_MAX_ENTRIES, FOLLOWUP_CACHE_MAX_BYTES, FOLLOWUP_CACHE_TTL_SECONDS, FOLLOWUP_CACHE_MAX_ROWS
+)
@@ -0,0 +1,190 @@
+# followup_jobs.py
+import asyncio
+import math
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from fastapi import HTTPException
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, FollowupJob
+
+# Follow-up jobs run at once per worker (each still queues in llm_scheduler), and jobs allowed to wait
+FOLLOWUP_JOB_WORKERS = int(os.getenv("FOLLOWUP_JOB_WORKERS", "4"))
+FOLLOWUP_JOB_MAX_QUEUE = int(os.getenv("FOLLOWUP_JOB_MAX_QUEUE", "100"))
+# Unfinished jobs not updated for this long were lost (worker restart) and are reported as failed
+FOLLOWUP_JOB_STALE_SECONDS = int(os.getenv("FOLLOWUP_JOB_STALE_SECONDS", "600"))
+# Finished jobs are kept this long for polling, pruned every FOLLOWUP_JOB_PRUNE_EVERY jobs per worker
+FOLLOWUP_JOB_TTL_SECONDS = int(os.getenv("FOLLOWUP_JOB_TTL_SECONDS", str(60 * 60)))
+FOLLOWUP_JOB_PRUNE_EVERY = int(os.getenv("FOLLOWUP_JOB_PRUNE_EVERY", "100"))
+# How often a waiter re-reads a job another worker is running
+FOLLOWUP_JOB_POLL_SECONDS = float(os.getenv("FOLLOWUP_JOB_POLL_SECONDS", "0.5"))
+FINISHED_STATUSES = ("done", "failed")
+
+def new_job(kind: str, session_id: str) -> FollowupJob:
+    return FollowupJob(job_id=uuid.uuid4().hex, kind=kind, session_id=session_id, status="pending")
+
+def job_status(job: FollowupJob) -> dict:
+    """Client view of a job row"""
+    status, error = job.status, job.error
+    if status not in FINISHED_STATUSES and job.updated_at < datetime.utcnow() - timedelta(seconds=FOLLOWUP_JOB_STALE_SECONDS):
+        status, error = "failed", "Job was interrupted, please retry"
+    view = {"job_id": job.job_id, "kind": job.kind, "status": status}
+    if status == "done":
+        view["result"] = job.result
+    elif status == "failed":
+        view["detail"] = error
+    return view
+
+class FollowupReservation:
+    """Queue slots held for jobs admitted before their commit, until they are submitted or released"""
+
+    def __init__(self, pool, count: int):
+        self.pool = pool
+        self.count = count
+
+    def take(self):
+        if self.count > 0:
+            self.count -= 1
+            self.pool._reserved -= 1
+
+    def release(self):
+        """Give back the slots not used (the commit failed or fewer jobs were submitted)"""
+        self.pool._reserved -= self.count
+        self.count = 0
+
+class FollowupJobPool:
+    """
+    Bounded per-worker pool for follow-up LLM work the client doesn't wait
+    on. Job state lives in followup_jobs so any worker can answer polls;
+    waiters in the worker running a job are woken directly.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = None
+        self._reserved = 0  # slots held by FollowupReservations
+        self._tasks = []
+        self._finished = {}  # job_id -> Event, for jobs queued or running in this worker
+        self._jobs_since_prune = 0
+        self.counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "pruned": 0}
+
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def check_admission(self, count: int = 1):
+        """Raise 429 with Retry-After if count more jobs would not fit in the queue"""
+        if self.queued() + self._reserved + count > self.max_queue:
+            self.counters["rejected"] += 1
+            retry_after = max(1, math.ceil((self.queued() + self._reserved) / max(1, self.workers)))
+            raise HTTPException(
+                status_code=429,
+                detail=f"Follow-up queue is full, retry in {retry_after}s",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+    def reserve(self, count: int = 1) -> FollowupReservation:
+        """
+        Hold queue slots for count jobs before any work is committed, or raise
+        429. Concurrent requests can't all pass while one awaits its commit;
+        submit() takes the slots, release() returns what's left.
+        """
+        self.check_admission(count)
+        self._reserved += count
+        return FollowupReservation(self, count)
+
+    def submit(self, job_id: str, run: Callable[[AsyncSession], Awaitable[str]],
+               reservation: FollowupReservation | None = None):
+        """Queue a committed job, in a slot held by reservation; run(db) returns the result text"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if reservation is not None:
+            reservation.take()
+        self._finished[job_id] = asyncio.Event()
+        self._queue.put_nowait((job_id, run))
+        self.counters["submitted"] += 1
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Job status once finished or after timeout seconds; None for unknown jobs"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(FollowupJob).where(FollowupJob.job_id == job_id))
+                job = result.scalars().first()
+            if job is None:
+                return None
+            view = job_status(job)
+            remaining = deadline - time.monotonic()
+            if view["status"] in FINISHED_STATUSES or remaining <= 0:
+                return view
+
+            finished = self._finished.get(job_id)
+            if finished is not None:
+                try:
+                    await asyncio.wait_for(finished.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(FOLLOWUP_JOB_POLL_SECONDS, remaining))
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "queued": self.queued(),
+            "reserved": self._reserved,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+        }
+
+    async def _worker(self):
+        while True:
+            job_id, run = await self._queue.get()
+            try:
+                await self._run(job_id, run)
+            except Exception as e:
+                print(f"DEBUG: Follow-up job {job_id} could not be recorded: {str(e)}")
+            finally:
+                finished = self._finished.pop(job_id, None)
+                if finished is not None:
+                    finished.set()
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, run: Callable[[AsyncSession], Awaitable[str]]):
+        async with AsyncSessionLocal() as db:
+            await self._update(db, job_id, status="running")
+            try:
+                output = await run(db)
+                await self._update(db, job_id, status="done", result=output)
+                self.counters["done"] += 1
+            except Exception as e:
+                await db.rollback()
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                print(f"DEBUG: Follow-up job {job_id} failed: {detail}")
+                await self._update(db, job_id, status="failed", error=detail)
+                self.counters["failed"] += 1
+
+            self._jobs_since_prune += 1
+            if self._jobs_since_prune >= FOLLOWUP_JOB_PRUNE_EVERY:
+                self._jobs_since_prune = 0
+                await self._prune(db)
+
+    async def _update(self, db: AsyncSession, job_id: str, **values):
+        await db.execute(
+            update(FollowupJob).where(FollowupJob.job_id == job_id).values(**values, updated_at=datetime.utcnow())
+        )
+        await db.commit()
+
+    async def _prune(self, db: AsyncSession):
+        cutoff = datetime.utcnow() - timedelta(seconds=FOLLOWUP_JOB_TTL_SECONDS)
+        result = await db.execute(
+            delete(FollowupJob).where(FollowupJob.updated_at < cutoff, FollowupJob.status.in_(FINISHED_STATUSES))
+        )
+        await db.commit()
+        self.counters["pruned"] += result.rowcount
+
+followup_jobs = FollowupJobPool(FOLLOWUP_JOB_WORKERS, FOLLOWUP_JOB_MAX_QUEUE)
@@ -1,16 +1,141 @@
 from fastapi import Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from github import Github
 from schemas import GitRepoRequest, GitRepoContentsResponse, GitFileReviewRequest, GitFileReviewResponse
-from database import get_db, Repository, RepoFile
-from suggestion_routes import process_code_for_review
+from database import get_async_db, AsyncSessionLocal, Repository, RepoFile
+from suggestion_routes import process_code_for_review, review_prompt_version
+from blob_reviews import blob_reviews
+from repo_checkout import repo_checkouts, shallow_clone, download_tarball
+from review_writes import ReviewWriteBatch, ReviewWriteQueue
+from llm_scheduler import PRIORITY_BULK
 from datetime import datetime
+from collections import OrderedDict
+import asyncio
+import threading
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-async def get_repo_contents(payload: GitRepoRequest, db: Session = Depends(get_db)):
+# Max files fetched + reviewed at once per /git/review request, and per-file time budget
+GIT_REVIEW_CONCURRENCY = int(os.getenv("GIT_REVIEW_CONCURRENCY", "8"))
+GIT_REVIEW_FILE_TIMEOUT = float(os.getenv("GIT_REVIEW_FILE_TIMEOUT", "180"))
+# How /git/review gets file contents: "api" (one contents call per file), or one
+# download per commit into the on-disk snapshot cache: "clone" (shallow git
+# fetch) or "tarball" (GitHub archive)
+GIT_FETCH_MODE = os.getenv("GIT_FETCH_MODE", "api").lower()
+
+LANGUAGE_MAP = {
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'typescript',
+    '.py': 'python',
+    '.c': 'c',
+    '.cpp': 'cpp',
+    '.java': 'java',
+    '.html': 'html',
+    '.css': 'css',
+    '.php': 'php',
+    '.rb': 'ruby',
+    '.go': 'go',
+    '.rs': 'rust',
+    '.cs': 'csharp'
+}
+
+# Recursive tree listings keyed by (repo name, commit SHA); a commit's tree never changes
+REPO_TREE_CACHE_SIZE = int(os.getenv("REPO_TREE_CACHE_SIZE", "128"))
+_repo_tree_cache = OrderedDict()
+_repo_tree_cache_lock = threading.Lock()
+
+def file_language(file_path: str) -> str:
+    return LANGUAGE_MAP.get(os.path.splitext(file_path)[1].lower(), 'javascript')
+
+def get_head_commit_sha(repo) -> str:
+    return repo.get_git_ref(f"heads/{repo.default_branch}").object.sha
+
+def walk_repo_contents(repo, commit_sha: str) -> list:
+    """Directory-by-directory listing at commit_sha, one API call per directory"""
+    files = []
+
+    def process_contents(contents):
+        for content in contents:
+            if content.type == "file":
+                ext = os.path.splitext(content.path)[1].lower()
+                if ext in LANGUAGE_MAP:
+                    files.append({
+                        "path": content.path,
+                        "language": LANGUAGE_MAP[ext],
+                        "sha": content.sha
+                    })
+            elif content.type == "dir":
+                process_contents(repo.get_contents(content.path, ref=commit_sha))
+
+    process_contents(repo.get_contents("", ref=commit_sha))
+    return files
+
+def get_repo_file_listing(repo, repo_name: str, commit_sha: str) -> list:
+    """
+    List reviewable files at commit_sha with a single recursive git-trees call.
+    Falls back to walking directories if GitHub truncates the tree.
+    """
+    cache_key = (repo_name.lower(), commit_sha)
+    with _repo_tree_cache_lock:
+        if cache_key in _repo_tree_cache:
+            _repo_tree_cache.move_to_end(cache_key)
+            return _repo_tree_cache[cache_key]
+
+    tree = repo.get_git_tree(commit_sha, recursive=True)
+    if tree.truncated:
+        print(f"Tree for {repo_name}@{commit_sha} is truncated, walking directories instead")
+        files = walk_repo_contents(repo, commit_sha)
+    else:
+        files = []
+        for element in tree.tree:
+            # Symlinks (mode 120000) are blobs too; only regular files are reviewed
+            if element.type == "blob" and element.mode != "120000":
+                ext = os.path.splitext(element.path)[1].lower()
+                if ext in LANGUAGE_MAP:
+                    files.append({
+                        "path": element.path,
+                        "language": LANGUAGE_MAP[ext],
+                        "sha": element.sha
+                    })
+
+    with _repo_tree_cache_lock:
+        _repo_tree_cache[cache_key] = files
+        while len(_repo_tree_cache) > REPO_TREE_CACHE_SIZE:
+            _repo_tree_cache.popitem(last=False)
+    return files
+
+def checkout_repo(repo, commit_sha: str, github_token: str) -> str | None:
+    """Local snapshot of the repository at commit_sha for GIT_FETCH_MODE; None in api mode"""
+    if GIT_FETCH_MODE == "clone":
+        fetch = lambda target: shallow_clone(repo.clone_url, commit_sha, target, github_token)
+    elif GIT_FETCH_MODE == "tarball":
+        fetch = lambda target: download_tarball(repo.get_archive_link("tarball", ref=commit_sha), target)
+    else:
+        return None
+    return repo_checkouts.checkout(commit_sha, fetch)
+
+def file_error_review(file_path: str, language: str, message: str) -> dict:
+    return {
+        "file_path": file_path,
+        "language": language,
+        "suggestions": [{
+            "id": 1,
+            "text": f"Error processing file: {message}",
+            "severity": "Low",
+            "modifiedText": "",
+            "rejectReason": "",
+            "status": "error",
+            "file_path": file_path
+        }],
+        "original_code": ""
+    }
+
+async def get_repo_contents(payload: GitRepoRequest, db: AsyncSession = Depends(get_async_db)):
     try:
         github_token = os.getenv("GITHUB_TOKEN")
         if not github_token:
@@ -31,53 +156,24 @@ async def get_repo_contents(payload: GitRepoRequest, db: Session = Depends(get_d
             created_at=datetime.utcnow()
         )
         db.add(repo_record)
-        db.commit()
-        db.refresh(repo_record)
+        await db.commit()
+        await db.refresh(repo_record)
 
-        # Get repository contents
-        contents = repo.get_contents("")
-        files = []
-        language_map = {
-            '.js': 'javascript',
-            '.jsx': 'javascript',
-            '.ts': 'typescript',
-            '.tsx': 'typescript',
-            '.py': 'python',
-            '.c': 'c',
-            '.cpp': 'cpp',
-            '.java': 'java',
-            '.html': 'html',
-            '.css': 'css',
-            '.php': 'php',
-            '.rb': 'ruby',
-            '.go': 'go',
-            '.rs': 'rust',
-            '.cs': 'csharp'
-        }
-
-        def process_contents(contents, path=""):
-            for content in contents:
-                if content.type == "file":
-                    ext = os.path.splitext(content.path)[1].lower()
-                    if ext in language_map:
-                        files.append({
-                            "path": content.path,
-                            "language": language_map[ext]
-                        })
-                elif content.type == "dir":
-                    process_contents(repo.get_contents(content.path), content.path)
-
-        process_contents(contents)
-        db.commit()
-        return GitRepoContentsResponse(files=files)
+        # Listing is cached per commit, so an unchanged repo only costs the ref lookup
+        commit_sha = await asyncio.to_thread(get_head_commit_sha, repo)
+        files = await asyncio.to_thread(get_repo_file_listing, repo, repo_name, commit_sha)
+
+        await db.commit()
+        return GitRepoContentsResponse(files=[{"path": f["path"], "language": f["language"]} for f in files])
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to fetch repository contents: {str(e)}")
 
-async def review_repo_files(payload: GitFileReviewRequest, db: Session = Depends(get_db)):
+async def review_repo_files(payload: GitFileReviewRequest, db: AsyncSession = Depends(get_async_db)):
+    lease = None
     try:
         github_token = os.getenv("GITHUB_TOKEN")
         if not github_token:
@@ -92,7 +188,8 @@ async def review_repo_files(payload: GitFileReviewRequest, db: Session = Depends
             raise HTTPException(status_code=400, detail=f"Invalid repository URL or access denied: {str(e)}")
 
         # Store or retrieve repository in database
-        repo_record = db.query(Repository).filter(Repository.repo_url == repo_url).first()
+        result = await db.execute(select(Repository).where(Repository.repo_url == repo_url))
+        repo_record = result.scalars().first()
         if not repo_record:
             repo_record = Repository(
                 repo_url=repo_url,
@@ -100,83 +197,146 @@ async def review_repo_files(payload: GitFileReviewRequest, db: Session = Depends
                 created_at=datetime.utcnow()
             )
             db.add(repo_record)
-            db.commit()
-            db.refresh(repo_record)
+            await db.commit()
+            await db.refresh(repo_record)
+
+        repo_id = repo_record.id
+
+        # Git blob SHAs at the current commit: a file anyone already had reviewed
+        # reuses that review, and its stored content saves the GitHub fetch
+        try:
+            commit_sha = await asyncio.to_thread(get_head_commit_sha, repo)
+            listing = await asyncio.to_thread(get_repo_file_listing, repo, repo_name, commit_sha)
+            blob_shas = {f["path"]: f["sha"] for f in listing}
+        except Exception as e:
+            print(f"Could not list {repo_name}, reviewing without shared blob reviews: {str(e)}")
+            commit_sha, blob_shas = None, {}
+        stored_reviews = await blob_reviews.load_many(
+            db,
+            [(blob_shas[path], file_language(path)) for path in payload.file_paths if path in blob_shas],
+            review_prompt_version()
+        )
 
-        reviews = []
-        for file_path in payload.file_paths:
+        # Release the request connection; each file task opens its own session
+        await db.commit()
+
+        # Files without a stored review are read from one snapshot of the commit when GIT_FETCH_MODE allows
+        checkout = None
+        if commit_sha and GIT_FETCH_MODE != "api" and any((blob_shas.get(path), file_language(path)) not in stored_reviews for path in payload.file_paths):
             try:
-                file_content = repo.get_contents(file_path)
-                content = file_content.decoded_content.decode('utf-8')
-                ext = os.path.splitext(file_path)[1].lower()
-                language_map = {
-                    '.js': 'javascript',
-                    '.jsx': 'javascript',
-                    '.ts': 'typescript',
-                    '.tsx': 'typescript',
-                    '.py': 'python',
-                    '.c': 'c',
-                    '.cpp': 'cpp',
-                    '.java': 'java',
-                    '.html': 'html',
-                    '.css': 'css',
-                    '.php': 'php',
-                    '.rb': 'ruby',
-                    '.go': 'go',
-                    '.rs': 'rust',
-                    '.cs': 'csharp'
-                }
-                language = language_map.get(ext, 'javascript')
+                # Pinned until every file is read, so other reviews can't evict the snapshot
+                lease = repo_checkouts.pin(commit_sha)
+                checkout = await asyncio.to_thread(checkout_repo, repo, commit_sha, github_token)
+            except Exception as e:
+                print(f"Could not check out {repo_name}@{commit_sha}, fetching files one by one: {str(e)}")
+
+        semaphore = asyncio.Semaphore(GIT_REVIEW_CONCURRENCY)
+        # Finished files are stored in groups, one transaction (and COPY-sized batch) per group
+        write_queue = ReviewWriteQueue(AsyncSessionLocal)
+
+        def fetch_content(file_path: str) -> str:
+            if checkout is not None:
+                try:
+                    return repo_checkouts.read_file(commit_sha, file_path)
+                except (OSError, ValueError) as e:
+                    print(f"Could not read {file_path} from the snapshot, fetching it from GitHub: {str(e)}")
+            # Pinned to the listed commit so the content matches its blob SHA
+            file_content = repo.get_contents(file_path, ref=commit_sha) if commit_sha else repo.get_contents(file_path)
+            return file_content.decoded_content.decode('utf-8')
+
+        async def fetch_and_review(file_path: str, language: str) -> dict:
+            blob_sha = blob_shas.get(file_path)
+            stored = stored_reviews.get((blob_sha, language))
+            # Each file gets its own AsyncSession: a session must not be shared between concurrent tasks
+            async with AsyncSessionLocal() as file_db:
+                if stored is not None:
+                    content = stored["code"]
+                else:
+                    content = await asyncio.to_thread(fetch_content, file_path)
 
-                # Store file content in database
-                repo_file = RepoFile(
-                    repo_id=repo_record.id,
+                # The file content is stored in the same transaction as its review rows,
+                # so only files that finished are written, and each one completely
+                file_writes = ReviewWriteBatch()
+                file_writes.add(
+                    RepoFile,
+                    repo_id=repo_id,
                     session_id=payload.session_id,
                     file_path=file_path,
-                    content=content,
+                    content_sha256=file_writes.add_code(content),
                     language=language,
                     created_at=datetime.utcnow()
                 )
-                db.add(repo_file)
-
-                # Process code for review
                 suggestions = await process_code_for_review(
                     code=content,
                     language=language,
                     session_id=payload.session_id,
                     file_path=file_path,
-                    db=db
+                    db=file_db,
+                    user_id=payload.user_id,
+                    priority=PRIORITY_BULK,
+                    writes=file_writes,
+                    blob_sha=blob_sha,
+                    base_review=stored["suggestions"] if stored is not None else None,
+                    write_queue=write_queue
                 )
 
-                reviews.append({
+                return {
                     "file_path": file_path,
                     "language": language,
                     "suggestions": suggestions,
                     "original_code": content
-                })
+                }
 
+        async def review_one(file_path: str) -> dict:
+            language = file_language(file_path)
+            # The listing only holds LANGUAGE_MAP files: one of those missing from it isn't a
+            # regular file at the commit; other extensions are fetched as before
+            listed_extension = os.path.splitext(file_path)[1].lower() in LANGUAGE_MAP
+            if commit_sha and listed_extension and file_path not in blob_shas:
+                return file_error_review(file_path, language, f"{file_path} is not a reviewable file at commit {commit_sha}")
+            try:
+                # The time budget starts once the file has a slot, not while it waits for one
+                async with semaphore:
+                    return await asyncio.wait_for(fetch_and_review(file_path, language), timeout=GIT_REVIEW_FILE_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"Timed out processing file {file_path}")
+                return file_error_review(file_path, language, f"Timed out after {GIT_REVIEW_FILE_TIMEOUT:g}s")
+            except HTTPException as e:
+                # A saturated LLM queue (429) fails only this file: the other files go on and
+                # are stored, so a retry of the failed ones doesn't write those twice
+                print(f"Error processing file {file_path}: {e.detail}")
+                return file_error_review(file_path, language, e.detail)
             except Exception as e:
                 print(f"Error processing file {file_path}: {str(e)}")
-                reviews.append({
-                    "file_path": file_path,
-                    "language": language,
-                    "suggestions": [{
-                        "id": 1,
-                        "text": f"Error processing file: {str(e)}",
-                        "severity": "Low",
-                        "modifiedText": "",
-                        "rejectReason": "",
-                        "status": "error",
-                        "file_path": file_path
-                    }],
-                    "original_code": ""
-                })
-
-        db.commit()
+                return file_error_review(file_path, language, str(e))
+
+        # Fan out; gather keeps results in request order
+        tasks = [asyncio.create_task(review_one(file_path)) for file_path in payload.file_paths]
+        try:
+            reviews = await asyncio.gather(*tasks)
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            # Files that finished are stored even when the review is cut short
+            await write_queue.close()
+
+        reviews = [
+            file_error_review(review["file_path"], review["language"], f"Could not store the review: {write_queue.failed[review['file_path']]}")
+            if review["file_path"] in write_queue.failed else review
+            for review in reviews
+        ]
         return {"reviews": reviews}
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to review repository files: {str(e)}")
\ No newline at end of file
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to review repository files: {str(e)}")
+    finally:
+        if lease is not None:
+            repo_checkouts.unpin(lease)
+
+def get_repo_checkout_stats():
+    return repo_checkouts.stats()
@@ -0,0 +1,168 @@
+# llm_scheduler.py
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+# Priority lanes, lower value is served first
+PRIORITY_INTERACTIVE = 0  # /generate-suggestions
+PRIORITY_FEEDBACK = 1     # accept/modify follow-up calls
+PRIORITY_BULK = 2         # /git/review fan-out
+LANE_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_FEEDBACK: "feedback",
+    PRIORITY_BULK: "bulk",
+}
+
+# Max Gemini requests in flight per worker; calls are native async, so this is not tied to thread count
+LLM_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_CONCURRENCY", "256"))
+# Global token bucket: sustained requests per second and burst size
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "10"))
+LLM_RATE_BURST = float(os.getenv("LLM_RATE_BURST", "20"))
+# Requests allowed to wait across all lanes before new ones get 429
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "200"))
+
+class LLMScheduler:
+    """
+    Admission control for all LLM traffic: a bounded queue split into
+    priority lanes, a global token-bucket rate limit and an in-flight cap.
+    Waiters are always granted highest lane first, FIFO within a lane.
+    """
+
+    def __init__(self, max_in_flight: int, rate_per_second: float, burst: float, max_queue: int):
+        self.max_in_flight = max_in_flight
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_queue = max_queue
+        self._lanes = {priority: deque() for priority in LANE_NAMES}
+        self._in_flight = 0
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._retry_handle = None
+        self._stats = {
+            priority: {"admitted": 0, "rejected": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+            for priority in LANE_NAMES
+        }
+
+    def queue_depth(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def retry_after_seconds(self) -> int:
+        """Rough time for the current backlog to drain at the configured rate"""
+        backlog = self.queue_depth() + 1
+        return max(1, math.ceil(backlog / self.rate_per_second))
+
+    def check_admission(self, priority: int = PRIORITY_INTERACTIVE):
+        """Raise 429 with Retry-After if a new request in this lane would have to be turned away"""
+        if self.queue_depth() >= self.max_queue:
+            self._stats[priority]["rejected"] += 1
+            retry_after = self.retry_after_seconds()
+            raise HTTPException(
+                status_code=429,
+                detail=f"AI review queue is full, retry in {retry_after}s",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """Wait for a slot; returns the queue wait in milliseconds"""
+        self._refill()
+        if self.queue_depth() == 0 and self._in_flight < self.max_in_flight and self._tokens >= 1:
+            self._grant(priority)
+            return 0.0
+
+        self.check_admission(priority)
+
+        waiter = asyncio.get_running_loop().create_future()
+        enqueued_at = time.monotonic()
+        self._lanes[priority].append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted just before cancellation; hand it back
+                self.release()
+            elif waiter in self._lanes[priority]:
+                self._lanes[priority].remove(waiter)
+            raise
+
+        wait_ms = (time.monotonic() - enqueued_at) * 1000
+        self._record_wait(priority, wait_ms)
+        return wait_ms
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        lanes = {}
+        for priority, name in LANE_NAMES.items():
+            lane_stats = self._stats[priority]
+            admitted = lane_stats["admitted"]
+            lanes[name] = {
+                "queue_depth": len(self._lanes[priority]),
+                "admitted": admitted,
+                "rejected": lane_stats["rejected"],
+                "avg_wait_ms": (lane_stats["total_wait_ms"] / admitted) if admitted else 0,
+                "max_wait_ms": lane_stats["max_wait_ms"],
+            }
+        self._refill()
+        return {
+            "queue_depth": self.queue_depth(),
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "tokens_available": self._tokens,
+            "rate_per_second": self.rate_per_second,
+            "lanes": lanes,
+        }
+
+    def _grant(self, priority: int):
+        self._tokens -= 1
+        self._in_flight += 1
+        self._stats[priority]["admitted"] += 1
+
+    def _record_wait(self, priority: int, wait_ms: float):
+        lane_stats = self._stats[priority]
+        lane_stats["total_wait_ms"] += wait_ms
+        lane_stats["max_wait_ms"] = max(lane_stats["max_wait_ms"], wait_ms)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_per_second)
+        self._last_refill = now
+
+    def _dispatch(self):
+        self._refill()
+        while self._in_flight < self.max_in_flight:
+            priority = next((p for p in sorted(self._lanes) if self._lanes[p]), None)
+            if priority is None:
+                return
+            if self._tokens < 1:
+                # Out of tokens: wake up when the next one is due
+                if self._retry_handle is None:
+                    delay = (1 - self._tokens) / self.rate_per_second
+                    self._retry_handle = asyncio.get_running_loop().call_later(delay, self._retry_dispatch)
+                return
+            waiter = self._lanes[priority].popleft()
+            if waiter.cancelled():
+                continue
+            self._grant(priority)
+            waiter.set_result(None)
+
+    def _retry_dispatch(self):
+        self._retry_handle = None
+        self._dispatch()
+
+llm_scheduler = LLMScheduler(LLM_MAX_IN_FLIGHT, LLM_RATE_PER_SECOND, LLM_RATE_BURST, LLM_MAX_QUEUE)
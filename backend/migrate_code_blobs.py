@@ -0,0 +1,70 @@
+# migrate_code_blobs.py
+"""
+Move source stored inline in code_sessions.code and repo_files.content into
+code_blobs: each distinct text is stored once, zstd-compressed, and the rows
+keep only its SHA-256 (content_sha256). Rows already moved are skipped, so
+this can be re-run and can run while the app is serving; each batch is its
+own transaction. Run migrate_columns.py first.
+
+Postgres only gives the freed space back after VACUUM FULL code_sessions,
+repo_files (or pg_repack), which is best run off-peak.
+
+Usage: python migrate_code_blobs.py [batch_size]
+Needs DATABASE_URL like the app.
+"""
+import sys
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import SessionLocal, CodeBlob, CodeSession, RepoFile
+from code_blobs import code_blob_row
+
+DEFAULT_BATCH_SIZE = 500
+
+def migrate_table(model, sha_attr: str, legacy_attr: str, batch_size: int) -> int:
+    """Move one table's inline source into code_blobs; returns the rows moved"""
+    sha_column, legacy_column = getattr(model, sha_attr), getattr(model, legacy_attr)
+    moved = 0
+    last_id = 0
+    while True:
+        with SessionLocal() as db:
+            batch = db.execute(
+                select(model.id, legacy_column)
+                .where(model.id > last_id, sha_column.is_(None), legacy_column.isnot(None))
+                .order_by(model.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                return moved
+
+            blobs = {}
+            updates = []
+            for row_id, source in batch:
+                blob = code_blob_row(source)
+                blobs.setdefault(blob["sha256"], blob)
+                updates.append({"id": row_id, sha_attr: blob["sha256"], legacy_attr: None})
+            db.execute(
+                pg_insert(CodeBlob).on_conflict_do_nothing(index_elements=[CodeBlob.sha256]),
+                sorted(blobs.values(), key=lambda blob: blob["sha256"])
+            )
+            # Bulk UPDATE by primary key
+            db.execute(update(model), updates)
+            db.commit()
+
+        moved += len(batch)
+        last_id = batch[-1][0]
+        print(f"DEBUG: {model.__tablename__}: moved {moved} rows ({len(blobs)} distinct texts in last batch)")
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE
+    sessions = migrate_table(CodeSession, "code_sha256", "legacy_code", batch_size)
+    files = migrate_table(RepoFile, "content_sha256", "legacy_content", batch_size)
+
+    with SessionLocal() as db:
+        blobs, size, stored = db.execute(
+            select(func.count(), func.coalesce(func.sum(CodeBlob.size), 0), func.coalesce(func.sum(func.length(CodeBlob.data)), 0))
+        ).one()
+    print(f"Moved {sessions} code_sessions and {files} repo_files rows")
+    print(f"code_blobs: {blobs} distinct texts, {size / 1e6:.1f} MB of source stored in {stored / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
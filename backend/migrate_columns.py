@@ -0,0 +1,64 @@
+# migrate_columns.py
+"""
+Bring tables that already exist in line with the models: create_all only
+creates missing tables, so columns added to a model since are added here,
+and NOT NULL is dropped from columns the model now allows to be null (e.g.
+code_sessions.code and repo_files.content, whose text moved to code_blobs).
+
+ALTER TABLE takes an ACCESS EXCLUSIVE lock, so this runs once per deploy,
+before the new code starts, rather than in every worker at import. Each
+change is its own short transaction and gives up after lock_timeout instead
+of queueing every query behind a long-running one; just re-run it then.
+Afterwards run migrate_code_blobs.py, then migrate_indexes.py.
+
+Usage: python migrate_columns.py
+Needs DATABASE_URL like the app.
+"""
+import os
+import sys
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from database import engine, Base
+
+# Longest an ALTER TABLE may wait for its lock
+MIGRATE_LOCK_TIMEOUT = os.getenv("MIGRATE_LOCK_TIMEOUT", "5s")
+
+def pending_changes(connection) -> list:
+    """ALTER TABLE statements the existing tables need"""
+    inspector = inspect(connection)
+    changes = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                if not column.nullable:
+                    print(f"Skipping {table.name}.{column.name}: a NOT NULL column needs a default or backfill")
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                changes.append(f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS "{column.name}" {column_type}')
+            elif column.nullable and not column.primary_key and not existing[column.name]["nullable"]:
+                changes.append(f'ALTER TABLE {table.name} ALTER COLUMN "{column.name}" DROP NOT NULL')
+    return changes
+
+def main():
+    with engine.connect() as connection:
+        changes = pending_changes(connection)
+        connection.rollback()
+        failed = 0
+        for change in changes:
+            try:
+                with connection.begin():
+                    connection.execute(text(f"SET LOCAL lock_timeout = '{MIGRATE_LOCK_TIMEOUT}'"))
+                    connection.execute(text(change))
+                print(change)
+            except OperationalError as e:
+                failed += 1
+                print(f"Failed, re-run later: {change}: {e.orig}")
+    print(f"{len(changes) - failed} of {len(changes)} column changes applied")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# migrate_indexes.py
+"""
+Build the indexes declared on the models that existing tables don't have
+yet (create_all only creates missing tables). Each index is built with
+CREATE INDEX CONCURRENTLY IF NOT EXISTS, so writes to large tables carry on
+while it builds; a build that failed earlier leaves an invalid index, which
+is dropped and rebuilt. Run once per deploy, from one place, not per worker,
+after migrate_columns.py has added the columns the indexes cover.
+
+Usage: python migrate_indexes.py
+Needs DATABASE_URL like the app.
+"""
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+from database import engine, Base
+
+def main():
+    # CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        invalid = set(connection.execute(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"
+        )).scalars())
+        for table in Base.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in invalid:
+                    print(f"Dropping invalid index {index.name}")
+                    connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+                index.dialect_options["postgresql"]["concurrently"] = True
+                connection.execute(CreateIndex(index, if_not_exists=True))
+                print(f"Index {index.name} on {table.name} is in place")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# preference_profile.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import SessionLocal, PreferenceProfile, UserPattern, CodeSession
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "1024"))
+# Other workers' feedback shows up in this worker's cached profiles after at most this long
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+# Ring buffer size per outcome; matches what the prompt summary quotes
+PROFILE_EXAMPLE_LIMITS = {"accepted": 3, "rejected": 3, "modified": 2}
+PROFILE_PROMPT_CATEGORIES = 5
+
+def profile_scope(session_id: str, user_id: int | None) -> str:
+    """Profiles span sessions for known users; anonymous feedback stays with its session"""
+    return f"user:{user_id}" if user_id else f"session:{session_id}"
+
+def empty_profile() -> dict:
+    return {"counters": {}, "examples": {outcome: [] for outcome in PROFILE_EXAMPLE_LIMITS}}
+
+def feedback_example(outcome: str, pattern_data: dict) -> str:
+    """One-line example of a feedback event, from the same data stored in UserPattern"""
+    if outcome == "rejected":
+        reason = pattern_data.get("reject_reason") or "No reason given"
+        return f"'{(pattern_data.get('suggestion_text') or '')[:100]}' (Reason: {reason})"
+    if outcome == "modified":
+        original = (pattern_data.get("original_text") or "")[:80]
+        modified = (pattern_data.get("modified_text") or "")[:80]
+        return f"Original: '{original}' → Modified: '{modified}'"
+    return (pattern_data.get("suggestion_text") or "")[:100]
+
+def apply_feedback(profile: dict, outcome: str, error_category: str, example: str) -> dict:
+    """Return a new profile with one feedback event added (new objects so JSONB changes are detected)"""
+    counters = {category: dict(counts) for category, counts in profile["counters"].items()}
+    counts = counters.setdefault(error_category or "Other Issue", {"accepted": 0, "rejected": 0, "modified": 0})
+    counts[outcome] = counts.get(outcome, 0) + 1
+
+    examples = {key: list(values) for key, values in profile["examples"].items()}
+    examples[outcome] = ([example] + examples.get(outcome, []))[:PROFILE_EXAMPLE_LIMITS[outcome]]
+    return {"counters": counters, "examples": examples}
+
+def summarize_profile(profile: dict) -> str:
+    """Prompt context for a profile (replaces summarizing the last raw UserPattern rows)"""
+    if not profile["counters"]:
+        return "No prior feedback available."
+
+    examples = profile["examples"]
+    summary = []
+    if examples.get("accepted"):
+        summary.append(f"User has accepted suggestions like: {'; '.join(examples['accepted'])}.")
+    if examples.get("rejected"):
+        summary.append(f"User has rejected suggestions such as: {'; '.join(examples['rejected'])}.")
+    if examples.get("modified"):
+        summary.append(f"User tends to modify suggestions, e.g.: {'; '.join(examples['modified'])}.")
+
+    top_categories = sorted(
+        profile["counters"].items(),
+        key=lambda item: -sum(item[1].values())
+    )[:PROFILE_PROMPT_CATEGORIES]
+    tendencies = "; ".join(
+        f"{category} {counts.get('accepted', 0)}/{counts.get('rejected', 0)}/{counts.get('modified', 0)}"
+        for category, counts in top_categories
+    )
+    summary.append(f"Feedback by category (accepted/rejected/modified): {tendencies}.")
+    return " ".join(summary)
+
+class ProfileCache:
+    """In-process LRU of profiles and their prompt summaries, with a TTL"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # scope -> (stored_at, profile, summary)
+        self._lock = threading.Lock()
+
+    def get(self, scope: str) -> tuple | None:
+        with self._lock:
+            item = self._entries.get(scope)
+            if item is None:
+                return None
+            if time.monotonic() - item[0] > self.ttl_seconds:
+                del self._entries[scope]
+                return None
+            self._entries.move_to_end(scope)
+            return item[1], item[2]
+
+    def put(self, scope: str, profile: dict) -> str:
+        summary = summarize_profile(profile)
+        with self._lock:
+            self._entries.pop(scope, None)
+            self._entries[scope] = (time.monotonic(), profile, summary)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return summary
+
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL_SECONDS)
+
+async def load_profile_summary(db: AsyncSession, scope: str) -> str:
+    """Prompt context for a scope: a cache hit, or one primary-key read"""
+    cached = profile_cache.get(scope)
+    if cached is not None:
+        return cached[1]
+    result = await db.execute(
+        select(PreferenceProfile.counters, PreferenceProfile.examples).where(PreferenceProfile.scope == scope)
+    )
+    row = result.first()
+    profile = {"counters": row.counters, "examples": row.examples} if row else empty_profile()
+    return profile_cache.put(scope, profile)
+
+async def update_profiles(db: AsyncSession, scopes: list, events: list) -> list:
+    """
+    Add feedback events [(outcome, error_category, pattern_data)] to each
+    scope's profile inside the caller's transaction. Rows are locked so
+    concurrent feedback can't lose updates.
+    Returns [(scope, profile)] to hand to remember_profiles after commit.
+    """
+    scopes = sorted(set(scopes))  # fixed lock order
+    await db.execute(
+        pg_insert(PreferenceProfile)
+        .values([{"scope": scope, **empty_profile(), "updated_at": datetime.utcnow()} for scope in scopes])
+        .on_conflict_do_nothing(index_elements=[PreferenceProfile.scope])
+    )
+    result = await db.execute(
+        select(PreferenceProfile)
+        .where(PreferenceProfile.scope.in_(scopes))
+        .order_by(PreferenceProfile.scope)
+        .with_for_update()
+    )
+    examples = [(outcome, error_category, feedback_example(outcome, pattern_data))
+                for outcome, error_category, pattern_data in events]
+    updated = []
+    for row in result.scalars().all():
+        profile = {"counters": row.counters, "examples": row.examples}
+        for outcome, error_category, example in examples:
+            profile = apply_feedback(profile, outcome, error_category, example)
+        row.counters = profile["counters"]
+        row.examples = profile["examples"]
+        row.updated_at = datetime.utcnow()
+        updated.append((row.scope, profile))
+    return updated
+
+def remember_profiles(updated: list):
+    for scope, profile in updated:
+        profile_cache.put(scope, profile)
+
+def backfill_profiles(db: Session) -> int:
+    """Rebuild preference_profiles from the UserPattern history in one transaction"""
+    rows = (
+        db.query(UserPattern.session_id, UserPattern.pattern_type, UserPattern.pattern_data, CodeSession.user_id)
+        .outerjoin(CodeSession, CodeSession.session_id == UserPattern.session_id)
+        .order_by(UserPattern.created_at, UserPattern.id)
+        .yield_per(1000)
+    )
+    profiles = {}
+    for session_id, outcome, pattern_data, owner in rows:
+        if outcome not in PROFILE_EXAMPLE_LIMITS:
+            continue
+        pattern_data = pattern_data or {}
+        example = feedback_example(outcome, pattern_data)
+        for scope in {profile_scope(session_id, None), profile_scope(session_id, owner)}:
+            profiles[scope] = apply_feedback(
+                profiles.get(scope) or empty_profile(), outcome, pattern_data.get("error_category"), example
+            )
+    try:
+        db.query(PreferenceProfile).delete()
+        db.bulk_insert_mappings(PreferenceProfile, [
+            {"scope": scope, **profile, "updated_at": datetime.utcnow()} for scope, profile in profiles.items()
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(profiles)
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] != ["backfill"]:
+        print("Usage: python preference_profile.py backfill")
+        sys.exit(1)
+    db = SessionLocal()
+    try:
+        count = backfill_profiles(db)
+        print(f"Rebuilt preference_profiles: {count} profiles")
+    finally:
+        db.close()
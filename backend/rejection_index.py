@@ -0,0 +1,159 @@
+# rejection_index.py
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+
+# Jaccard similarity of word-pair shingles at which a suggestion counts as a repeat of a rejection
+REJECTION_SIMILARITY = float(os.getenv("REJECTION_SIMILARITY", "0.75"))
+# Rejections quoted in the review prompt, and characters per quote
+REJECTION_PROMPT_LIMIT = int(os.getenv("REJECTION_PROMPT_LIMIT", "15"))
+REJECTION_PROMPT_CHARS = int(os.getenv("REJECTION_PROMPT_CHARS", "200"))
+# Distinct rejections kept per user/session, and user/session indexes kept per worker
+REJECTION_INDEX_MAX_ENTRIES = int(os.getenv("REJECTION_INDEX_MAX_ENTRIES", "1000"))
+REJECTION_INDEX_CACHE_SIZE = int(os.getenv("REJECTION_INDEX_CACHE_SIZE", "256"))
+# Rows created this long before the newest one read are read again: ids are handed out at
+# insert but become visible at commit, so a lower id can show up after a higher one
+REJECTION_INDEX_RESCAN_SECONDS = float(os.getenv("REJECTION_INDEX_RESCAN_SECONDS", "300"))
+
+ISSUE_FIELD = re.compile(r'\*\*Issue:\*\*\s*(.+)')
+LOCATION_FIELDS = re.compile(r'^\s*-?\s*\*\*(Line\(s\)|Severity):\*\*.*$', re.MULTILINE)
+
+def issue_text(text: str) -> str:
+    """The Issue field of a suggestion, or the text without its Line(s)/Severity fields"""
+    match = ISSUE_FIELD.search(text)
+    return match.group(1) if match else LOCATION_FIELDS.sub("", text)
+
+def normalize_rejection(text: str) -> str:
+    """
+    Lower-cased issue words with digits and punctuation dropped, so line
+    numbers and formatting don't make a repeated suggestion look new
+    """
+    return " ".join(re.sub(r'[^a-z_]+', " ", issue_text(text).lower()).split())
+
+def shingles(normalized: str) -> frozenset:
+    """Word pairs (single words for one-word texts)"""
+    words = normalized.split()
+    if len(words) < 2:
+        return frozenset(words)
+    return frozenset(" ".join(pair) for pair in zip(words, words[1:]))
+
+class RejectionIndex:
+    """
+    Shingle index of one user's (or session's) rejected suggestions.
+    Near-duplicate rejections collapse into one entry with a count.
+    `text in index` is a near-duplicate test, so the index can stand in for
+    the old set of rejected texts when filtering generated suggestions.
+    """
+
+    def __init__(self, max_entries: int = REJECTION_INDEX_MAX_ENTRIES, similarity: float = REJECTION_SIMILARITY):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.last_id = 0  # highest RejectedSuggestion.id already added
+        self.newest_created_at = None  # latest RejectedSuggestion.created_at already added
+        self._recent_ids = {}  # id -> created_at of the rows added inside the rescan window
+        self._entries = OrderedDict()  # normalized text -> {"text", "shingles", "count"}, oldest first
+        self._postings = {}  # shingle -> set of normalized texts containing it
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, text: str) -> bool:
+        return self._find(normalize_rejection(text)) is not None
+
+    def add(self, text: str):
+        normalized = normalize_rejection(text)
+        if not normalized:
+            return
+        match = self._find(normalized)
+        if match is not None:
+            self._entries[match]["count"] += 1
+            self._entries.move_to_end(match)
+            return
+
+        entry_shingles = shingles(normalized)
+        self._entries[normalized] = {"text": text, "shingles": entry_shingles, "count": 1}
+        for shingle in entry_shingles:
+            self._postings.setdefault(shingle, set()).add(normalized)
+        while len(self._entries) > self.max_entries:
+            evicted, entry = self._entries.popitem(last=False)
+            for shingle in entry["shingles"]:
+                self._postings[shingle].discard(evicted)
+                if not self._postings[shingle]:
+                    del self._postings[shingle]
+
+    def rescan_from(self) -> datetime | None:
+        """created_at from which rows are read again on the next load"""
+        if self.newest_created_at is None:
+            return None
+        return self.newest_created_at - timedelta(seconds=REJECTION_INDEX_RESCAN_SECONDS)
+
+    def add_row(self, row_id: int, created_at: datetime | None, text: str):
+        """Add a RejectedSuggestion row unless it was added before (rescans and concurrent loads repeat rows)"""
+        rescan_from = self.rescan_from()
+        if row_id in self._recent_ids or (row_id <= self.last_id and (
+                created_at is None or (rescan_from is not None and created_at < rescan_from))):
+            return
+        self.add(text)
+        self.last_id = max(self.last_id, row_id)
+        if created_at is None:
+            return
+        self._recent_ids[row_id] = created_at
+        if self.newest_created_at is None or created_at > self.newest_created_at:
+            self.newest_created_at = created_at
+            rescan_from = self.rescan_from()
+            self._recent_ids = {
+                recent_id: recent_created_at for recent_id, recent_created_at in self._recent_ids.items()
+                if recent_created_at >= rescan_from
+            }
+
+    def summary(self, limit: int = REJECTION_PROMPT_LIMIT) -> list:
+        """Most-rejected (then most recent) issues, shortened for the prompt"""
+        entries = sorted(reversed(self._entries.values()), key=lambda entry: -entry["count"])[:limit]
+        lines = []
+        for entry in entries:
+            issue = " ".join(issue_text(entry["text"]).split())
+            if len(issue) > REJECTION_PROMPT_CHARS:
+                issue = issue[:REJECTION_PROMPT_CHARS - 3].rstrip() + "..."
+            lines.append(issue)
+        return lines
+
+    def digest(self) -> str:
+        """Changes whenever the set of distinct rejections changes (for review cache keys)"""
+        return hashlib.sha256("\n".join(sorted(self._entries)).encode("utf-8")).hexdigest()
+
+    def _find(self, normalized: str) -> str | None:
+        if not normalized:
+            return None
+        if normalized in self._entries:
+            return normalized
+        query = shingles(normalized)
+        overlaps = Counter(key for shingle in query for key in self._postings.get(shingle, ()))
+        for key, shared in overlaps.most_common():
+            union = len(query) + len(self._entries[key]["shingles"]) - shared
+            if shared / union >= self.similarity:
+                return key
+        return None
+
+class RejectionIndexCache:
+    """Per-worker LRU of indexes by scope ('user:<id>' or 'session:<id>')"""
+
+    def __init__(self, max_scopes: int):
+        self.max_scopes = max_scopes
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scope: str) -> RejectionIndex:
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None:
+                index = self._indexes[scope] = RejectionIndex()
+                while len(self._indexes) > self.max_scopes:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(scope)
+            return index
+
+rejection_indexes = RejectionIndexCache(REJECTION_INDEX_CACHE_SIZE)
@@ -0,0 +1,273 @@
+# repo_checkout.py
+import base64
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import requests
+
+# Where repository snapshots are kept, and how much disk they may use before
+# the least recently used ones are deleted
+GIT_CHECKOUT_DIR = os.getenv("GIT_CHECKOUT_DIR", os.path.join(tempfile.gettempdir(), "codereview-checkouts"))
+GIT_CHECKOUT_MAX_BYTES = int(os.getenv("GIT_CHECKOUT_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+GIT_CHECKOUT_TIMEOUT = float(os.getenv("GIT_CHECKOUT_TIMEOUT", "300"))
+# A review's lease keeps its snapshot from eviction; leases older than this belong to crashed workers
+GIT_CHECKOUT_LEASE_SECONDS = float(os.getenv("GIT_CHECKOUT_LEASE_SECONDS", str(6 * 60 * 60)))
+SIZE_SUFFIX = ".bytes"
+LEASE_PREFIX = ".lease-"
+
+def tree_size(path: str) -> int:
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def git_auth_env(token: str | None) -> dict:
+    """Environment for git with the token as an HTTP header, kept out of the URL and argv"""
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    if token:
+        credentials = base64.b64encode(f"x-access-token:{token}".encode("utf-8")).decode("ascii")
+        env.update({
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+        })
+    return env
+
+def shallow_clone(clone_url: str, commit_sha: str, target: str, token: str | None = None):
+    """Fetch only commit_sha (depth 1) from clone_url, a URL or a local repository path, into target"""
+    env = git_auth_env(token)
+    commands = [
+        ["git", "init", "-q", target],
+        ["git", "-C", target, "fetch", "-q", "--depth", "1", clone_url, commit_sha],
+        ["git", "-C", target, "-c", "advice.detachedHead=false", "checkout", "-q", "FETCH_HEAD"],
+    ]
+    for command in commands:
+        result = subprocess.run(command, env=env, capture_output=True, text=True, timeout=GIT_CHECKOUT_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"git {command[3] if command[1] == '-C' else command[1]} failed: {result.stderr.strip()}")
+    # Only the files are read; drop the object store
+    shutil.rmtree(os.path.join(target, ".git"), ignore_errors=True)
+
+def download_tarball(archive_url: str, target: str):
+    """
+    Download a tarball (GitHub's archive link, already authorized) and extract
+    its regular files into target, without the top-level directory
+    """
+    with requests.get(archive_url, stream=True, timeout=GIT_CHECKOUT_TIMEOUT) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+            for member in archive:
+                # "owner-repo-sha/path/to/file" -> "path/to/file"; links and devices are skipped
+                parts = member.name.split("/", 1)
+                if not member.isfile() or len(parts) < 2:
+                    continue
+                path = os.path.normpath(os.path.join(target, parts[1]))
+                if not path.startswith(target + os.sep):
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with archive.extractfile(member) as source, open(path, "wb") as destination:
+                    shutil.copyfileobj(source, destination)
+
+def check_commit_sha(commit_sha: str):
+    if not commit_sha.isalnum():
+        raise ValueError(f"Invalid commit SHA: {commit_sha}")
+
+class RepoCheckoutCache:
+    """
+    Repository snapshots on local disk, one directory per commit SHA, so a
+    review reads all its files locally after a single download instead of
+    one contents API call per file. A commit's files never change, so
+    snapshots stay valid until evicted, least recently used first, once
+    their total size passes max_bytes; snapshots pinned by a running review
+    are skipped. Safe across threads and worker processes sharing the
+    directory: snapshots are built aside and renamed into place, and pins
+    are lease files next to them.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._locks = {}  # commit SHA -> Lock, so one thread downloads while the others wait
+        self._locks_lock = threading.Lock()
+        self.counters = {"hits": 0, "downloads": 0, "evictions": 0}
+
+    def path(self, commit_sha: str) -> str:
+        return os.path.join(self.root, commit_sha)
+
+    def checkout(self, commit_sha: str, fetch) -> str:
+        """
+        Directory holding the repository at commit_sha; on a miss, fetch(target)
+        fills a fresh directory (shallow_clone or download_tarball). Pin the
+        commit first to keep the snapshot for longer than this call.
+        """
+        check_commit_sha(commit_sha)
+        path = self.path(commit_sha)
+        with self._locks_lock:
+            lock = self._locks.setdefault(commit_sha, threading.Lock())
+        with lock:
+            if os.path.isdir(path):
+                self.counters["hits"] += 1
+                os.utime(path)  # Mark as recently used
+                return path
+
+            os.makedirs(self.root, exist_ok=True)
+            staging = os.path.join(self.root, f".tmp-{commit_sha}-{uuid.uuid4().hex}")
+            try:
+                os.makedirs(staging)
+                fetch(staging)
+                with open(staging + SIZE_SUFFIX, "w") as f:
+                    f.write(str(tree_size(staging)))
+                os.replace(staging + SIZE_SUFFIX, path + SIZE_SUFFIX)
+                try:
+                    os.rename(staging, path)
+                except OSError:
+                    # Another worker process finished the same commit first
+                    if not os.path.isdir(path):
+                        raise
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            self.counters["downloads"] += 1
+
+        self.evict(keep=commit_sha)
+        return path
+
+    def pin(self, commit_sha: str) -> str:
+        """Keep commit_sha's snapshot from eviction by any worker until unpin(lease)"""
+        check_commit_sha(commit_sha)
+        os.makedirs(self.root, exist_ok=True)
+        lease = os.path.join(self.root, f"{LEASE_PREFIX}{commit_sha}-{uuid.uuid4().hex}")
+        open(lease, "w").close()
+        return lease
+
+    def unpin(self, lease: str):
+        try:
+            os.remove(lease)
+        except FileNotFoundError:
+            pass
+
+    def pinned(self) -> set:
+        """Commit SHAs with a live lease"""
+        if not os.path.isdir(self.root):
+            return set()
+        cutoff = time.time() - GIT_CHECKOUT_LEASE_SECONDS
+        commits = set()
+        for name in os.listdir(self.root):
+            if not name.startswith(LEASE_PREFIX):
+                continue
+            try:
+                if os.stat(os.path.join(self.root, name)).st_mtime >= cutoff:
+                    commits.add(name[len(LEASE_PREFIX):].rsplit("-", 1)[0])
+            except OSError:
+                pass
+        return commits
+
+    def read_file(self, commit_sha: str, file_path: str) -> str:
+        """
+        A regular file of the snapshot. Symlinks are refused, as is any path
+        that resolves outside the snapshot, so a repository can't make the
+        review read files of the host.
+        """
+        root = os.path.realpath(self.path(commit_sha))
+        path = os.path.join(root, file_path)
+        if not os.path.realpath(path).startswith(root + os.sep):
+            raise ValueError(f"Invalid file path: {file_path}")
+        try:
+            if not stat.S_ISREG(os.lstat(path).st_mode):
+                raise ValueError(f"{file_path} is not a regular file")
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Don't put the local path in the review error
+            raise FileNotFoundError(f"{file_path} not found at commit {commit_sha}") from None
+
+    def entries(self) -> list:
+        """[(last used, size, commit SHA)] of the snapshots on disk, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or name.endswith(SIZE_SUFFIX) or not os.path.isdir(path):
+                continue
+            try:
+                with open(path + SIZE_SUFFIX) as f:
+                    size = int(f.read())
+                entries.append((os.stat(path).st_mtime, size, name))
+            except (OSError, ValueError):
+                entries.append((os.stat(path).st_mtime, tree_size(path), name))
+        return sorted(entries)
+
+    def evict(self, keep: str | None = None):
+        """Delete least recently used snapshots, except pinned ones, until the total fits max_bytes"""
+        self.remove_abandoned()
+        entries = self.entries()
+        pinned = self.pinned()
+        total = sum(size for _, size, _ in entries)
+        for _, size, commit_sha in entries:
+            if total <= self.max_bytes:
+                break
+            if commit_sha == keep or commit_sha in pinned:
+                continue
+            with self._locks_lock:
+                lock = self._locks.setdefault(commit_sha, threading.Lock())
+            # A snapshot being downloaded or checked out in this process is skipped this round
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                # Renamed first so readers in other processes never see a half-deleted tree
+                doomed = os.path.join(self.root, f".evict-{commit_sha}-{uuid.uuid4().hex}")
+                os.rename(self.path(commit_sha), doomed)
+                shutil.rmtree(doomed, ignore_errors=True)
+                try:
+                    os.remove(self.path(commit_sha) + SIZE_SUFFIX)
+                except OSError:
+                    pass
+                total -= size
+                self.counters["evictions"] += 1
+            except OSError:
+                pass
+            finally:
+                lock.release()
+
+    def remove_abandoned(self):
+        """Delete staging and eviction leftovers and leases of crashed workers"""
+        cutoff = time.time() - 2 * GIT_CHECKOUT_TIMEOUT
+        lease_cutoff = time.time() - GIT_CHECKOUT_LEASE_SECONDS
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                modified = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if (name.startswith((".tmp-", ".evict-")) and modified < cutoff) or (
+                    name.startswith(LEASE_PREFIX) and modified < lease_cutoff):
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {
+            **self.counters,
+            "snapshots": len(entries),
+            "pinned": len(self.pinned()),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+repo_checkouts = RepoCheckoutCache(GIT_CHECKOUT_DIR, GIT_CHECKOUT_MAX_BYTES)
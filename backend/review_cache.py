@@ -0,0 +1,173 @@
+# review_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import ReviewCacheEntry
+
+REVIEW_CACHE_MAX_ENTRIES = int(os.getenv("REVIEW_CACHE_MAX_ENTRIES", "512"))
+REVIEW_CACHE_MAX_BYTES = int(os.getenv("REVIEW_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+REVIEW_CACHE_TTL_SECONDS = int(os.getenv("REVIEW_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# Rows kept in review_cache; older ones are pruned every REVIEW_CACHE_PRUNE_EVERY stores per worker
+REVIEW_CACHE_MAX_ROWS = int(os.getenv("REVIEW_CACHE_MAX_ROWS", "20000"))
+REVIEW_CACHE_PRUNE_EVERY = int(os.getenv("REVIEW_CACHE_PRUNE_EVERY", "100"))
+
+def normalize_code(code: str) -> str:
+    """
+    Normalize code so cosmetic differences (line endings, trailing whitespace,
+    surrounding blank lines) map to the same cache entry
+    """
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+def make_review_cache_key(code: str, language: str, prompt_version: str, user_context: str) -> str:
+    """
+    Build the content-addressed key for a review: hash of
+    (normalized code, language, prompt version, user-context digest)
+    """
+    context_digest = hashlib.sha256(user_context.encode("utf-8")).hexdigest()
+    payload = json.dumps(
+        [normalize_code(code), language.lower(), prompt_version, context_digest],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ReviewCache:
+    """
+    Two-tier cache of parsed review suggestions: an in-process LRU with TTL and
+    entry/byte limits in front of the persistent review_cache table
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int, max_rows: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._entries = OrderedDict()  # key -> (stored_at, size, suggestions)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+            "pruned": 0,
+        }
+        self._stores_since_prune = 0
+
+    async def get(self, key: str, db: AsyncSession) -> Optional[List[dict]]:
+        suggestions = self._get_memory(key)
+        if suggestions is not None:
+            return suggestions
+
+        result = await db.execute(select(ReviewCacheEntry).where(ReviewCacheEntry.cache_key == key))
+        entry = result.scalars().first()
+        if entry and entry.created_at and entry.created_at >= datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            with self._lock:
+                self.counters["db_hits"] += 1
+            self._put_memory(key, entry.suggestions)
+            return entry.suggestions
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, suggestions: List[dict], language: str, db: AsyncSession):
+        """
+        Stage the DB row (plus a periodic prune); the caller's commit persists
+        it, then remember() adds it to memory
+        """
+        # Upsert: a concurrent review of the same code may store the same key first
+        statement = pg_insert(ReviewCacheEntry).values(
+            cache_key=key,
+            language=language,
+            suggestions=suggestions,
+            created_at=datetime.utcnow()
+        )
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[ReviewCacheEntry.cache_key],
+            set_={"suggestions": statement.excluded.suggestions, "created_at": statement.excluded.created_at}
+        ))
+        with self._lock:
+            self.counters["stores"] += 1
+            self._stores_since_prune += 1
+            prune = self._stores_since_prune >= REVIEW_CACHE_PRUNE_EVERY
+            if prune:
+                self._stores_since_prune = 0
+        if prune:
+            await self.prune(db)
+
+    def remember(self, key: str, suggestions: List[dict]):
+        """Add a committed entry to the memory tier"""
+        self._put_memory(key, suggestions)
+
+    async def prune(self, db: AsyncSession):
+        """Delete expired rows and everything beyond the newest max_rows"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        expired = await db.execute(delete(ReviewCacheEntry).where(ReviewCacheEntry.created_at < cutoff))
+        overflow = (
+            select(ReviewCacheEntry.cache_key)
+            .order_by(ReviewCacheEntry.created_at.desc())
+            .offset(self.max_rows)
+            .scalar_subquery()
+        )
+        evicted = await db.execute(delete(ReviewCacheEntry).where(ReviewCacheEntry.cache_key.in_(overflow)))
+        with self._lock:
+            self.counters["pruned"] += expired.rowcount + evicted.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["db_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hits": hits,
+                "hit_rate": (hits / lookups * 100) if lookups else 0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "max_rows": self.max_rows,
+            }
+
+    def _get_memory(self, key: str) -> Optional[List[dict]]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            stored_at, size, suggestions = item
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._bytes -= size
+                self.counters["expired"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return suggestions
+
+    def _put_memory(self, key: str, suggestions: List[dict]):
+        size = len(json.dumps(suggestions, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic(), size, suggestions)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.counters["evictions"] += 1
+
+review_cache = ReviewCache(REVIEW_CACHE_MAX_ENTRIES, REVIEW_CACHE_MAX_BYTES, REVIEW_CACHE_TTL_SECONDS, REVIEW_CACHE_MAX_ROWS)
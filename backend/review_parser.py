@@ -0,0 +1,304 @@
+# review_parser.py
+import json
+import os
+import re
+from error_categorizer import categorize_error, categorize_errors, CATEGORY_KEYWORDS, LANGUAGE_KEYWORDS, DEFAULT_CATEGORY
+
+# "json" asks Gemini for schema-constrained JSON, "markdown" keeps the delimited text format
+REVIEW_OUTPUT_FORMAT = os.getenv("REVIEW_OUTPUT_FORMAT", "json").lower()
+
+SEVERITIES = ["High", "Medium", "Low"]
+ERROR_CATEGORIES = (
+    list(CATEGORY_KEYWORDS) + [category for category, _ in LANGUAGE_KEYWORDS.values()] + [DEFAULT_CATEGORY]
+)
+
+SUGGESTION_DELIMITER = re.compile(r'--- SUGGESTION \d+ ---')
+LINE_REFERENCE = re.compile(r'(\*\*Line\(s\):\*\*)([^\n]*)')
+IMPROVED_CODE = re.compile(r'\*\*Improved Code[^\n]*?:\*\*\s*```[^\n]*\n(.*?)\n?```', re.DOTALL)
+
+def shift_line_references(block: str, line_offset: int) -> str:
+    """Add line_offset to the numbers in a markdown block's Line(s) field"""
+    if not line_offset:
+        return block
+    return LINE_REFERENCE.sub(
+        lambda m: m.group(1) + re.sub(r'\d+', lambda n: str(int(n.group()) + line_offset), m.group(2)),
+        block,
+        count=1
+    )
+
+def text_line_range(text: str) -> tuple[int, int] | None:
+    """(first, last) line of a markdown block's Line(s) field, None for general suggestions"""
+    match = LINE_REFERENCE.search(text)
+    numbers = [int(n) for n in re.findall(r'\d+', match.group(2))] if match else []
+    return (min(numbers), max(numbers)) if numbers else None
+
+def parse_suggestion_block(block: str, index: int, error_category: str) -> dict:
+    """
+    Turn one raw suggestion block into the cached/base suggestion shape
+    """
+    severity_match = re.search(r'\*\*Severity:\*\*\s*(High|Medium|Low)', block)
+    severity = severity_match.group(1) if severity_match else "Medium"
+    line_start, line_end = text_line_range(block) or (None, None)
+    improved_code = IMPROVED_CODE.search(block)
+
+    return {
+        "id": index + 1,
+        "text": block,
+        "severity": severity,
+        "error_category": error_category,
+        "line_start": line_start,
+        "line_end": line_end,
+        "improved_code": improved_code.group(1) if improved_code and improved_code.group(1).strip() else None
+    }
+
+def clean_review_block(block: str, rejected_texts: set, line_offset: int = 0) -> str | None:
+    block = shift_line_references(block.strip(), line_offset)
+    if not block:
+        return None
+    # Check if this suggestion was previously rejected
+    if block in rejected_texts:
+        print(f"DEBUG: Skipping previously rejected suggestion: {block[:100]}...")
+        return None
+    return block
+
+def parse_review_blocks(blocks: list, first_index: int, language: str, rejected_texts: set, line_offset: int = 0) -> list:
+    """
+    Parse consecutive raw blocks; ids follow block position so batch and
+    streamed parsing agree. All blocks are categorized in one scan.
+    """
+    kept = []
+    for i, block in enumerate(blocks):
+        block = clean_review_block(block, rejected_texts, line_offset)
+        if block:
+            kept.append((first_index + i, block))
+    categories = categorize_errors([block for _, block in kept], language)
+    return [parse_suggestion_block(block, index, category) for (index, block), category in zip(kept, categories)]
+
+def render_structured_suggestion(obj: dict, language: str) -> str:
+    """
+    Render a schema suggestion as the same markdown the text format produces,
+    so the frontend and rejected-suggestion matching see one shape
+    """
+    line_start, line_end = obj.get("line_start"), obj.get("line_end")
+    if not line_start:
+        lines = "General"
+    elif not line_end or line_end == line_start:
+        lines = str(line_start)
+    else:
+        lines = f"{line_start}-{line_end}"
+
+    text = (
+        f"- **Line(s):** {lines}\n"
+        f"- **Severity:** {obj.get('severity')}\n"
+        f"- **Issue:** {(obj.get('issue') or '').strip()}"
+    )
+    improved_code = (obj.get("improved_code") or "").strip("\n")
+    if improved_code.strip():
+        text += f"\n- **Improved Code (if applicable):** ```{language}\n{improved_code}\n```"
+    return text
+
+def parse_structured_suggestion(obj, index: int, language: str, rejected_texts: set, line_offset: int = 0) -> dict | None:
+    if not isinstance(obj, dict) or not (obj.get("issue") or "").strip():
+        return None
+    severity = str(obj.get("severity") or "").capitalize()
+    line_start, line_end = (
+        obj.get(field) + line_offset if isinstance(obj.get(field), int) and obj.get(field) > 0 else None
+        for field in ("line_start", "line_end")
+    )
+    if line_start is None:
+        line_end = None
+    elif line_end is None or line_end < line_start:
+        line_end = line_start
+    improved_code = (obj.get("improved_code") or "").strip("\n")
+    obj = {
+        **obj,
+        "severity": severity if severity in SEVERITIES else "Medium",
+        "line_start": line_start,
+        "line_end": line_end,
+        "improved_code": improved_code if improved_code.strip() else None
+    }
+    text = render_structured_suggestion(obj, language)
+    if text in rejected_texts:
+        print(f"DEBUG: Skipping previously rejected suggestion: {text[:100]}...")
+        return None
+    category = obj.get("category")
+    return {
+        "id": index + 1,
+        "text": text,
+        "severity": obj["severity"],
+        "error_category": category if category in ERROR_CATEGORIES else categorize_error(text, language),
+        "line_start": line_start,
+        "line_end": line_end,
+        "improved_code": obj["improved_code"]
+    }
+
+def parse_review_output(raw_output: str, language: str, rejected_texts: set,
+                        output_format: str = REVIEW_OUTPUT_FORMAT, line_offset: int = 0) -> list:
+    if output_format == "json" and raw_output.lstrip().startswith("["):
+        # Reuse the incremental parser so a truncated array still yields its complete objects
+        parser = StructuredStreamParser(language, rejected_texts, line_offset)
+        return parser.feed(raw_output) + parser.close()
+
+    suggestion_blocks = SUGGESTION_DELIMITER.split(raw_output.strip())
+    return parse_review_blocks(suggestion_blocks, 0, language, rejected_texts, line_offset)
+
+class SuggestionStreamParser:
+    """
+    Incrementally split streamed model output on the suggestion delimiter.
+    A block is complete once the delimiter after it has arrived; block
+    indexes match parse_review_output so suggestion ids are identical.
+    """
+
+    def __init__(self, language: str, rejected_texts: set, line_offset: int = 0):
+        self.language = language
+        self.rejected_texts = rejected_texts
+        self.line_offset = line_offset
+        self._buffer = ""
+        self._index = 0
+
+    def feed(self, text: str) -> list:
+        self._buffer += text
+        parts = SUGGESTION_DELIMITER.split(self._buffer)
+        self._buffer = parts.pop()
+        return self._parse(parts)
+
+    def close(self) -> list:
+        parts = [self._buffer]
+        self._buffer = ""
+        return self._parse(parts)
+
+    def _parse(self, blocks: list) -> list:
+        parsed = parse_review_blocks(blocks, self._index, self.language, self.rejected_texts, self.line_offset)
+        self._index += len(blocks)
+        return parsed
+
+class StructuredStreamParser:
+    """
+    Incrementally decode a streamed JSON array of suggestions. Each object
+    is emitted as soon as it is complete; an unterminated trailing object
+    (e.g. output cut off at the token limit) is dropped on close.
+    """
+
+    def __init__(self, language: str, rejected_texts: set, line_offset: int = 0):
+        self.language = language
+        self.rejected_texts = rejected_texts
+        self.line_offset = line_offset
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._index = 0
+
+    def feed(self, text: str) -> list:
+        self._buffer += text
+        parsed = []
+        while True:
+            self._buffer = self._buffer.lstrip(" \t\r\n[,")
+            if not self._buffer.startswith("{"):
+                break
+            try:
+                obj, end = self._decoder.raw_decode(self._buffer)
+            except ValueError:
+                break  # object not complete yet
+            self._buffer = self._buffer[end:]
+            item = parse_structured_suggestion(obj, self._index, self.language, self.rejected_texts, self.line_offset)
+            self._index += 1
+            if item:
+                parsed.append(item)
+        return parsed
+
+    def close(self) -> list:
+        self._buffer = ""
+        return []
+
+def complete_json_prefix(partial: str) -> tuple[str, int]:
+    """Longest prefix of a JSON suggestion array that ends on a complete object, and its object count"""
+    decoder = json.JSONDecoder()
+    pos = end = count = 0
+    while True:
+        while pos < len(partial) and partial[pos] in " \t\r\n[,":
+            pos += 1
+        if pos >= len(partial) or partial[pos] != "{":
+            break
+        try:
+            _, pos = decoder.raw_decode(partial, pos)
+        except ValueError:
+            break
+        end = pos
+        count += 1
+    return partial[:end], count
+
+def resume_review_output(partial: str, output_format: str = REVIEW_OUTPUT_FORMAT) -> tuple[str, str]:
+    """
+    Cut a review truncated at MAX_TOKENS back to its last complete suggestion
+    and build the follow-up instruction. The continuation is appended as-is:
+    parse_review_output reads the stitched JSON arrays / delimited blocks
+    as one sequence.
+    """
+    if output_format == "json":
+        kept, count = complete_json_prefix(partial)
+        return kept, (
+            f"Your previous response was cut off after {count} complete suggestions. "
+            "Return a JSON array with only the remaining suggestions, without repeating earlier ones."
+        )
+
+    delimiters = list(SUGGESTION_DELIMITER.finditer(partial))
+    if not delimiters:
+        return "", ""
+    kept = partial[:delimiters[-1].start()]
+    count = sum(1 for block in SUGGESTION_DELIMITER.split(kept) if block.strip())
+    return kept, (
+        f"Your previous response was cut off after {count} complete suggestions. "
+        f"Continue with the remaining suggestions only, starting with '--- SUGGESTION {count + 1} ---' "
+        "and using the same format."
+    )
+
+def make_stream_parser(language: str, rejected_texts: set, output_format: str = REVIEW_OUTPUT_FORMAT):
+    if output_format == "json":
+        return StructuredStreamParser(language, rejected_texts)
+    return SuggestionStreamParser(language, rejected_texts)
+
+def suggestion_dedupe_key(item: dict) -> str:
+    """Category plus the normalized issue text, ignoring where in the file it was found"""
+    issue_match = re.search(r'\*\*Issue:\*\*\s*(.+)', item["text"])
+    issue = issue_match.group(1) if issue_match else LINE_REFERENCE.sub("", item["text"])
+    return item["error_category"] + ":" + " ".join(re.sub(r'[^a-z0-9]+', " ", issue.lower()).split())
+
+class SuggestionMerger:
+    """
+    Merge suggestions from several chunk reviews into one list: repeats of the
+    same issue are dropped and ids are renumbered in the order items are added
+    """
+
+    def __init__(self):
+        self._seen = set()
+        self._next_id = 1
+
+    def add(self, items: list) -> list:
+        merged = []
+        for item in items:
+            key = suggestion_dedupe_key(item)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            merged.append({**item, "id": self._next_id})
+            self._next_id += 1
+        return merged
+
+
+def suggestion_line_range(item: dict) -> tuple[int, int] | None:
+    """(first, last) line a suggestion refers to, None for general suggestions"""
+    if "line_start" not in item:
+        # Parsed before suggestions carried their line range
+        return text_line_range(item["text"])
+    return (item["line_start"], item["line_end"]) if item["line_start"] else None
+
+def shift_suggestion(item: dict, line_offset: int) -> dict:
+    """Copy of a parsed suggestion moved down by line_offset lines"""
+    shifted = {**item, "text": shift_line_references(item["text"], line_offset)}
+    if item.get("line_start"):
+        shifted["line_start"] = item["line_start"] + line_offset
+        shifted["line_end"] = (item.get("line_end") or item["line_start"]) + line_offset
+    return shifted
+
+def sort_by_line(items: list) -> list:
+    """File order, general suggestions last; sort is stable within a line"""
+    return sorted(items, key=lambda item: (suggestion_line_range(item) or (float("inf"),))[0])
@@ -0,0 +1,160 @@
+# review_writes.py
+import asyncio
+import os
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import CodeBlob
+from code_blobs import code_blob_row
+
+# Tables with at least this many collected rows are written with COPY instead of multi-row INSERT
+REVIEW_COPY_MIN_ROWS = int(os.getenv("REVIEW_COPY_MIN_ROWS", "500"))
+# Repository reviews store finished files in groups of this many, one transaction per group
+REVIEW_FILES_PER_FLUSH = int(os.getenv("REVIEW_FILES_PER_FLUSH", "100"))
+
+def with_defaults(table, rows: list) -> list:
+    """
+    Fill in Python-side column defaults (created_at=datetime.utcnow etc.),
+    which COPY does not apply. Columns filled by the database are left out.
+    """
+    defaults = [
+        column for column in table.columns
+        if column.default is not None and not column.default.is_sequence and not column.primary_key
+    ]
+    completed = []
+    for row in rows:
+        row = dict(row)
+        for column in defaults:
+            if column.key not in row:
+                default = column.default
+                row[column.key] = default.arg(None) if default.is_callable else default.arg
+        completed.append(row)
+    return completed
+
+async def store_code_blobs(db: AsyncSession, blobs: list):
+    """Insert code_blobs rows (from code_blob_row); content already stored is skipped"""
+    if blobs:
+        # Sorted so concurrent writers take the key locks in the same order
+        await db.execute(
+            pg_insert(CodeBlob).on_conflict_do_nothing(index_elements=[CodeBlob.sha256]),
+            sorted(blobs, key=lambda blob: blob["sha256"])
+        )
+
+class ReviewWriteBatch:
+    """
+    Rows of a review (AISuggestion, SuggestionLatency, RepoFile),
+    collected as dicts and written per table in one statement: a multi-row
+    INSERT (executemany in insertmanyvalues mode), or COPY for large batches.
+    Source texts go to code_blobs once per distinct content.
+    """
+
+    def __init__(self, copy_min_rows: int = REVIEW_COPY_MIN_ROWS):
+        self.copy_min_rows = copy_min_rows
+        self._rows = {}  # model -> [row dict], in insertion order
+        self._blobs = {}  # sha256 -> code_blobs row
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self._rows.values())
+
+    def add(self, model, **values):
+        self._rows.setdefault(model, []).append(values)
+
+    def extend(self, model, rows: list):
+        self._rows.setdefault(model, []).extend(rows)
+
+    def merge(self, other: "ReviewWriteBatch"):
+        """Take over another batch's rows and code blobs"""
+        for model, rows in other._rows.items():
+            self.extend(model, rows)
+        for sha256, blob in other._blobs.items():
+            self._blobs.setdefault(sha256, blob)
+        other._rows, other._blobs = {}, {}
+
+    def add_code(self, text: str) -> str:
+        """Queue a source text for code_blobs; returns the sha256 rows reference it by"""
+        blob = code_blob_row(text)
+        self._blobs.setdefault(blob["sha256"], blob)
+        return blob["sha256"]
+
+    async def flush(self, db: AsyncSession):
+        """Stage every collected row in the caller's transaction; the caller commits"""
+        rows_by_model, self._rows = self._rows, {}
+        blobs, self._blobs = self._blobs, {}
+        await store_code_blobs(db, list(blobs.values()))
+        for model, rows in rows_by_model.items():
+            if not rows:
+                continue
+            if len(rows) >= self.copy_min_rows and db.bind.dialect.driver == "asyncpg":
+                await copy_rows(db, model.__table__, rows)
+            else:
+                await db.execute(insert(model), rows)
+
+class ReviewWriteQueue:
+    """
+    Finished files of a repository review, stored in groups: the rows of
+    files_per_flush files go into one ReviewWriteBatch and one transaction,
+    so a large review's AISuggestion rows reach the COPY threshold. Groups
+    are written one at a time in the background, so file tasks (and their
+    timeouts) don't wait on the database. A group is stored whole or not at
+    all; call close() before answering and report the files in `failed`.
+    """
+
+    def __init__(self, session_factory, files_per_flush: int = REVIEW_FILES_PER_FLUSH,
+                 copy_min_rows: int = REVIEW_COPY_MIN_ROWS):
+        self.session_factory = session_factory
+        self.files_per_flush = files_per_flush
+        self.copy_min_rows = copy_min_rows
+        self.failed = {}  # key -> error message, for files whose group could not be stored
+        self._pending = []  # (key, ReviewWriteBatch, stage)
+        self._lock = asyncio.Lock()
+        self._tasks = set()
+
+    def add(self, key: str, writes: ReviewWriteBatch, stage):
+        """
+        Queue a file's batch rows, and stage(db), which stages its other rows
+        (session, snapshot, rollup) in the group's transaction
+        """
+        self._pending.append((key, writes, stage))
+        if len(self._pending) >= self.files_per_flush:
+            group, self._pending = self._pending, []
+            task = asyncio.create_task(self._write(group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Wait for the groups being written, then write the rest"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks))
+        group, self._pending = self._pending, []
+        if group:
+            await self._write(group)
+
+    async def _write(self, group: list):
+        # One group at a time: the rollup upserts of two groups would lock rows in different orders
+        async with self._lock:
+            writes = ReviewWriteBatch(self.copy_min_rows)
+            async with self.session_factory() as db:
+                try:
+                    for _, file_writes, stage in group:
+                        writes.merge(file_writes)
+                        await stage(db)
+                    await writes.flush(db)
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    print(f"Could not store {len(group)} reviewed files: {str(e)}")
+                    for key, _, _ in group:
+                        self.failed[key] = str(e)
+
+async def copy_rows(db: AsyncSession, table, rows: list):
+    """COPY rows into table on the session's own connection, inside its transaction"""
+    rows = with_defaults(table, rows)
+    keys = set().union(*rows)
+    columns = [column for column in table.columns if column.key in keys]
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        table.name,
+        records=[tuple(row.get(column.key) for column in columns) for row in rows],
+        columns=[column.name for column in columns]
+    )
@@ -100,6 +100,39 @@ class ModifySuggestion(BaseModel):
     file_path: Optional[str] = None
     user_id: Optional[int] = None  # Add user_id field
 
+class FeedbackDecision(BaseModel):
+    suggestion_id: int
+    action: str  # 'accept', 'reject' or 'modify'
+    suggestion_text: str  # For 'modify', the original suggestion text
+    language: str
+    file_path: Optional[str] = None
+    modified_text: Optional[str] = None  # Required for 'modify'
+    reject_reason: Optional[str] = None  # For 'reject'
+    original_code: Optional[str] = None  # For 'accept': code to apply the suggestion to
+
+    @validator('action')
+    def validate_action(cls, v):
+        if v not in ['accept', 'reject', 'modify']:
+            raise ValueError('Action must be either "accept", "reject" or "modify"')
+        return v
+
+    @validator('modified_text', always=True)
+    def validate_modified_text(cls, v, values):
+        if values.get('action') == 'modify' and not v:
+            raise ValueError('modified_text is required to modify a suggestion')
+        return v
+
+class BatchFeedback(BaseModel):
+    session_id: str
+    user_id: Optional[int] = None
+    decisions: List[FeedbackDecision]
+
+    @validator('decisions')
+    def validate_decisions(cls, v):
+        if not v:
+            raise ValueError('At least one decision must be provided')
+        return v
+
 class AnalyticsFilter(BaseModel):
     user_id: Optional[int] = None
     language: Optional[str] = None
@@ -9,19 +9,23 @@ load_dotenv()
 # Import the app instance and all routes using absolute imports
 from app import app
 from auth_routes import signup, login
-from suggestion_routes import generate_suggestions, accept_suggestion, reject_suggestion, modify_suggestion
+from suggestion_routes import generate_suggestions, generate_suggestions_stream, accept_suggestion, reject_suggestion, modify_suggestion, batch_feedback, get_review_cache_stats, get_blob_review_stats, get_followup_cache_stats, get_followup_job, stream_followup_job, get_followup_job_stats
 from analytics_routes import get_suggestions_stats, get_detection_accuracy, get_latency_stats, get_learning_effectiveness, get_trends_stats, get_error_types, debug_analytics_data, get_error_categories
 from google_oauth_routes import google_auth, google_auth_callback
-from git_routes import get_repo_contents, review_repo_files
+from git_routes import get_repo_contents, review_repo_files, get_repo_checkout_stats
 from admin_routes import get_all_users, get_user_by_id, get_developers
 
 # Add the routes to the app
 app.post("/signup")(signup)
 app.post("/login")(login)
 app.post("/generate-suggestions")(generate_suggestions)
+app.post("/generate-suggestions/stream")(generate_suggestions_stream)
 app.post("/accept-suggestion")(accept_suggestion)
 app.post("/reject-suggestion")(reject_suggestion)
 app.post("/modify-suggestion")(modify_suggestion)
+app.post("/feedback/batch")(batch_feedback)
+app.get("/followup-jobs/{job_id}")(get_followup_job)
+app.get("/followup-jobs/{job_id}/stream")(stream_followup_job)
 app.post("/analytics/suggestions")(get_suggestions_stats)
 app.post("/analytics/detection-accuracy")(get_detection_accuracy)
 app.post("/analytics/latency")(get_latency_stats)
@@ -41,6 +45,11 @@ app.get("/admin/developers")(get_developers)
 
 # Debug route
 app.get("/debug/analytics")(debug_analytics_data)
+app.get("/debug/review-cache")(get_review_cache_stats)
+app.get("/debug/blob-reviews")(get_blob_review_stats)
+app.get("/debug/followup-cache")(get_followup_cache_stats)
+app.get("/debug/followup-jobs")(get_followup_job_stats)
+app.get("/debug/repo-checkouts")(get_repo_checkout_stats)
 
 # Add CORS middleware
 app.add_middleware(
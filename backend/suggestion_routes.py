@@ -1,121 +1,126 @@
 # suggestion_routes.py
 from fastapi import Depends, HTTPException
-from sqlalchemy.orm import Session
-import re
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, insert, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import os
+import json
 import asyncio
-from database import get_db, CodeSession, AISuggestion, AcceptedSuggestion, RejectedSuggestion, ModifiedSuggestion, UserPattern, SuggestionLatency
-from schemas import CodeInput, AcceptSuggestion, RejectSuggestion, ModifySuggestion
-from ai_utils import call_gemini_api
-from utils import summarize_user_patterns
+from database import get_async_db, AsyncSessionLocal, CodeBlob, CodeSession, ReviewSnapshot, AISuggestion, AcceptedSuggestion, RejectedSuggestion, ModifiedSuggestion, UserPattern, SuggestionLatency
+from schemas import CodeInput, AcceptSuggestion, RejectSuggestion, ModifySuggestion, BatchFeedback
+from ai_utils import call_gemini_api, stream_gemini_api, GENERATION_CONFIG
+from llm_scheduler import llm_scheduler, PRIORITY_INTERACTIVE, PRIORITY_FEEDBACK
+from review_cache import review_cache, make_review_cache_key
+from followup_cache import followup_cache, make_followup_cache_key
+from followup_jobs import followup_jobs, new_job, FollowupReservation, FINISHED_STATUSES
+from analytics_rollup import RollupBatch, session_owner
+from code_chunker import split_code
+from review_parser import (
+    REVIEW_OUTPUT_FORMAT, SEVERITIES, ERROR_CATEGORIES, parse_review_output, resume_review_output, make_stream_parser,
+    SuggestionMerger, suggestion_line_range, sort_by_line, shift_suggestion
+)
+from code_patch import apply_patch
+from code_diff import diff_code, overlaps, review_windows
+from rejection_index import RejectionIndex, rejection_indexes, REJECTION_INDEX_MAX_ENTRIES
+from review_writes import ReviewWriteBatch, ReviewWriteQueue, store_code_blobs
+from code_blobs import code_blob_row, decompress_code
+from blob_reviews import blob_reviews, BLOB_REVIEW_CONTEXT
+from preference_profile import profile_scope, load_profile_summary, update_profiles, remember_profiles
 from datetime import datetime
 import time
 
-def categorize_error(suggestion_text: str, language: str) -> str:
-    """
-    Categorize the error type based on suggestion text and language
-    """
-    text = suggestion_text.lower()
-    
-    # Syntax errors
-    if any(keyword in text for keyword in ['syntax', 'parse', 'invalid syntax', 'unexpected token', 
-                                          'missing parenthesis', 'unclosed', 'unexpected indent',
-                                          'indentation error', 'syntax error']):
-        return 'Syntax Error'
-    
-    # Runtime errors
-    elif any(keyword in text for keyword in ['runtime', 'exception', 'error', 'crash', 'undefined',
-                                           'null reference', 'type error', 'reference error',
-                                           'range error', 'not defined', 'is not defined']):
-        return 'Runtime Error'
-    
-    # Logical errors
-    elif any(keyword in text for keyword in ['logic', 'incorrect', 'wrong result', 'unexpected behavior',
-                                           'infinite loop', 'off by one', 'wrong calculation',
-                                           'incorrect condition', 'wrong variable']):
-        return 'Logical Error'
-    
-    # Performance issues
-    elif any(keyword in text for keyword in ['performance', 'slow', 'optimize', 'efficiency', 'memory',
-                                           'time complexity', 'space complexity', 'bottleneck',
-                                           'inefficient', 'leak', 'garbage collection']):
-        return 'Performance Issue'
-    
-    # Security issues
-    elif any(keyword in text for keyword in ['security', 'vulnerability', 'injection', 'xss', 'sql injection',
-                                           'cross-site', 'authentication', 'authorization', 'encryption',
-                                           'secure', 'unsafe', 'dangerous']):
-        return 'Security Issue'
-    
-    # Code style issues
-    elif any(keyword in text for keyword in ['style', 'formatting', 'indentation', 'naming convention',
-                                           'code style', 'readability', 'consistent', 'convention',
-                                           'pep8', 'lint', 'format']):
-        return 'Code Style'
-    
-    # Best practices
-    elif any(keyword in text for keyword in ['best practice', 'clean code', 'maintainability', 'readability',
-                                           'refactor', 'duplicate code', 'dry', 'single responsibility',
-                                           'separation of concerns', 'modular']):
-        return 'Best Practice'
-    
-    # Language-specific errors
-    elif language == 'python':
-        if any(keyword in text for keyword in ['import error', 'module not found', 'name error',
-                                             'attribute error', 'key error', 'value error',
-                                             'index error', 'indentation error']):
-            return 'Python Specific Error'
-    
-    elif language == 'javascript':
-        if any(keyword in text for keyword in ['typeerror', 'referenceerror', 'syntaxerror',
-                                             'rangeerror', 'evalerror', 'urierror']):
-            return 'JavaScript Specific Error'
-    
-    elif language == 'java':
-        if any(keyword in text for keyword in ['nullpointerexception', 'arrayindexoutofboundsexception',
-                                             'classcastexception', 'illegalargumentexception',
-                                             'stackoverflowerror', 'outofmemoryerror']):
-            return 'Java Specific Error'
-    
-    # Default category
-    return 'Other Issue'
+# Bump whenever the review prompt or output parsing changes so cached reviews are not reused
+PROMPT_VERSION = "3"
+# Same for the accept/modify follow-up prompts and the follow-up cache
+FOLLOWUP_PROMPT_VERSION = "1"
+# Longest a follow-up job poll is held open waiting for the result
+FOLLOWUP_JOB_MAX_WAIT_SECONDS = float(os.getenv("FOLLOWUP_JOB_MAX_WAIT_SECONDS", "30"))
+# Decisions accepted by one /feedback/batch request
+BATCH_FEEDBACK_MAX_DECISIONS = int(os.getenv("BATCH_FEEDBACK_MAX_DECISIONS", "500"))
 
-async def process_code_for_review(code: str, language: str, session_id: str, file_path: str | None, db: Session, user_id: int = None):
-    try:
-        # Store code session with user_id
-        code_session = CodeSession(
-            session_id=session_id,
-            user_id=user_id,  # Store the user_id
-            language=language,
-            code=code
-        )
-        db.add(code_session)
-
-        # Fetch user patterns for adaptive learning
-        recent_patterns = (
-            db.query(UserPattern)
-            .filter(UserPattern.session_id == session_id)
-            .order_by(UserPattern.created_at.desc())
-            .limit(10)
-            .all()
-        )
-        user_context = summarize_user_patterns(recent_patterns)
+# Chunks of one large file reviewed at once (each still queues in llm_scheduler)
+CODE_CHUNK_CONCURRENCY = int(os.getenv("CODE_CHUNK_CONCURRENCY", "4"))
+# Re-review only the changed hunks when a session resubmits edited code
+REVIEW_INCREMENTAL = os.getenv("REVIEW_INCREMENTAL", "1") == "1"
+INCREMENTAL_CONTEXT_LINES = int(os.getenv("INCREMENTAL_CONTEXT_LINES", "15"))
+# Above this share of the file in review windows, a full review is cheaper
+INCREMENTAL_MAX_WINDOW_RATIO = float(os.getenv("INCREMENTAL_MAX_WINDOW_RATIO", "0.6"))
 
-        # Fetch previously rejected suggestions for this session
-        rejected_suggestions = (
-            db.query(RejectedSuggestion.suggestion_text)
-            .filter(RejectedSuggestion.session_id == session_id)
-            .all()
-        )
-        rejected_texts = {item[0] for item in rejected_suggestions}
+REVIEW_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "line_start": {"type": "INTEGER", "nullable": True},
+            "line_end": {"type": "INTEGER", "nullable": True},
+            "severity": {"type": "STRING", "enum": SEVERITIES},
+            "category": {"type": "STRING", "enum": ERROR_CATEGORIES},
+            "issue": {"type": "STRING"},
+            "improved_code": {"type": "STRING", "nullable": True},
+        },
+        "required": ["severity", "category", "issue"],
+    },
+}
+
+REVIEW_JSON_CONFIG = {
+    **GENERATION_CONFIG,
+    "response_mime_type": "application/json",
+    "response_schema": REVIEW_RESPONSE_SCHEMA,
+}
+
+def review_generation_config(output_format: str = REVIEW_OUTPUT_FORMAT) -> dict:
+    return REVIEW_JSON_CONFIG if output_format == "json" else GENERATION_CONFIG
+
+def build_review_prompt(code: str, language: str, user_context: str, rejected_texts: RejectionIndex,
+                        output_format: str = REVIEW_OUTPUT_FORMAT, excerpt: dict | None = None) -> str:
+    if output_format == "json":
+        format_instructions = f"""For each suggestion, provide:
+        - line_start / line_end: the affected line range (null for general suggestions)
+        - severity: High, Medium, or Low based on the issue's impact or urgency
+        - category: the closest matching category
+        - issue: a concise description of the issue and why the change is beneficial
+        - improved_code: a short improved {language} snippet, or null if not applicable
+
+        Respond with a JSON array of suggestions only."""
+    else:
+        format_instructions = """For each suggestion, provide:
+        1. The specific line number(s) or code snippet where the issue occurs
+        2. A severity level (High, Medium, Low) based on the issue's impact or urgency
+        3. A clear description of the issue or improvement
+        4. An explanation of why the change is beneficial
+        5. A concise improved code snippet (if applicable)
+
+        Format each suggestion as follows:
+        - **Line(s):** {line number(s) or 'General' if not specific}
+        - **Severity:** {High, Medium, or Low}
+        - **Issue:** {description of the issue or improvement}
+        - **Improved Code (if applicable):** ```{language}\n{improved code}\n```
+
+        Return suggestions, each formatted as above, separated by '--- SUGGESTION {n} ---'."""
 
-        # Enhanced prompt with user context and instructions to avoid rejected items
-        prompt = f"""You are an expert {language} code reviewer. Analyze the following code and provide detailed, actionable suggestions for improvement.
+    excerpt_note = ""
+    if excerpt:
+        excerpt_note = f"""
+        NOTE: This code is lines {excerpt["start_line"]}-{excerpt["end_line"]} of a {excerpt["total_lines"]}-line file.
+        Review only this excerpt and number lines from 1 at its first line.
+"""
+        if excerpt.get("changed"):
+            relative = ", ".join(
+                f"{start - excerpt['start_line'] + 1}-{end - excerpt['start_line'] + 1}" for start, end in excerpt["changed"]
+            )
+            excerpt_note += f"""        Only lines {relative} of this excerpt changed since the last review. Report issues in those
+        lines only; the other lines are context.
+"""
+
+    # Enhanced prompt with user context and instructions to avoid rejected items
+    return f"""You are an expert {language} code reviewer. Analyze the following code and provide detailed, actionable suggestions for improvement.
 
         USER PREFERENCE CONTEXT (adapt your suggestions accordingly):
         {user_context}
 
         IMPORTANT: DO NOT suggest the following things again, as the user has explicitly rejected them:
-        {chr(10).join([f"- {s}" for s in rejected_texts]) if rejected_texts else "No previously rejected suggestions."}
+        {chr(10).join([f"- {s}" for s in rejected_texts.summary()]) if rejected_texts else "No previously rejected suggestions."}
 
         Focus on:
         - Code quality and best practices
@@ -124,83 +129,434 @@ async def process_code_for_review(code: str, language: str, session_id: str, fil
         - Potential bugs or edge cases
         - Security concerns if applicable
 
-        For each suggestion, provide:
-        1. The specific line number(s) or code snippet where the issue occurs
-        2. A severity level (High, Medium, Low) based on the issue's impact or urgency
-        3. A clear description of the issue or improvement
-        4. An explanation of why the change is beneficial
-        5. A concise improved code snippet (if applicable)
-
-        Format each suggestion as follows:
-        - **Line(s):** {{line number(s) or 'General' if not specific}}
-        - **Severity:** {{High, Medium, or Low}}
-        - **Issue:** {{description of the issue or improvement}}
-        - **Improved Code (if applicable):** ```{{language}}\n{{improved code}}\n```
-
-        Return suggestions, each formatted as above, separated by '--- SUGGESTION {{n}} ---'.
-
+        {format_instructions}
+{excerpt_note}
         CODE:
         {code}
 
         SUGGESTIONS:"""
 
-        raw_output, latency_ms = await call_gemini_api(prompt)
-        
-        # Store latency
-        latency_record = SuggestionLatency(
+async def iter_chunk_reviews(chunks: list, language: str, user_context: str, rejected_texts: RejectionIndex, priority: int,
+                             total_lines: int | None = None):
+    """
+    Review the chunks of one file concurrently and yield (chunk index, parsed
+    suggestions) as each finishes, with line numbers mapped back to the file
+    """
+    semaphore = asyncio.Semaphore(CODE_CHUNK_CONCURRENCY)
+    total_lines = total_lines or chunks[-1]["end_line"]
+
+    async def review_chunk(index: int, chunk: dict):
+        async with semaphore:
+            prompt = build_review_prompt(
+                chunk["code"], language, user_context, rejected_texts,
+                excerpt={**chunk, "total_lines": total_lines}
+            )
+            raw_output, _ = await call_gemini_api(
+                prompt,
+                priority=priority,
+                generation_config=review_generation_config(),
+                resume=resume_review_output
+            )
+        return index, parse_review_output(raw_output, language, rejected_texts, line_offset=chunk["start_line"] - 1)
+
+    tasks = [asyncio.create_task(review_chunk(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def plan_incremental_review(previous: dict | None, code: str, language: str, rejected_texts: RejectionIndex) -> dict | None:
+    """
+    Compare code with the session's last reviewed version. Returns the review
+    windows around the changed hunks plus the previous suggestions that can
+    be carried forward, or None when a full review is the better choice.
+    """
+    if not REVIEW_INCREMENTAL or not previous or previous["language"] != language:
+        return None
+
+    line_map, changed = diff_code(previous["code"], code)
+    total_lines = len(code.split("\n"))
+    windows = review_windows(changed, total_lines, INCREMENTAL_CONTEXT_LINES)
+    window_lines = sum(end - start + 1 for start, end, _ in windows)
+    if window_lines > total_lines * INCREMENTAL_MAX_WINDOW_RATIO:
+        return None
+
+    carried = []
+    for item in previous["suggestions"]:
+        if item["text"] in rejected_texts:
+            continue
+        line_range = suggestion_line_range(item)
+        if line_range is None:
+            carried.append(item)
+            continue
+        first, last = line_range
+        # Keep it only if its whole range survived unchanged as one block
+        if first not in line_map or last not in line_map or line_map[last] - line_map[first] != last - first:
+            continue
+        offset = line_map[first] - first
+        if overlaps(first + offset, last + offset, changed):
+            continue
+        item = shift_suggestion(item, offset)
+        if item["text"] not in rejected_texts:
+            carried.append(item)
+
+    lines = code.split("\n")
+    chunks = [
+        {"start_line": start, "end_line": end, "code": "\n".join(lines[start - 1:end]), "changed": inside}
+        for start, end, inside in windows
+    ]
+    return {"chunks": chunks, "carried": carried, "total_lines": total_lines}
+
+async def review_code(code: str, language: str, user_context: str, rejected_texts: RejectionIndex, priority: int,
+                      previous: dict | None = None) -> tuple[list, float]:
+    """
+    Run the LLM review for a file and return (parsed suggestions, latency_ms).
+    A resubmitted file only has its changed hunks reviewed, and large files
+    are split on function/class boundaries, so latency follows the slowest
+    piece rather than the file length.
+    """
+    plan = plan_incremental_review(previous, code, language, rejected_texts)
+    if plan is not None:
+        start_time = time.time()
+        parsed = list(plan["carried"])
+        async for _, items in iter_chunk_reviews(plan["chunks"], language, user_context, rejected_texts, priority,
+                                                 total_lines=plan["total_lines"]):
+            parsed.extend(items)
+        merger = SuggestionMerger()
+        return merger.add(sort_by_line(parsed)), (time.time() - start_time) * 1000
+
+    chunks = split_code(code, language)
+    if len(chunks) == 1:
+        prompt = build_review_prompt(code, language, user_context, rejected_texts)
+        raw_output, latency_ms = await call_gemini_api(
+            prompt,
+            priority=priority,
+            generation_config=review_generation_config(),
+            resume=resume_review_output
+        )
+        return parse_review_output(raw_output, language, rejected_texts), latency_ms
+
+    start_time = time.time()
+    results = [None] * len(chunks)
+    async for index, items in iter_chunk_reviews(chunks, language, user_context, rejected_texts, priority):
+        results[index] = items
+    # Merge in file order so ids follow line order
+    merger = SuggestionMerger()
+    parsed = [item for items in results for item in merger.add(items)]
+    return parsed, (time.time() - start_time) * 1000
+
+def to_client_suggestion(item: dict, file_path: str | None) -> dict:
+    return {
+        "id": item["id"],
+        "text": item["text"],
+        "severity": item["severity"],
+        "error_category": item["error_category"],
+        "line_start": item.get("line_start"),
+        "line_end": item.get("line_end"),
+        "improved_code": item.get("improved_code"),
+        "modifiedText": "",
+        "rejectReason": "",
+        "status": None,
+        "file_path": file_path
+    }
+
+def build_suggestion_rows(parsed: list, session_id: str, language: str, file_path: str | None):
+    """
+    Build the client-facing suggestion dicts and the matching AISuggestion row dicts
+    """
+    suggestions = []
+    rows = []
+    for item in parsed:
+        suggestions.append(to_client_suggestion(item, file_path))
+        rows.append({
+            "session_id": session_id,
+            "suggestion_id": item["id"],
+            "suggestion_text": item["text"],
+            "severity": item["severity"],
+            "error_category": item["error_category"],
+            "line_start": item.get("line_start"),
+            "line_end": item.get("line_end"),
+            "improved_code": item.get("improved_code"),
+            "language": language,
+            "file_path": file_path
+        })
+    return suggestions, rows
+
+def stage_review_rows(writes: ReviewWriteBatch, parsed: list, session_id: str, language: str,
+                      file_path: str | None, latency_ms: float) -> list:
+    """Collect a review's SuggestionLatency and AISuggestion rows; returns the client suggestions"""
+    writes.add(SuggestionLatency, session_id=session_id, latency_ms=latency_ms, created_at=datetime.utcnow())
+    suggestions, rows = build_suggestion_rows(parsed, session_id, language, file_path)
+    writes.extend(AISuggestion, rows)
+    return suggestions
+
+async def ensure_code_session(db: AsyncSession, session_id: str, user_id: int | None, language: str, code: str):
+    """
+    Insert the CodeSession row unless one already exists for session_id.
+    Repo reviews store several files under one session, possibly from
+    concurrent tasks, so this must not fail on the unique session_id.
+    The code itself goes to code_blobs, stored once per distinct content.
+    """
+    blob = code_blob_row(code)
+    await store_code_blobs(db, [blob])
+    await db.execute(
+        pg_insert(CodeSession)
+        .values(
             session_id=session_id,
-            latency_ms=latency_ms,
+            user_id=user_id,  # Store the user_id
+            language=language,
+            code_sha256=blob["sha256"],
             created_at=datetime.utcnow()
         )
-        db.add(latency_record)
-        
-        # Parse suggestions
-        suggestion_blocks = re.split(r'--- SUGGESTION \d+ ---', raw_output.strip())
-        suggestions = []
-        for i, block in enumerate(suggestion_blocks):
-            if block.strip():
-                # Check if this suggestion was previously rejected
-                if block.strip() in rejected_texts:
-                    print(f"DEBUG: Skipping previously rejected suggestion: {block.strip()[:100]}...")
-                    continue
-
-                severity_match = re.search(r'\*\*Severity:\*\*\s*(High|Medium|Low)', block)
-                severity = severity_match.group(1) if severity_match else "Medium"
-                
-                # Categorize the error
-                error_category = categorize_error(block.strip(), language)
-                
-                suggestion_data = {
-                    "id": i + 1,
-                    "text": block.strip(),
-                    "severity": severity,
-                    "error_category": error_category,
-                    "modifiedText": "",
-                    "rejectReason": "",
-                    "status": None,
-                    "file_path": file_path
-                }
-                ai_suggestion = AISuggestion(
-                    session_id=session_id,
-                    suggestion_id=i + 1,
-                    suggestion_text=block.strip(),
-                    severity=severity,
-                    error_category=error_category,
-                    language=language,
-                    file_path=file_path
-                )
-                db.add(ai_suggestion)
-                suggestions.append(suggestion_data)
+        .on_conflict_do_nothing(index_elements=[CodeSession.session_id])
+    )
+
+async def rollup_review(db: AsyncSession, session_id: str, language: str, parsed: list, latency_ms: float):
+    """Add a review's suggestion counts and latency to the daily analytics rollup"""
+    owner = await session_owner(db, session_id)
+    batch = RollupBatch()
+    for item in parsed:
+        batch.add("suggested", owner, language, item["error_category"], item["severity"])
+    batch.add("latency", owner, language, count=0, latency_ms=latency_ms)
+    await batch.flush(db)
+
+async def record_feedback(db: AsyncSession, session_id: str, user_id: int | None, outcome: str, language: str,
+                          error_category: str, pattern_data: dict) -> list:
+    """
+    Stage the analytics rollup and preference-profile updates for one feedback
+    event. Returns the updated profiles for remember_profiles after commit.
+    """
+    return await record_feedback_batch(db, session_id, user_id, [(outcome, language, error_category, pattern_data)])
+
+async def record_feedback_batch(db: AsyncSession, session_id: str, user_id: int | None, events: list) -> list:
+    """
+    Same for several events [(outcome, language, error_category, pattern_data)]
+    of one session: one rollup upsert and one locked profile update
+    """
+    owner = await session_owner(db, session_id)
+    batch = RollupBatch()
+    for outcome, language, error_category, _ in events:
+        batch.add(outcome, owner, language, error_category)
+    await batch.flush(db)
+
+    scopes = [profile_scope(session_id, None)]
+    if user_id or owner:
+        scopes.append(profile_scope(session_id, user_id or owner))
+    return await update_profiles(db, scopes, [
+        (outcome, error_category, pattern_data) for outcome, _, error_category, pattern_data in events
+    ])
+
+async def load_rejection_index(db: AsyncSession, session_id: str, user_id: int | None) -> RejectionIndex:
+    """
+    The user's (or, without a user, the session's) rejection index, brought up
+    to date with the RejectedSuggestion rows added since it was last read.
+    Recent rows are read again too, so one committed after a higher id was
+    read is not skipped; the index adds each row once.
+    """
+    index = rejection_indexes.get(f"user:{user_id}" if user_id else f"session:{session_id}")
+    rescan_from = index.rescan_from()
+    newer = RejectedSuggestion.id > index.last_id
+    query = select(RejectedSuggestion.id, RejectedSuggestion.created_at, RejectedSuggestion.suggestion_text).where(
+        or_(newer, RejectedSuggestion.created_at >= rescan_from) if rescan_from is not None else newer
+    )
+    if user_id:
+        query = query.join(CodeSession, CodeSession.session_id == RejectedSuggestion.session_id).where(CodeSession.user_id == user_id)
+    else:
+        query = query.where(RejectedSuggestion.session_id == session_id)
+    rows = (await db.execute(query.order_by(RejectedSuggestion.id.desc()).limit(REJECTION_INDEX_MAX_ENTRIES))).all()
+
+    for row in reversed(rows):
+        index.add_row(row.id, row.created_at, row.suggestion_text or "")
+    return index
+
+async def load_review_context(session_id: str, db: AsyncSession, user_id: int | None = None):
+    # Precomputed feedback profile for adaptive learning (spans sessions for known users)
+    user_context = await load_profile_summary(db, profile_scope(session_id, user_id))
+
+    # Previously rejected suggestions; `text in rejected_texts` matches near-duplicates
+    rejected_texts = await load_rejection_index(db, session_id, user_id)
+    return user_context, rejected_texts
+
+async def find_ai_suggestions(db: AsyncSession, session_id: str, suggestion_ids: list) -> dict:
+    """
+    A session's stored suggestions (error category and patch columns) in one
+    query, keyed by (suggestion_id, file_path) and by suggestion_id alone
+    (the first row, as find_ai_suggestion would return it)
+    """
+    result = await db.execute(
+        select(AISuggestion.suggestion_id, AISuggestion.file_path, AISuggestion.error_category,
+               AISuggestion.line_start, AISuggestion.line_end, AISuggestion.improved_code)
+        .where(AISuggestion.session_id == session_id, AISuggestion.suggestion_id.in_(set(suggestion_ids)))
+        .order_by(AISuggestion.id)
+    )
+    suggestions = {}
+    for row in result.all():
+        suggestions.setdefault((row.suggestion_id, row.file_path), row)
+        suggestions.setdefault(row.suggestion_id, row)
+    return suggestions
+
+async def find_ai_suggestion(db: AsyncSession, session_id: str, suggestion_id: int, file_path: str | None = None):
+    query = select(AISuggestion).where(AISuggestion.session_id == session_id, AISuggestion.suggestion_id == suggestion_id)
+    if file_path is not None:
+        # Each file of a repo review numbers its suggestions from 1: prefer this file's
+        query = query.order_by((AISuggestion.file_path == file_path).desc().nullslast(), AISuggestion.id)
+    result = await db.execute(query.limit(1))
+    return result.scalars().first()
+
+def apply_stored_patch(code: str, suggestion, file_path: str | None) -> str | None:
+    """
+    Apply the line range and improved code stored with a suggestion row.
+    None when the row has none (or belongs to another file) or the patch
+    doesn't apply cleanly; the LLM applies the suggestion then.
+    """
+    if suggestion is None or suggestion.file_path != file_path:
+        return None
+    if suggestion.line_start is None or not suggestion.improved_code:
+        return None
+    return apply_patch(code, suggestion.line_start, suggestion.line_end or suggestion.line_start, suggestion.improved_code)
+
+async def load_review_snapshot(db: AsyncSession, session_id: str, file_path: str | None) -> dict | None:
+    result = await db.execute(
+        select(ReviewSnapshot.language, ReviewSnapshot.suggestions, CodeBlob.data)
+        .join(CodeBlob, CodeBlob.sha256 == ReviewSnapshot.code_sha256)
+        .where(ReviewSnapshot.session_id == session_id, ReviewSnapshot.file_path == (file_path or ""))
+    )
+    row = result.first()
+    if not row:
+        return None
+    return {"language": row.language, "code": decompress_code(row.data), "suggestions": row.suggestions}
+
+async def save_review_snapshot(db: AsyncSession, session_id: str, file_path: str | None, language: str, code: str, parsed: list):
+    """Stage the upsert of this file's latest review (its code in code_blobs); the caller commits"""
+    blob = code_blob_row(code)
+    await store_code_blobs(db, [blob])
+    statement = pg_insert(ReviewSnapshot).values(
+        session_id=session_id,
+        file_path=file_path or "",
+        language=language,
+        code_sha256=blob["sha256"],
+        suggestions=parsed,
+        updated_at=datetime.utcnow()
+    )
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[ReviewSnapshot.session_id, ReviewSnapshot.file_path],
+        set_={
+            "language": statement.excluded.language,
+            "code_sha256": statement.excluded.code_sha256,
+            "suggestions": statement.excluded.suggestions,
+            "updated_at": statement.excluded.updated_at,
+        }
+    ))
+
+def review_prompt_version() -> str:
+    return f"{PROMPT_VERSION}-{REVIEW_OUTPUT_FORMAT}"
+
+def review_cache_key(code: str, language: str, user_context: str, rejected_texts: RejectionIndex) -> str:
+    cache_context = user_context + "\n" + rejected_texts.digest()
+    return make_review_cache_key(code, language, review_prompt_version(), cache_context)
+
+async def review_repo_blob(code: str, language: str, blob_sha: str, base_review: list | None,
+                           rejected_texts: RejectionIndex, priority: int, db: AsyncSession) -> list:
+    """
+    Suggestions for a repository file from the review shared by everyone who
+    reviews the same git blob: base_review when the caller already loaded
+    it, else the stored one, else a new review without any user's context.
+    Only this user's rejections are applied on top.
+    """
+    if base_review is None:
+        async def review() -> list:
+            # End the read transaction so no pooled connection is held during the LLM call
+            await db.commit()
+            parsed, _ = await review_code(code, language, BLOB_REVIEW_CONTEXT, RejectionIndex(), priority)
+            return parsed
+
+        base_review = await blob_reviews.get_or_review(db, blob_sha, language, review_prompt_version(), code, review)
+    # Renumber so ids stay consecutive after filtering
+    return SuggestionMerger().add([item for item in base_review if item["text"] not in rejected_texts])
+
+def no_suggestions_placeholder(file_path: str | None = None) -> dict:
+    return {
+        "id": 1,
+        "text": "No specific suggestions found. Your code looks good!",
+        "severity": "Low",
+        "error_category": "Other Issue",
+        "line_start": None,
+        "line_end": None,
+        "improved_code": None,
+        "modifiedText": "",
+        "rejectReason": "",
+        "status": None,
+        "file_path": file_path
+    }
+
+async def process_code_for_review(code: str, language: str, session_id: str, file_path: str | None, db: AsyncSession, user_id: int = None, priority: int = PRIORITY_INTERACTIVE, writes: ReviewWriteBatch | None = None,
+                                  blob_sha: str | None = None, base_review: list | None = None, write_queue: ReviewWriteQueue | None = None):
+    """
+    Review one file and store the results. The review's AISuggestion and
+    SuggestionLatency rows, plus any rows the caller put in `writes` (e.g.
+    the repository file), are written in the same transaction as the
+    session, snapshot and rollup, so a file is stored whole or not at all.
+    With a `write_queue` (repository reviews) that transaction is the
+    queue's, shared with other finished files. Repository files with a git
+    `blob_sha` use the review shared per blob (`base_review` if already
+    loaded) instead of a per-user one.
+    """
+    try:
+        start_time = time.time()
+        cache_stored = False
+
+        user_context, rejected_texts = await load_review_context(session_id, db, user_id)
+
+        if blob_sha is not None:
+            parsed = await review_repo_blob(code, language, blob_sha, base_review, rejected_texts, priority, db)
+            latency_ms = (time.time() - start_time) * 1000
+        else:
+            # Identical code + language + prompt + user context reuses the stored review
+            cache_key = review_cache_key(code, language, user_context, rejected_texts)
+            parsed = await review_cache.get(cache_key, db)
+
+            if parsed is None:
+                previous = await load_review_snapshot(db, session_id, file_path)
+                # End the read transaction so no pooled connection is held during the LLM call
+                await db.commit()
+                parsed, latency_ms = await review_code(code, language, user_context, rejected_texts, priority, previous)
+                await review_cache.put(cache_key, parsed, language, db)
+                cache_stored = True
+            else:
+                # Record what the user actually waited for a cache hit
+                latency_ms = (time.time() - start_time) * 1000
+
+        # Latency and suggestions are written with one multi-row insert (or COPY) per table
+        writes = writes if writes is not None else ReviewWriteBatch()
+        suggestions = stage_review_rows(writes, parsed, session_id, language, file_path, latency_ms)
+
+        async def stage(store_db: AsyncSession):
+            # Store code session with user_id
+            await ensure_code_session(store_db, session_id, user_id, language, code)
+            await save_review_snapshot(store_db, session_id, file_path, language, code, parsed)
+            await rollup_review(store_db, session_id, language, parsed, latency_ms)
 
-        db.commit()
+        if write_queue is None:
+            await stage(db)
+            await writes.flush(db)
+        await db.commit()
+        if cache_stored:
+            review_cache.remember(cache_key, parsed)
+        if write_queue is not None:
+            write_queue.add(file_path, writes, stage)
         return suggestions
 
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error in process_code_for_review: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process code: {str(e)}")
 
-async def generate_suggestions(payload: CodeInput, db: Session = Depends(get_db)):
+async def generate_suggestions(payload: CodeInput, db: AsyncSession = Depends(get_async_db)):
     try:
         # Get user_id from the request context (you'll need to modify this based on your auth setup)
         # For now, we'll get it from localStorage on the frontend and pass it in the payload
@@ -216,16 +572,7 @@ async def generate_suggestions(payload: CodeInput, db: Session = Depends(get_db)
         )
         
         if not suggestions:
-            suggestions = [{
-                "id": 1,
-                "text": "No specific suggestions found. Your code looks good!",
-                "severity": "Low",
-                "error_category": "Other Issue",
-                "modifiedText": "",
-                "rejectReason": "",
-                "status": None,
-                "file_path": None
-            }]
+            suggestions = [no_suggestions_placeholder()]
         return {"suggestions": suggestions}
 
     except HTTPException:
@@ -233,13 +580,199 @@ async def generate_suggestions(payload: CodeInput, db: Session = Depends(get_db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate suggestions: {str(e)}")
 
-async def accept_suggestion(payload: AcceptSuggestion, db: Session = Depends(get_db)):
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def generate_suggestions_stream(payload: CodeInput, db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events variant of /generate-suggestions: each suggestion is
+    pushed as soon as its block is complete in the model stream (or, for a
+    chunked large file, as soon as its chunk is reviewed), and the
+    AISuggestion rows are written in one batch once the stream ends.
+    """
+    try:
+        start_time = time.time()
+        user_id = getattr(payload, 'user_id', None)
+        code, language, session_id = payload.code, payload.language, payload.session_id
+
+        user_context, rejected_texts = await load_review_context(session_id, db, user_id)
+        cache_key = review_cache_key(code, language, user_context, rejected_texts)
+        cached = await review_cache.get(cache_key, db)
+        previous = await load_review_snapshot(db, session_id, None) if cached is None else None
+        await db.commit()
+
+        plan = plan_incremental_review(previous, code, language, rejected_texts)
+        chunks = split_code(code, language)
+
+        # Check the LLM queue before the response starts so saturation is still a real 429
+        if cached is None:
+            llm_scheduler.check_admission(PRIORITY_INTERACTIVE)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate suggestions: {str(e)}")
+
+    async def event_stream():
+        parsed = []
+        first_suggestion_ms = None
+        try:
+            if cached is not None:
+                parsed = cached
+                for item in parsed:
+                    yield sse_event("suggestion", to_client_suggestion(item, None))
+            elif plan is not None or len(chunks) > 1:
+                # Resubmitted or large file: carried-forward suggestions first, then each
+                # changed hunk / chunk as soon as it is reviewed
+                merger = SuggestionMerger()
+                for item in merger.add(sort_by_line(plan["carried"]) if plan else []):
+                    parsed.append(item)
+                    yield sse_event("suggestion", to_client_suggestion(item, None))
+                reviews = (
+                    iter_chunk_reviews(plan["chunks"], language, user_context, rejected_texts, PRIORITY_INTERACTIVE,
+                                       total_lines=plan["total_lines"])
+                    if plan else
+                    iter_chunk_reviews(chunks, language, user_context, rejected_texts, PRIORITY_INTERACTIVE)
+                )
+                async for _, items in reviews:
+                    for item in merger.add(items):
+                        if first_suggestion_ms is None:
+                            first_suggestion_ms = (time.time() - start_time) * 1000
+                        parsed.append(item)
+                        yield sse_event("suggestion", to_client_suggestion(item, None))
+            else:
+                parser = make_stream_parser(language, rejected_texts)
+                prompt = build_review_prompt(code, language, user_context, rejected_texts)
+                async with llm_scheduler.slot(PRIORITY_INTERACTIVE):
+                    async for text in stream_gemini_api(prompt, generation_config=review_generation_config()):
+                        for item in parser.feed(text):
+                            if first_suggestion_ms is None:
+                                first_suggestion_ms = (time.time() - start_time) * 1000
+                            parsed.append(item)
+                            yield sse_event("suggestion", to_client_suggestion(item, None))
+                for item in parser.close():
+                    parsed.append(item)
+                    yield sse_event("suggestion", to_client_suggestion(item, None))
+
+            latency_ms = (time.time() - start_time) * 1000
+            if not parsed:
+                yield sse_event("suggestion", no_suggestions_placeholder())
+
+            # The request-scoped session may already be closed while streaming, so write with our own
+            async with AsyncSessionLocal() as write_db:
+                await ensure_code_session(write_db, session_id, user_id, language, code)
+                writes = ReviewWriteBatch()
+                stage_review_rows(writes, parsed, session_id, language, None, latency_ms)
+                await writes.flush(write_db)
+                await rollup_review(write_db, session_id, language, parsed, latency_ms)
+                await save_review_snapshot(write_db, session_id, None, language, code, parsed)
+                if cached is None:
+                    await review_cache.put(cache_key, parsed, language, write_db)
+                await write_db.commit()
+            if cached is None:
+                review_cache.remember(cache_key, parsed)
+
+            yield sse_event("done", {
+                "count": len(parsed),
+                "latency_ms": latency_ms,
+                "first_suggestion_ms": first_suggestion_ms
+            })
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"Error in generate_suggestions_stream: {detail}")
+            yield sse_event("error", {"detail": f"Failed to generate suggestions: {detail}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def generate_followup(prompt: str) -> str:
+    raw_output, _ = await call_gemini_api(prompt, priority=PRIORITY_FEEDBACK)
+    return raw_output.strip()
+
+def accept_followup_prompt(original_code: str, suggestion_text: str, language: str) -> str:
+    return f"""You are an expert {language} developer. Apply ONLY the following specific suggestion to the provided code.
+    
+    CODE:
+    {original_code}
+    
+    SPECIFIC SUGGESTION TO APPLY:
+    {suggestion_text}
+    
+    STRICT INSTRUCTIONS:
+    1. Apply ONLY this exact suggestion as stated
+    2. Make the minimal change necessary to implement just this suggestion
+    3. Do NOT make any other improvements or changes to the code
+    4. Do NOT fix other issues, bugs, or duplicate code
+    5. Do NOT add imports unless explicitly required by this suggestion
+    6. Return ONLY the modified code with this one change
+    7. Preserve ALL other parts of the code exactly as they are
+    8. If the suggestion cannot be applied as stated, return the original code unchanged
+    
+    MODIFIED CODE:"""
+
+def accept_followup_cache_key(original_code: str, suggestion_text: str, language: str) -> str:
+    return make_followup_cache_key(
+        f"accept-{FOLLOWUP_PROMPT_VERSION}", original_code, suggestion_text, language.lower()
+    )
+
+async def apply_suggestion_with_llm(original_code: str, suggestion_text: str, language: str, db: AsyncSession) -> str:
+    """Have Gemini rewrite the file with one suggestion applied (for suggestions a patch can't apply)"""
+    prompt = accept_followup_prompt(original_code, suggestion_text, language)
+    cache_key = accept_followup_cache_key(original_code, suggestion_text, language)
+    try:
+        return await followup_cache.get_or_generate(
+            cache_key, "accept", language, db, lambda: generate_followup(prompt)
+        )
+    except HTTPException as e:
+        # Backpressure fails the job instead of a silent fallback
+        if e.status_code == 429:
+            raise
+        return original_code
+    except Exception:
+        # Fallback to original code if we can't make a precise change
+        return original_code
+
+def submit_accept_followup(job_id: str, original_code: str, suggestion_text: str, language: str,
+                           reservation: FollowupReservation | None = None):
+    """Apply an accepted suggestion with Gemini in the background job pool"""
+    followup_jobs.submit(job_id, lambda job_db: apply_suggestion_with_llm(
+        original_code, suggestion_text, language, job_db
+    ), reservation)
+
+def modify_followup_prompt(modified_text: str, language: str) -> str:
+    return f"""You are an expert code reviewer analyzing {language} code.
+        CODE TO REVIEW: {modified_text}
+        
+        INSTRUCTIONS:
+        1. Provide 3-5 specific improvement suggestions
+        2. Focus on critical issues first: bugs, security vulnerabilities, performance problems
+        3. Format each suggestion as a numbered list item (1., 2., etc.)
+        4. Be concise but specific - mention what to change and why
+        5. If relevant, reference specific line numbers or code patterns
+        6. Do NOT include any introductory or concluding text
+        7. Do NOT rewrite the entire code
+        
+        SUGGESTIONS:"""
+
+def modify_followup_cache_key(modified_text: str, language: str) -> str:
+    return make_followup_cache_key(f"modify-{FOLLOWUP_PROMPT_VERSION}", modified_text, language.lower())
+
+def submit_modify_followup(job_id: str, modified_text: str, language: str,
+                           reservation: FollowupReservation | None = None):
+    """Generate a modify follow-up in the background job pool (cached like the inline path)"""
+    prompt = modify_followup_prompt(modified_text, language)
+    cache_key = modify_followup_cache_key(modified_text, language)
+    followup_jobs.submit(job_id, lambda job_db: followup_cache.get_or_generate(
+        cache_key, "modify", language, job_db, lambda: generate_followup(prompt)
+    ), reservation)
+
+async def accept_suggestion(payload: AcceptSuggestion, db: AsyncSession = Depends(get_async_db)):
+    reservation = None
     try:
         # Get the original suggestion to preserve error category
-        original_suggestion = db.query(AISuggestion).filter(
-            AISuggestion.session_id == payload.session_id,
-            AISuggestion.suggestion_id == payload.suggestion_id
-        ).first()
+        original_suggestion = await find_ai_suggestion(db, payload.session_id, payload.suggestion_id, payload.file_path)
         
         error_category = original_suggestion.error_category if original_suggestion else "Other Issue"
         
@@ -269,61 +802,53 @@ async def accept_suggestion(payload: AcceptSuggestion, db: Session = Depends(get
             pattern_data=pattern_data
         )
         db.add(user_pattern)
-        
-        # Generate modified code based on the specific suggestion
-        prompt = f"""You are an expert {payload.language} developer. Apply ONLY the following specific suggestion to the provided code.
-        
-        CODE:
-        {payload.original_code}
-        
-        SPECIFIC SUGGESTION TO APPLY:
-        {payload.suggestion_text}
-        
-        STRICT INSTRUCTIONS:
-        1. Apply ONLY this exact suggestion as stated
-        2. Make the minimal change necessary to implement just this suggestion
-        3. Do NOT make any other improvements or changes to the code
-        4. Do NOT fix other issues, bugs, or duplicate code
-        5. Do NOT add imports unless explicitly required by this suggestion
-        6. Return ONLY the modified code with this one change
-        7. Preserve ALL other parts of the code exactly as they are
-        8. If the suggestion cannot be applied as stated, return the original code unchanged
-        
-        MODIFIED CODE:"""
-        
-        try:
-            raw_output, _ = await call_gemini_api(prompt)
-            modified_code = raw_output.strip()
-        except:
-            # Fallback: try a more direct replacement approach
-            try:
-                if "pi" in payload.suggestion_text.lower() and "3.14" in payload.original_code:
-                    modified_code = payload.original_code.replace("3.14", "math.pi")
-                    # Add import only if needed and not already present
-                    if "import math" not in modified_code and "math.pi" in modified_code:
-                        modified_code = "import math\n" + modified_code
-                else:
-                    # Fallback to original code if we can't make a precise change
-                    modified_code = payload.original_code
-            except:
-                modified_code = payload.original_code
-        
-        db.commit()
+        updated_profiles = await record_feedback(
+            db, payload.session_id, payload.user_id, "accepted", payload.language, error_category, pattern_data
+        )
+
+        # Apply the stored suggestion's improved code locally; the LLM only handles what a patch can't.
+        # That runs as a follow-up job, admitted before the commit: once the feedback is
+        # stored the client never gets a 429 whose retry would record it twice.
+        modified_code = apply_stored_patch(payload.original_code, original_suggestion, payload.file_path)
+        if modified_code is None:
+            modified_code = await followup_cache.get(
+                accept_followup_cache_key(payload.original_code, payload.suggestion_text, payload.language), db
+            )
+            if modified_code is None:
+                reservation = followup_jobs.reserve()
+                job = new_job("accept", payload.session_id)
+                db.add(job)
+
+        await db.commit()
+        remember_profiles(updated_profiles)
+
+        if modified_code is not None:
+            return {
+                "message": "Suggestion accepted and stored",
+                "status": "done",
+                "modified_code": modified_code
+            }
+
+        submit_accept_followup(job.job_id, payload.original_code, payload.suggestion_text, payload.language, reservation)
         return {
             "message": "Suggestion accepted and stored",
-            "modified_code": modified_code
+            "status": "pending",
+            "job_id": job.job_id
         }
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to store accepted suggestion: {str(e)}")
+    finally:
+        if reservation is not None:
+            reservation.release()
 
-async def reject_suggestion(payload: RejectSuggestion, db: Session = Depends(get_db)):
+async def reject_suggestion(payload: RejectSuggestion, db: AsyncSession = Depends(get_async_db)):
     try:
         # Get the original suggestion to preserve error category
-        original_suggestion = db.query(AISuggestion).filter(
-            AISuggestion.session_id == payload.session_id,
-            AISuggestion.suggestion_id == payload.suggestion_id
-        ).first()
+        original_suggestion = await find_ai_suggestion(db, payload.session_id, payload.suggestion_id)
         
         error_category = original_suggestion.error_category if original_suggestion else "Other Issue"
         
@@ -353,20 +878,22 @@ async def reject_suggestion(payload: RejectSuggestion, db: Session = Depends(get
             pattern_data=pattern_data
         )
         db.add(user_pattern)
+        updated_profiles = await record_feedback(
+            db, payload.session_id, payload.user_id, "rejected", payload.language, error_category, pattern_data
+        )
         
-        db.commit()
+        await db.commit()
+        remember_profiles(updated_profiles)
         return {"message": "Suggestion rejected and stored"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to store rejected suggestion: {str(e)}")
 
-async def modify_suggestion(payload: ModifySuggestion, db: Session = Depends(get_db)):
+async def modify_suggestion(payload: ModifySuggestion, db: AsyncSession = Depends(get_async_db)):
+    reservation = None
     try:
         # Get the original suggestion to preserve error category
-        original_suggestion = db.query(AISuggestion).filter(
-            AISuggestion.session_id == payload.session_id,
-            AISuggestion.suggestion_id == payload.suggestion_id
-        ).first()
+        original_suggestion = await find_ai_suggestion(db, payload.session_id, payload.suggestion_id)
         
         error_category = original_suggestion.error_category if original_suggestion else "Other Issue"
         
@@ -396,30 +923,205 @@ async def modify_suggestion(payload: ModifySuggestion, db: Session = Depends(get
             pattern_data=pattern_data
         )
         db.add(user_pattern)
+        updated_profiles = await record_feedback(
+            db, payload.session_id, payload.user_id, "modified", payload.language, error_category, pattern_data
+        )
         
-        db.commit()
-        
-        # Generate improved suggestion based on modification
-        prompt = f"""You are an expert code reviewer analyzing {payload.language} code.
-        CODE TO REVIEW: {payload.modified_text}
-        
-        INSTRUCTIONS:
-        1. Provide 3-5 specific improvement suggestions
-        2. Focus on critical issues first: bugs, security vulnerabilities, performance problems
-        3. Format each suggestion as a numbered list item (1., 2., etc.)
-        4. Be concise but specific - mention what to change and why
-        5. If relevant, reference specific line numbers or code patterns
-        6. Do NOT include any introductory or concluding text
-        7. Do NOT rewrite the entire code
+        # Improved suggestions based on the modification
+        cache_key = modify_followup_cache_key(payload.modified_text, payload.language)
+        # A cached follow-up is returned directly; otherwise it is generated in the background
+        cached_output = await followup_cache.get(cache_key, db)
+        if cached_output is None:
+            reservation = followup_jobs.reserve()
+            job = new_job("modify", payload.session_id)
+            db.add(job)
         
-        SUGGESTIONS:"""
+        await db.commit()
+        remember_profiles(updated_profiles)
         
-        raw_output, _ = await call_gemini_api(prompt)
+        if cached_output is not None:
+            return {
+                "message": "Suggestion modified and stored",
+                "status": "done",
+                "modified_suggestion": cached_output
+            }
         
+        submit_modify_followup(job.job_id, payload.modified_text, payload.language, reservation)
         return {
             "message": "Suggestion modified and stored",
-            "modified_suggestion": raw_output.strip()
+            "status": "pending",
+            "job_id": job.job_id
         }
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to process modified suggestion: {str(e)}")
\ No newline at end of file
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to process modified suggestion: {str(e)}")
+    finally:
+        if reservation is not None:
+            reservation.release()
+
+async def batch_feedback(payload: BatchFeedback, db: AsyncSession = Depends(get_async_db)):
+    """
+    Record many accept/reject/modify decisions for one session in a single
+    transaction: one query for their stored suggestions, one multi-row insert
+    per table, one commit. Accepts are applied as local patches inline;
+    anything needing Gemini runs as a follow-up job the client can poll.
+    """
+    decisions = payload.decisions
+    if len(decisions) > BATCH_FEEDBACK_MAX_DECISIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_FEEDBACK_MAX_DECISIONS} decisions per batch")
+    reservation = None
+    try:
+        session_id = payload.session_id
+        stored_suggestions = await find_ai_suggestions(db, session_id, [d.suggestion_id for d in decisions])
+        cached_followups = await followup_cache.get_many([
+            modify_followup_cache_key(d.modified_text, d.language) for d in decisions if d.action == "modify"
+        ], db)
+
+        outcome_rows = {AcceptedSuggestion: [], RejectedSuggestion: [], ModifiedSuggestion: []}
+        pattern_rows = []
+        events = []
+        results = []
+        followups = []
+        for decision in decisions:
+            stored = stored_suggestions.get(
+                (decision.suggestion_id, decision.file_path), stored_suggestions.get(decision.suggestion_id)
+            )
+            error_category = stored.error_category if stored is not None else "Other Issue"
+            row = {
+                "session_id": session_id,
+                "suggestion_id": decision.suggestion_id,
+                "error_category": error_category,
+                "language": decision.language,
+                "file_path": decision.file_path
+            }
+            pattern_data = {
+                "error_category": error_category,
+                "language": decision.language,
+                "file_path": decision.file_path
+            }
+            result = {"suggestion_id": decision.suggestion_id, "file_path": decision.file_path, "action": decision.action}
+
+            if decision.action == "accept":
+                modified_text = decision.modified_text or decision.suggestion_text
+                outcome_rows[AcceptedSuggestion].append(
+                    {**row, "suggestion_text": decision.suggestion_text, "modified_text": modified_text}
+                )
+                pattern_data.update(suggestion_text=decision.suggestion_text, modified_text=modified_text)
+                outcome = "accepted"
+                if decision.original_code is not None:
+                    modified_code = apply_stored_patch(decision.original_code, stored, decision.file_path)
+                    if modified_code is not None:
+                        result.update(status="done", modified_code=modified_code)
+                    else:
+                        followups.append((result, decision))
+            elif decision.action == "reject":
+                outcome_rows[RejectedSuggestion].append(
+                    {**row, "suggestion_text": decision.suggestion_text, "reject_reason": decision.reject_reason}
+                )
+                pattern_data.update(suggestion_text=decision.suggestion_text, reject_reason=decision.reject_reason)
+                outcome = "rejected"
+            else:
+                outcome_rows[ModifiedSuggestion].append(
+                    {**row, "original_text": decision.suggestion_text, "modified_text": decision.modified_text}
+                )
+                pattern_data.update(original_text=decision.suggestion_text, modified_text=decision.modified_text)
+                outcome = "modified"
+                cached_output = cached_followups.get(modify_followup_cache_key(decision.modified_text, decision.language))
+                if cached_output is not None:
+                    result.update(status="done", modified_suggestion=cached_output)
+                else:
+                    followups.append((result, decision))
+
+            pattern_rows.append({"session_id": session_id, "pattern_type": outcome, "pattern_data": pattern_data})
+            events.append((outcome, decision.language, error_category, pattern_data))
+            result.setdefault("status", "stored")
+            results.append(result)
+
+        if followups:
+            # A batch that could never fit must not be retried as if the queue were just busy
+            if len(followups) > followup_jobs.max_queue:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"At most {followup_jobs.max_queue} decisions needing a follow-up per batch, got {len(followups)}"
+                )
+            # Slots for every follow-up are held across the commit, so concurrent batches can't overfill the queue
+            reservation = followup_jobs.reserve(len(followups))
+        jobs = [new_job(decision.action, session_id) for _, decision in followups]
+        db.add_all(jobs)
+
+        for model, rows in outcome_rows.items():
+            if rows:
+                await db.execute(insert(model), rows)
+        await db.execute(insert(UserPattern), pattern_rows)
+        updated_profiles = await record_feedback_batch(db, session_id, payload.user_id, events)
+
+        await db.commit()
+        remember_profiles(updated_profiles)
+
+        for (result, decision), job in zip(followups, jobs):
+            if decision.action == "accept":
+                submit_accept_followup(job.job_id, decision.original_code, decision.suggestion_text, decision.language, reservation)
+            else:
+                submit_modify_followup(job.job_id, decision.modified_text, decision.language, reservation)
+            result.update(status="pending", job_id=job.job_id)
+
+        return {
+            "message": f"{len(decisions)} decisions stored",
+            "results": results
+        }
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to store feedback batch: {str(e)}")
+    finally:
+        if reservation is not None:
+            reservation.release()
+
+async def get_followup_job(job_id: str, wait: float = 0):
+    """
+    Status of a background follow-up job; with wait > 0 the request is held
+    until the job finishes or wait seconds pass (long polling)
+    """
+    job = await followup_jobs.wait(job_id, min(max(wait, 0), FOLLOWUP_JOB_MAX_WAIT_SECONDS))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Follow-up job not found")
+    return job
+
+async def stream_followup_job(job_id: str):
+    """Server-Sent Events variant: a status event while the job runs, then done or error"""
+    job = await followup_jobs.wait(job_id, 0)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Follow-up job not found")
+
+    async def event_stream():
+        current = job
+        while current["status"] not in FINISHED_STATUSES:
+            yield sse_event("status", current)
+            current = await followup_jobs.wait(job_id, FOLLOWUP_JOB_MAX_WAIT_SECONDS)
+            if current is None:
+                yield sse_event("error", {"job_id": job_id, "detail": "Follow-up job not found"})
+                return
+        yield sse_event("done" if current["status"] == "done" else "error", current)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def get_review_cache_stats():
+    return review_cache.stats()
+
+def get_blob_review_stats():
+    return blob_reviews.stats()
+
+def get_followup_cache_stats():
+    return followup_cache.stats()
+
+def get_followup_job_stats():
+    return followup_jobs.stats()
\ No newline at end of file
@@ -0,0 +1,14 @@
+import os
+import sys
+from unittest import mock
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# database.py needs DATABASE_URL and creates the tables at import; the unit
+# tests use fake sessions, so no database server is needed
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/codereview_test")
+# ai_utils needs a Gemini key at import; no test calls Gemini
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+with mock.patch("sqlalchemy.schema.MetaData.create_all"):
+    import database  # noqa: F401
@@ -0,0 +1,143 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+import followup_jobs
+import suggestion_routes
+from followup_cache import FollowupCache
+from followup_jobs import FollowupJobPool
+from schemas import BatchFeedback
+
+class RequestSession:
+    """The request's session: stores nothing, so no suggestion or follow-up is found"""
+
+    def __init__(self, fail_commit: bool = False):
+        self.fail_commit = fail_commit
+        self.inserts = []  # table names
+        self.jobs = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def execute(self, statement, rows=None):
+        if statement.is_insert:
+            self.inserts.append(statement.table.name)
+        return SimpleNamespace(all=lambda: [], first=lambda: None)
+
+    def add_all(self, jobs):
+        self.jobs.extend(jobs)
+
+    async def commit(self):
+        if self.fail_commit:
+            raise RuntimeError("could not serialize access")
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+class JobStore:
+    """Statuses each follow-up job was given by the pool, and its last error"""
+
+    def __init__(self):
+        self.history = {}
+        self.errors = {}
+
+    def __call__(self):
+        return JobSession(self)
+
+class JobSession:
+    def __init__(self, store: JobStore):
+        self.store = store
+
+    async def execute(self, statement):
+        if statement.is_update:
+            values = statement.compile().params
+            self.store.history.setdefault(values["job_id_1"], []).append(values["status"])
+            if values.get("error"):
+                self.store.errors[values["job_id_1"]] = values["error"]
+        return SimpleNamespace(first=lambda: None, rowcount=0)
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+@pytest.fixture
+def jobs(monkeypatch):
+    store = JobStore()
+    monkeypatch.setattr(followup_jobs, "AsyncSessionLocal", store)
+    return store
+
+@pytest.fixture
+def pool(monkeypatch, jobs):
+    """A fresh follow-up pool (3 slots) whose Gemini calls fail"""
+    pool = FollowupJobPool(workers=2, max_queue=3)
+    monkeypatch.setattr(suggestion_routes, "followup_jobs", pool)
+    monkeypatch.setattr(suggestion_routes, "followup_cache", FollowupCache(10, 10 ** 6, 60, 100))
+
+    async def record_feedback_batch(db, session_id, user_id, events):
+        return []
+
+    async def generate_followup(prompt):
+        raise HTTPException(status_code=503, detail="Gemini is unavailable")
+
+    monkeypatch.setattr(suggestion_routes, "record_feedback_batch", record_feedback_batch)
+    monkeypatch.setattr(suggestion_routes, "generate_followup", generate_followup)
+    return pool
+
+def batch(modified: int) -> BatchFeedback:
+    decisions = [{"suggestion_id": 1, "action": "reject", "suggestion_text": "Rename x", "language": "python", "reject_reason": "fine"}]
+    decisions += [
+        {"suggestion_id": i + 2, "action": "modify", "suggestion_text": "Cache it", "language": "python", "modified_text": f"cache = {i}"}
+        for i in range(modified)
+    ]
+    return BatchFeedback(session_id="s", decisions=decisions)
+
+def test_failing_followup_fails_its_job_after_the_batch_is_stored(pool, jobs):
+    db = RequestSession()
+
+    async def store_batch():
+        response = await suggestion_routes.batch_feedback(batch(2), db)
+        await pool._queue.join()
+        return response
+
+    results = asyncio.run(store_batch())["results"]
+    assert [result["status"] for result in results] == ["stored", "pending", "pending"]
+    assert db.commits == 1 and db.rollbacks == 0
+    assert db.inserts == ["rejected_suggestions", "modified_suggestions", "user_patterns"]
+    for result in results[1:]:
+        assert jobs.history[result["job_id"]] == ["running", "failed"]
+        assert jobs.errors[result["job_id"]] == "Gemini is unavailable"
+    assert [job.job_id for job in db.jobs] == [result["job_id"] for result in results[1:]]
+    assert pool.stats()["reserved"] == 0
+
+def test_failed_commit_releases_the_reserved_slots(pool):
+    db = RequestSession(fail_commit=True)
+    with pytest.raises(HTTPException) as failed:
+        asyncio.run(suggestion_routes.batch_feedback(batch(2), db))
+    assert failed.value.status_code == 500
+    assert db.rollbacks == 1
+    assert (pool.stats()["reserved"], pool.stats()["submitted"]) == (0, 0)
+
+def test_batch_is_turned_away_while_another_holds_the_slots(pool):
+    held = pool.reserve(2)
+    db = RequestSession()
+    with pytest.raises(HTTPException) as busy:
+        asyncio.run(suggestion_routes.batch_feedback(batch(2), db))
+    assert busy.value.status_code == 429
+    assert db.commits == 0 and db.inserts == []
+    held.release()
+    assert pool.stats()["reserved"] == 0
+
+def test_batch_that_could_never_fit_is_a_bad_request(pool):
+    db = RequestSession()
+    with pytest.raises(HTTPException) as too_many:
+        asyncio.run(suggestion_routes.batch_feedback(batch(4), db))
+    assert too_many.value.status_code == 400
+    assert db.commits == 0 and pool.stats()["reserved"] == 0
@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import blob_reviews
+from blob_reviews import BlobReviewStore
+from code_blobs import code_blob_row, compress_code
+
+class FakeSession:
+    """Answers blob_reviews lookups from `rows`, keeps the reviews stored and records the statements executed"""
+
+    def __init__(self, rows: dict | None = None):
+        self.rows = rows or {}  # (blob_sha, language, prompt_version) -> (suggestions, code)
+        self.statements = []
+        self.code_blobs = []
+
+    async def execute(self, statement, rows=None):
+        self.statements.append(statement)
+        if statement.is_insert:
+            if statement.table.name == "code_blobs":
+                self.code_blobs.extend(rows)
+            else:
+                values = statement.compile().params
+                key = (values["blob_sha"], values["language"], values["prompt_version"])
+                self.rows.setdefault(key, (values["suggestions"], None))
+            return SimpleNamespace(rowcount=1)
+        if statement.is_delete:
+            return SimpleNamespace(rowcount=3)
+
+        params = statement.compile().params
+        if isinstance(params["blob_sha_1"], list):
+            found = [
+                SimpleNamespace(blob_sha=blob_sha, language=language, suggestions=suggestions, data=compress_code(code))
+                for (blob_sha, language, version), (suggestions, code) in self.rows.items()
+                if blob_sha in params["blob_sha_1"] and version == params["prompt_version_1"]
+            ]
+            return SimpleNamespace(all=lambda: found)
+        row = self.rows.get((params["blob_sha_1"], params["language_1"], params["prompt_version_1"]))
+        suggestions = row[0] if row else None
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(first=lambda: suggestions))
+
+SUGGESTIONS = [{"id": 1, "line_start": 3, "issue": "Unused import"}]
+
+def test_load_many_returns_hits_with_their_code():
+    store = BlobReviewStore(max_rows=100)
+    db = FakeSession({
+        ("a1", "python", "v2"): (SUGGESTIONS, "import os\n"),
+        ("b2", "python", "v1"): (SUGGESTIONS, "import sys\n"),
+        ("c3", "java", "v2"): (SUGGESTIONS, "class A {}\n"),
+    })
+    wanted = [("a1", "python"), ("b2", "python"), ("c3", "python"), ("d4", "python")]
+    found = asyncio.run(store.load_many(db, wanted, "v2"))
+    # Another prompt version or language is a miss
+    assert found == {("a1", "python"): {"suggestions": SUGGESTIONS, "code": "import os\n"}}
+    assert (store.counters["hits"], store.counters["misses"]) == (1, 3)
+    assert asyncio.run(store.load_many(db, [], "v2")) == {}
+    assert len(db.statements) == 1
+
+def test_review_is_stored_once_and_reused():
+    store = BlobReviewStore(max_rows=100)
+    db = FakeSession()
+    reviews = []
+
+    async def review():
+        reviews.append(1)
+        return SUGGESTIONS
+
+    first = asyncio.run(store.get_or_review(db, "a1", "python", "v2", "import os\n", review))
+    second = asyncio.run(store.get_or_review(db, "a1", "python", "v2", "import os\n", review))
+    assert first == second == SUGGESTIONS
+    assert len(reviews) == 1
+    assert [blob["sha256"] for blob in db.code_blobs] == [code_blob_row("import os\n")["sha256"]]
+    assert (store.counters["reviews"], store.counters["stores"]) == (1, 1)
+
+def test_same_blob_reviewed_at_once_is_reviewed_once():
+    store = BlobReviewStore(max_rows=100)
+    reviews = []
+
+    async def review():
+        reviews.append(1)
+        await asyncio.sleep(0.01)
+        return SUGGESTIONS
+
+    async def two_paths():
+        return await asyncio.gather(*(
+            store.get_or_review(FakeSession(), "a1", "python", "v2", "import os\n", review) for _ in range(2)
+        ))
+
+    assert asyncio.run(two_paths()) == [SUGGESTIONS, SUGGESTIONS]
+    assert len(reviews) == 1
+    assert store.stats()["joined"] == 1 and store.stats()["inflight"] == 0
+
+def test_failed_review_is_not_stored():
+    store = BlobReviewStore(max_rows=100)
+    db = FakeSession()
+
+    async def fail():
+        raise RuntimeError("Gemini is unavailable")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.get_or_review(db, "a1", "python", "v2", "import os\n", fail))
+    assert db.rows == {} and store.counters["stores"] == 0
+
+def test_stores_prune_outdated_and_overflow_rows_periodically(monkeypatch):
+    monkeypatch.setattr(blob_reviews, "BLOB_REVIEW_PRUNE_EVERY", 3)
+    store = BlobReviewStore(max_rows=100)
+    db = FakeSession()
+    for i in range(4):
+        asyncio.run(store.put(db, f"sha{i}", "python", "v2", f"x = {i}\n", SUGGESTIONS))
+    deletes = [statement for statement in db.statements if statement.is_delete]
+    assert len(deletes) == 2  # other prompt versions, then rows beyond max_rows
+    assert store.counters["pruned"] == 6
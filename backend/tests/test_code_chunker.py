@@ -0,0 +1,58 @@
+from code_chunker import split_code, brace_depths, python_depths
+
+def python_module(functions: int, body_lines: int) -> str:
+    parts = []
+    for f in range(functions):
+        body = "\n".join(f"    x{i} = {i}" for i in range(body_lines))
+        parts.append(f"# helper {f}\n@decorator\ndef function_{f}():\n{body}\n")
+    return "\n".join(parts)
+
+def assert_covers(chunks: list, code: str, max_lines: int):
+    lines = code.split("\n")
+    for chunk in chunks:
+        assert chunk["end_line"] - chunk["start_line"] + 1 <= max_lines
+        assert chunk["code"] == "\n".join(lines[chunk["start_line"] - 1:chunk["end_line"]])
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["start_line"] == previous["end_line"] + 1
+
+def test_short_file_is_one_chunk():
+    code = python_module(2, 3)
+    assert split_code(code, "python", max_lines=100) == [{"start_line": 1, "end_line": len(code.split("\n")), "code": code}]
+
+def test_python_splits_on_function_boundaries_with_comments_and_decorators():
+    code = python_module(6, 20)
+    chunks = split_code(code, "python", max_lines=50)
+    assert len(chunks) > 1
+    assert_covers(chunks, code, 50)
+    for chunk in chunks:
+        assert chunk["code"].startswith("# helper")
+
+def test_oversized_function_is_split_inside_its_body():
+    code = python_module(1, 120)
+    chunks = split_code(code, "python", max_lines=50)
+    assert_covers(chunks, code, 50)
+    assert chunks[0]["start_line"] == 1 and chunks[-1]["end_line"] >= 120
+
+def test_unparseable_python_falls_back_to_indentation():
+    code = python_module(4, 30).replace("def function_2():", "def function_2(:")
+    chunks = split_code(code, "python", max_lines=40)
+    assert_covers(chunks, code, 40)
+
+def test_brace_language_splits_between_functions():
+    code = "\n".join(
+        f"// function {f}\nfunction f{f}() {{\n" + "\n".join(f"  let x{i} = '{{';" for i in range(25)) + "\n}\n"
+        for f in range(4)
+    )
+    chunks = split_code(code, "javascript", max_lines=60)
+    assert len(chunks) > 1
+    assert_covers(chunks, code, 60)
+    for chunk in chunks:
+        assert chunk["code"].startswith("// function")
+
+def test_brace_depths_ignore_strings_and_comments():
+    lines = ["function a() {", "  const s = '}';", "  /* { */", "  // {", "}", "b();"]
+    assert brace_depths(lines, "javascript") == [0, 1, 1, 1, None, 0]
+
+def test_python_depths_mark_statement_starts():
+    code = "@d\ndef f():\n    if x:\n        pass\n"
+    assert python_depths(code, 5) == [0, None, 1, 2, None]
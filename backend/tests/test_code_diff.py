@@ -0,0 +1,33 @@
+from code_diff import diff_code, overlaps, review_windows
+
+def test_unchanged_lines_map_through_an_insertion():
+    old = "a\nb\nc\nd"
+    new = "a\nb\nnew\nc\nd"
+    line_map, changed = diff_code(old, new)
+    assert line_map == {1: 1, 2: 2, 3: 4, 4: 5}
+    assert changed == [(3, 3)]
+
+def test_replacement_marks_new_range():
+    line_map, changed = diff_code("a\nb\nc\nd", "a\nB1\nB2\nd")
+    assert changed == [(2, 3)]
+    assert line_map == {1: 1, 4: 4}
+
+def test_deletion_is_marked_where_it_happened():
+    line_map, changed = diff_code("a\nb\nc\nd", "a\nd")
+    assert line_map == {1: 1, 4: 2}
+    assert changed == [(1, 1)]
+
+def test_identical_code_has_no_changes():
+    line_map, changed = diff_code("a\nb", "a\nb")
+    assert changed == [] and line_map == {1: 1, 2: 2}
+
+def test_overlaps():
+    assert overlaps(3, 5, [(5, 9)])
+    assert not overlaps(3, 4, [(5, 9), (1, 2)])
+
+def test_review_windows_add_context_and_merge_neighbours():
+    windows = review_windows([(10, 10), (14, 15), (50, 50)], total_lines=55, context_lines=3)
+    assert windows == [(7, 18, [(10, 10), (14, 15)]), (47, 53, [(50, 50)])]
+
+def test_review_windows_clamp_to_the_file():
+    assert review_windows([(1, 2)], total_lines=4, context_lines=10) == [(1, 4, [(1, 2)])]
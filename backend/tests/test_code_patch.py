@@ -0,0 +1,64 @@
+from code_patch import apply_patch, apply_suggestion_patch, parse_suggestion_patch
+
+CODE = """import math
+
+def area(r):
+    result = 3.14 * r * r
+    return result
+
+def perimeter(r):
+    return 2 * 3.14 * r
+"""
+
+def suggestion(lines: str, improved_code: str) -> str:
+    return (
+        f"- **Line(s):** {lines}\n- **Severity:** Low\n- **Issue:** Use math.pi\n"
+        f"- **Improved Code (if applicable):** ```python\n{improved_code}\n```"
+    )
+
+def test_exact_range_is_replaced():
+    patched = apply_suggestion_patch(CODE, suggestion("4", "result = math.pi * r * r"))
+    assert patched == CODE.replace("3.14 * r * r", "math.pi * r * r")
+
+def test_shifted_line_numbers_find_the_closest_match():
+    patched = apply_suggestion_patch(CODE, suggestion("6", "    return 2 * math.pi * r"))
+    assert patched == CODE.replace("2 * 3.14 * r", "2 * math.pi * r")
+
+def test_quoted_context_widens_the_range():
+    improved = "def area(r):\n    result = math.pi * r * r\n    return result"
+    patched = apply_suggestion_patch(CODE, suggestion("4", improved))
+    assert patched == CODE.replace("3.14 * r * r", "math.pi * r * r")
+
+def test_snippet_is_reindented_to_the_replaced_lines():
+    patched = apply_suggestion_patch(CODE, suggestion("8", "return 2 * math.pi * r"))
+    assert "\n    return 2 * math.pi * r\n" in patched
+
+def test_crlf_line_endings_are_kept():
+    code = CODE.replace("\n", "\r\n")
+    patched = apply_suggestion_patch(code, suggestion("4", "result = math.pi * r * r"))
+    assert patched == code.replace("3.14 * r * r", "math.pi * r * r")
+
+def test_snippet_longer_than_its_range_replaces_the_whole_range():
+    patched = apply_suggestion_patch(CODE, suggestion("4-5", "result = math.pi * r * r\nassert result >= 0\nreturn result"))
+    assert "    result = math.pi * r * r\n    assert result >= 0\n    return result\n\ndef perimeter" in patched
+
+def test_snippet_shorter_than_its_range_is_left_to_the_llm():
+    # Replacing only line 4 would leave "return result" behind
+    assert apply_suggestion_patch(CODE, suggestion("4-5", "return math.pi * r ** 2")) is None
+
+def test_unrelated_code_is_not_patched():
+    assert apply_suggestion_patch(CODE, suggestion("4", "for item in items:\n    total += item.price")) is None
+
+def test_general_suggestions_and_missing_code_have_no_patch():
+    assert parse_suggestion_patch(suggestion("General", "x = 1")) is None
+    assert parse_suggestion_patch("- **Line(s):** 3\n- **Issue:** Rename") is None
+    assert parse_suggestion_patch(suggestion("3-5", "x = 1")) == (3, 5, ["x = 1"])
+
+def test_stored_fields_patch_like_the_text():
+    improved = "result = math.pi * r * r\n"
+    assert apply_patch(CODE, 4, 4, improved) == apply_suggestion_patch(CODE, suggestion("4", improved.strip()))
+
+def test_stored_fields_without_code_or_range_are_left_to_the_llm():
+    assert apply_patch(CODE, 4, 4, "  \n") is None
+    assert apply_patch(CODE, 0, 4, "result = math.pi * r * r") is None
+    assert apply_patch(CODE, 5, 4, "result = math.pi * r * r") is None
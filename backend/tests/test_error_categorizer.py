@@ -0,0 +1,25 @@
+from error_categorizer import categorize_error, categorize_errors, DEFAULT_CATEGORY
+from benchmark_categorize_error import legacy_categorize_error, load_corpus, review_block, CORPUS_PATH
+
+def test_same_categories_as_the_old_chain_on_the_corpus():
+    for row in load_corpus(CORPUS_PATH):
+        for text in (row["text"], review_block(row)):
+            assert categorize_error(text, row["language"]) == legacy_categorize_error(text, row["language"]), text
+
+def test_earlier_category_wins_wherever_its_keyword_is():
+    assert categorize_error("This will crash, and the syntax is invalid", "python") == "Syntax Error"
+    assert categorize_error("Possible SQL injection through the error message", "python") == "Runtime Error"
+
+def test_keywords_match_anywhere_in_words():
+    # Overlapping and embedded keywords count, like the substring checks did
+    assert categorize_error("Show more information", "python") == "Code Style"
+    assert categorize_error("Throws a TypeError", "javascript") == "Runtime Error"
+
+def test_language_keywords_only_apply_to_their_language():
+    assert categorize_error("Module not found when run from the repo root", "python") == "Python Specific Error"
+    assert categorize_error("Module not found when run from the repo root", "java") == DEFAULT_CATEGORY
+
+def test_batch_matches_one_at_a_time():
+    texts = ["Avoid an infinite loop here", "Use a dry-run flag", "Possible XSS in the template", "", "Inconsistent naming"]
+    assert categorize_errors(texts, "python") == [categorize_error(text, "python") for text in texts]
+    assert categorize_errors([], "python") == []
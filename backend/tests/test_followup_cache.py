@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+import followup_cache
+from followup_cache import FollowupCache, make_followup_cache_key
+
+class FakeSession:
+    """Answers followup_cache lookups from `rows` and records the statements executed"""
+
+    def __init__(self, rows: dict | None = None):
+        self.rows = rows or {}  # cache key -> (output, created_at)
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        if statement.is_select:
+            params = statement.compile().params
+            keys = params["cache_key_1"]
+            if isinstance(keys, list):
+                found = [
+                    SimpleNamespace(cache_key=key, output=self.rows[key][0])
+                    for key in keys if key in self.rows and self.rows[key][1] >= params["created_at_1"]
+                ]
+                return SimpleNamespace(all=lambda: found)
+            row = self.rows.get(keys)
+            entry = SimpleNamespace(output=row[0], created_at=row[1]) if row else None
+            return SimpleNamespace(first=lambda: entry)
+        return SimpleNamespace(rowcount=2 if statement.is_delete else 1)
+
+    async def rollback(self):
+        pass
+
+def new_cache() -> FollowupCache:
+    return FollowupCache(max_entries=10, max_bytes=10 ** 6, ttl_seconds=60, max_rows=100)
+
+def test_key_depends_on_kind_and_normalized_inputs():
+    key = make_followup_cache_key("modify-1", "x = 1  \n", "python")
+    assert key == make_followup_cache_key("modify-1", "x = 1\n", "python")
+    assert key != make_followup_cache_key("accept-1", "x = 1\n", "python")
+    assert key != make_followup_cache_key("modify-1", "x = 2\n", "python")
+
+def test_db_hit_fills_memory_and_expired_rows_miss():
+    cache = new_cache()
+    db = FakeSession({
+        "fresh": ("1. Use a set", datetime.utcnow()),
+        "old": ("1. Use a list", datetime.utcnow() - timedelta(seconds=120)),
+    })
+    assert asyncio.run(cache.get("fresh", db)) == "1. Use a set"
+    assert asyncio.run(cache.get("fresh", FakeSession())) == "1. Use a set"
+    assert asyncio.run(cache.get("old", db)) is None
+    assert asyncio.run(cache.get("missing", db)) is None
+    stats = cache.stats()
+    assert (stats["db_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 2)
+
+def test_get_many_returns_only_hits_with_one_query():
+    cache = new_cache()
+    cache.remember("warm", "in memory")
+    db = FakeSession({
+        "fresh": ("from the table", datetime.utcnow()),
+        "old": ("expired", datetime.utcnow() - timedelta(seconds=120)),
+    })
+    found = asyncio.run(cache.get_many(["warm", "fresh", "old", "missing", "fresh"], db))
+    assert found == {"warm": "in memory", "fresh": "from the table"}
+    assert len(db.statements) == 1
+    # Everything found is in memory now: no query at all
+    assert asyncio.run(cache.get_many(["warm", "fresh"], db)) == found
+    assert len(db.statements) == 1
+
+def test_stores_prune_expired_and_overflow_rows_periodically(monkeypatch):
+    monkeypatch.setattr(followup_cache, "FOLLOWUP_CACHE_PRUNE_EVERY", 3)
+    cache = new_cache()
+    db = FakeSession()
+    for i in range(4):
+        asyncio.run(cache.put(f"key{i}", "output", "modify", "python", db))
+    deletes = [statement for statement in db.statements if statement.is_delete]
+    assert len(deletes) == 2  # expired rows, then rows beyond max_rows
+    assert cache.stats()["pruned"] == 4
+    assert asyncio.run(cache.get("key3", FakeSession())) == "output"
+
+def test_identical_calls_share_one_generation():
+    cache = new_cache()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "1. Close the file"
+
+    async def double_click():
+        return await asyncio.gather(*(cache.get_or_generate("key", "accept", "python", FakeSession(), generate) for _ in range(2)))
+
+    assert asyncio.run(double_click()) == ["1. Close the file"] * 2
+    assert len(calls) == 1
+    assert cache.stats()["joined"] == 1
+    assert cache.stats()["inflight"] == 0
+
+def test_failed_generation_is_not_cached():
+    cache = new_cache()
+
+    async def fail():
+        raise RuntimeError("Gemini is unavailable")
+
+    async def generate():
+        return "1. Retry later"
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_generate("key", "modify", "python", FakeSession(), fail))
+    assert asyncio.run(cache.get_or_generate("key", "modify", "python", FakeSession(), generate)) == "1. Retry later"
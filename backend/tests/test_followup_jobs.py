@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+import followup_jobs
+from followup_jobs import FollowupJobPool, job_status, new_job
+
+class JobStore:
+    """followup_jobs rows by job_id for fake sessions; history keeps every status a job was given"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.history = {}
+        self.rollbacks = 0
+
+    def __call__(self):
+        return FakeSession(self)
+
+class FakeSession:
+    def __init__(self, store: JobStore):
+        self.store = store
+
+    async def execute(self, statement):
+        if statement.is_update:
+            values = statement.compile().params
+            job_id = values.pop("job_id_1")
+            self.store.jobs.setdefault(job_id, {}).update(values)
+            self.store.history.setdefault(job_id, []).append(values["status"])
+        return SimpleNamespace(rowcount=0)
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        self.store.rollbacks += 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+def job_row(status: str, age_seconds: float, **values) -> SimpleNamespace:
+    row = {"job_id": "j", "kind": "modify", "status": status, "result": None, "error": None}
+    return SimpleNamespace(**{**row, **values, "updated_at": datetime.utcnow() - timedelta(seconds=age_seconds)})
+
+def test_reservations_count_against_the_queue_until_released():
+    pool = FollowupJobPool(workers=2, max_queue=3)
+    reservation = pool.reserve(2)
+    pool.check_admission(1)
+    with pytest.raises(HTTPException) as rejected:
+        pool.reserve(2)
+    assert rejected.value.status_code == 429
+    assert rejected.value.headers["Retry-After"] == "1"
+    reservation.release()
+    reservation.release()  # a second release gives nothing back twice
+    assert pool.stats()["reserved"] == 0
+    assert pool.stats()["rejected"] == 1
+    pool.reserve(3).release()
+
+def test_submit_takes_a_reserved_slot_and_release_returns_the_rest(monkeypatch):
+    store = JobStore()
+    monkeypatch.setattr(followup_jobs, "AsyncSessionLocal", store)
+
+    async def run(db):
+        return "three suggestions"
+
+    async def submit_one():
+        pool = FollowupJobPool(workers=1, max_queue=3)
+        reservation = pool.reserve(3)
+        pool.submit("a", run, reservation)
+        assert (reservation.count, pool.stats()["reserved"], pool.queued()) == (2, 2, 1)
+        reservation.release()
+        await pool._queue.join()
+        return pool
+
+    pool = asyncio.run(submit_one())
+    assert pool.stats()["reserved"] == 0
+    assert store.history["a"] == ["running", "done"]
+    assert store.jobs["a"]["result"] == "three suggestions"
+
+def test_failed_run_rolls_back_and_records_the_error(monkeypatch):
+    store = JobStore()
+    monkeypatch.setattr(followup_jobs, "AsyncSessionLocal", store)
+
+    async def run(db):
+        raise HTTPException(status_code=503, detail="Gemini is unavailable")
+
+    async def run_jobs():
+        pool = FollowupJobPool(workers=2, max_queue=3)
+        reservation = pool.reserve(1)
+        pool.submit("a", run, reservation)
+        await pool._queue.join()
+        return pool
+
+    pool = asyncio.run(run_jobs())
+    assert store.history["a"] == ["running", "failed"]
+    assert store.jobs["a"]["error"] == "Gemini is unavailable"
+    assert store.rollbacks == 1
+    assert (pool.counters["done"], pool.counters["failed"]) == (0, 1)
+
+def test_finished_jobs_are_pruned_periodically(monkeypatch):
+    store = JobStore()
+    monkeypatch.setattr(followup_jobs, "AsyncSessionLocal", store)
+    monkeypatch.setattr(followup_jobs, "FOLLOWUP_JOB_PRUNE_EVERY", 2)
+    pruned = []
+
+    async def prune(db):
+        pruned.append(db)
+
+    async def run(db):
+        return "ok"
+
+    async def run_jobs():
+        pool = FollowupJobPool(workers=1, max_queue=5)
+        pool._prune = prune
+        for job_id in "abcde":
+            pool.submit(job_id, run)
+        await pool._queue.join()
+
+    asyncio.run(run_jobs())
+    assert len(pruned) == 2
+
+def test_stale_unfinished_jobs_are_reported_failed(monkeypatch):
+    monkeypatch.setattr(followup_jobs, "FOLLOWUP_JOB_STALE_SECONDS", 60)
+    assert job_status(job_row("running", 10)) == {"job_id": "j", "kind": "modify", "status": "running"}
+    stale = job_status(job_row("pending", 120))
+    assert stale["status"] == "failed" and stale["detail"] == "Job was interrupted, please retry"
+    # Finished jobs keep their outcome however old they are
+    assert job_status(job_row("done", 120, result="x")) == {"job_id": "j", "kind": "modify", "status": "done", "result": "x"}
+
+def test_new_jobs_start_pending_with_unique_ids():
+    first, second = new_job("modify", "s"), new_job("accept", "s")
+    assert first.status == second.status == "pending"
+    assert first.job_id != second.job_id
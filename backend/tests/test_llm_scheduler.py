@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE, PRIORITY_FEEDBACK, PRIORITY_BULK
+
+def test_waiters_are_granted_highest_lane_first():
+    async def scenario():
+        scheduler = LLMScheduler(max_in_flight=1, rate_per_second=1000, burst=1000, max_queue=10)
+        await scheduler.acquire(PRIORITY_INTERACTIVE)
+        order = []
+
+        async def request(priority, name):
+            await scheduler.acquire(priority)
+            order.append(name)
+            scheduler.release()
+
+        tasks = [
+            asyncio.create_task(request(PRIORITY_BULK, "bulk")),
+            asyncio.create_task(request(PRIORITY_FEEDBACK, "feedback")),
+            asyncio.create_task(request(PRIORITY_INTERACTIVE, "interactive-1")),
+            asyncio.create_task(request(PRIORITY_INTERACTIVE, "interactive-2")),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth() == 4
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive-1", "interactive-2", "feedback", "bulk"]
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        scheduler = LLMScheduler(max_in_flight=1, rate_per_second=1, burst=1, max_queue=1)
+        await scheduler.acquire()
+        waiting = asyncio.create_task(scheduler.acquire(PRIORITY_BULK))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await scheduler.acquire(PRIORITY_BULK)
+        waiting.cancel()
+        return rejected.value, scheduler.stats()
+
+    error, stats = asyncio.run(scenario())
+    assert error.status_code == 429 and int(error.headers["Retry-After"]) >= 1
+    assert stats["lanes"]["bulk"]["rejected"] == 1
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = LLMScheduler(max_in_flight=1, rate_per_second=1000, burst=1000, max_queue=10)
+        await scheduler.acquire()
+        waiting = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        depth = scheduler.queue_depth()
+        scheduler.release()
+        return depth, scheduler.stats()["in_flight"]
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+def test_token_bucket_limits_the_rate():
+    async def scenario():
+        scheduler = LLMScheduler(max_in_flight=100, rate_per_second=50, burst=2, max_queue=10)
+        waits = []
+        for _ in range(4):
+            waits.append(await scheduler.acquire())
+        return waits
+
+    waits = asyncio.run(scenario())
+    assert waits[:2] == [0.0, 0.0]
+    # The burst is spent, so later requests wait for tokens to refill
+    assert all(wait >= 10 for wait in waits[2:])
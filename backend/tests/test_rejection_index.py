@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from rejection_index import RejectionIndex, RejectionIndexCache, normalize_rejection
+
+def suggestion(line: str, issue: str) -> str:
+    return f"- **Line(s):** {line}\n- **Severity:** Low\n- **Issue:** {issue}"
+
+def test_near_duplicates_match_regardless_of_lines_and_formatting():
+    index = RejectionIndex()
+    index.add(suggestion("12", "Use a context manager to close the file handle"))
+    assert suggestion("40-41", "Use a context manager to close the file handle!") in index
+    assert suggestion("3", "Use a context manager so the file handle gets closed") not in index
+    assert suggestion("3", "Add type hints to the public functions") not in index
+
+def test_repeats_collapse_and_rank_first_in_summary():
+    index = RejectionIndex()
+    index.add(suggestion("1", "Rename variable x to something descriptive"))
+    index.add(suggestion("2", "Avoid bare except clauses"))
+    index.add(suggestion("9", "Avoid bare except clauses"))
+    assert len(index) == 2
+    assert index.summary() == ["Avoid bare except clauses", "Rename variable x to something descriptive"]
+
+def test_oldest_entries_are_evicted():
+    index = RejectionIndex(max_entries=2)
+    for issue in ("first issue here", "second issue here", "third issue here"):
+        index.add(suggestion("1", issue))
+    assert suggestion("1", "first issue here") not in index
+    assert suggestion("1", "third issue here") in index
+
+def test_digest_follows_the_distinct_rejections():
+    index = RejectionIndex()
+    empty = index.digest()
+    index.add(suggestion("1", "Avoid bare except clauses"))
+    added = index.digest()
+    index.add(suggestion("5", "Avoid bare except clauses"))
+    assert empty != added == index.digest()
+
+def test_rows_are_added_once_and_late_commits_are_not_skipped():
+    index = RejectionIndex()
+    now = datetime(2025, 1, 1, 12, 0)
+    index.add_row(5, now, suggestion("1", "Avoid bare except clauses"))
+    # id 4 was inserted first but committed after id 5 was read
+    assert index.rescan_from() < now - timedelta(seconds=1)
+    index.add_row(4, now - timedelta(seconds=1), suggestion("1", "Rename variable x to something descriptive"))
+    index.add_row(5, now, suggestion("1", "Avoid bare except clauses"))
+    assert len(index) == 2 and index.last_id == 5
+    assert index._entries[normalize_rejection(suggestion("1", "Avoid bare except clauses"))]["count"] == 1
+
+def test_cache_keeps_the_most_recent_scopes():
+    cache = RejectionIndexCache(max_scopes=2)
+    first = cache.get("user:1")
+    cache.get("user:2")
+    assert cache.get("user:1") is first
+    cache.get("user:3")
+    assert cache.get("user:1") is first
+    assert cache.get("user:2") is not None and len(cache._indexes) == 2
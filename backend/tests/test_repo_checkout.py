@@ -0,0 +1,131 @@
+import functools
+import http.server
+import io
+import os
+import subprocess
+import tarfile
+import threading
+import pytest
+from repo_checkout import RepoCheckoutCache, shallow_clone, download_tarball
+
+def git(*args, cwd=None) -> str:
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+@pytest.fixture
+def source_repo(tmp_path):
+    repo = tmp_path / "source"
+    repo.mkdir()
+    git("init", "-q", cwd=repo)
+    git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=repo)
+    (repo / "src").mkdir()
+    (repo / "src" / "a.py").write_text("print(1)\n")
+    git("add", "-A", cwd=repo)
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", "first", cwd=repo)
+    first = git("rev-parse", "HEAD", cwd=repo)
+    (repo / "b.py").write_text("x = 2\n")
+    git("add", "-A", cwd=repo)
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", "second", cwd=repo)
+    return repo, first
+
+def test_shallow_clone_fetches_the_requested_commit(source_repo, tmp_path):
+    repo, first = source_repo
+    target = tmp_path / "target"
+    shallow_clone(str(repo), first, str(target))
+    assert (target / "src" / "a.py").read_text() == "print(1)\n"
+    assert not (target / "b.py").exists()
+    assert not (target / ".git").exists()
+
+def test_shallow_clone_reports_unknown_commit(source_repo, tmp_path):
+    repo, _ = source_repo
+    with pytest.raises(RuntimeError, match="git fetch failed"):
+        shallow_clone(str(repo), "0" * 40, str(tmp_path / "target"))
+
+def add_member(archive, name: str, data: bytes = b"", **fields):
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    for key, value in fields.items():
+        setattr(member, key, value)
+    archive.addfile(member, io.BytesIO(data))
+
+@pytest.fixture
+def tarball_url(tmp_path):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        add_member(archive, "owner-repo-abc/src/a.py", b"print(1)\n")
+        add_member(archive, "owner-repo-abc/link.py", type=tarfile.SYMTYPE, linkname="/etc/passwd")
+        add_member(archive, "owner-repo-abc/../escape.py", b"x = 1\n")
+        add_member(archive, "top-level.py", b"x = 1\n")
+    served = tmp_path / "served"
+    served.mkdir()
+    (served / "repo.tar.gz").write_bytes(buffer.getvalue())
+
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(served))
+    handler.log_message = lambda *args: None
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/repo.tar.gz"
+    server.shutdown()
+    server.server_close()
+
+def test_download_tarball_extracts_only_regular_files_inside_target(tarball_url, tmp_path):
+    target = tmp_path / "target"
+    target.mkdir()
+    download_tarball(tarball_url, str(target))
+    files = sorted(str(path.relative_to(target)) for path in target.rglob("*") if path.is_file() or path.is_symlink())
+    assert files == ["src/a.py"]
+    assert (target / "src" / "a.py").read_text() == "print(1)\n"
+    assert not (tmp_path / "escape.py").exists()
+
+def fill(target: str, files: dict):
+    for name, text in files.items():
+        path = os.path.join(target, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+def test_read_file_refuses_symlinks_and_paths_outside_the_snapshot(tmp_path):
+    secret = tmp_path / "secret.txt"
+    secret.write_text("GITHUB_TOKEN=x")
+    cache = RepoCheckoutCache(str(tmp_path / "cache"), max_bytes=10 ** 6)
+
+    def fetch(target):
+        fill(target, {"a.py": "print(1)\n"})
+        os.symlink(str(secret), os.path.join(target, "evil.py"))
+        os.symlink("a.py", os.path.join(target, "alias.py"))
+
+    cache.checkout("abc", fetch)
+    assert cache.read_file("abc", "a.py") == "print(1)\n"
+    for file_path in ("evil.py", "alias.py", "../secret.txt", "/etc/passwd"):
+        with pytest.raises(ValueError):
+            cache.read_file("abc", file_path)
+    with pytest.raises(FileNotFoundError) as error:
+        cache.read_file("abc", "missing.py")
+    assert str(tmp_path) not in str(error.value)
+
+def test_least_recently_used_snapshots_are_evicted(tmp_path):
+    cache = RepoCheckoutCache(str(tmp_path / "cache"), max_bytes=250)
+    for used, commit_sha in enumerate(("one", "two", "three")):
+        cache.checkout(commit_sha, lambda target: fill(target, {"f.py": "x" * 100}))
+        os.utime(cache.path(commit_sha), (used, used))
+    assert [name for _, _, name in cache.entries()] == ["two", "three"]
+    assert cache.counters["evictions"] == 1
+
+    cache.checkout("two", lambda target: pytest.fail("two is cached"))
+    cache.checkout("four", lambda target: fill(target, {"f.py": "x" * 100}))
+    assert sorted(name for _, _, name in cache.entries()) == ["four", "two"]
+
+def test_pinned_snapshots_are_not_evicted(tmp_path):
+    cache = RepoCheckoutCache(str(tmp_path / "cache"), max_bytes=150)
+    lease = cache.pin("one")
+    cache.checkout("one", lambda target: fill(target, {"f.py": "x" * 100}))
+    cache.checkout("two", lambda target: fill(target, {"f.py": "x" * 100}))
+    cache.checkout("three", lambda target: fill(target, {"f.py": "x" * 100}))
+    assert "one" in [name for _, _, name in cache.entries()]
+    assert cache.read_file("one", "f.py") == "x" * 100
+    assert cache.stats()["pinned"] == 1
+
+    cache.unpin(lease)
+    cache.evict()
+    assert "one" not in [name for _, _, name in cache.entries()]
+    assert cache.stats()["pinned"] == 0
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import review_cache
+from review_cache import ReviewCache, make_review_cache_key
+
+class FakeSession:
+    """Answers review_cache lookups from `rows` and records the statements executed"""
+
+    def __init__(self, rows: dict | None = None):
+        self.rows = rows or {}  # cache key -> (suggestions, created_at)
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        if statement.is_select:
+            key = statement.whereclause.right.value
+            row = self.rows.get(key)
+            entry = SimpleNamespace(suggestions=row[0], created_at=row[1]) if row else None
+            return SimpleNamespace(scalars=lambda: SimpleNamespace(first=lambda: entry))
+        return SimpleNamespace(rowcount=2 if statement.is_delete else 1)
+
+SUGGESTIONS = [{"id": 1, "text": "Use a context manager"}]
+
+def test_key_ignores_cosmetic_changes_only():
+    key = make_review_cache_key("x = 1  \r\n\n", "Python", "1", "ctx")
+    assert key == make_review_cache_key("x = 1\n", "python", "1", "ctx")
+    assert key != make_review_cache_key("x = 2\n", "python", "1", "ctx")
+    assert key != make_review_cache_key("x = 1\n", "python", "2", "ctx")
+
+def test_db_hit_fills_memory_and_expired_rows_miss():
+    cache = ReviewCache(max_entries=10, max_bytes=10 ** 6, ttl_seconds=60, max_rows=100)
+    db = FakeSession({
+        "fresh": (SUGGESTIONS, datetime.utcnow()),
+        "old": (SUGGESTIONS, datetime.utcnow() - timedelta(seconds=120)),
+    })
+    assert asyncio.run(cache.get("fresh", db)) == SUGGESTIONS
+    assert asyncio.run(cache.get("fresh", FakeSession())) == SUGGESTIONS
+    assert asyncio.run(cache.get("old", db)) is None
+    assert asyncio.run(cache.get("missing", db)) is None
+    stats = cache.stats()
+    assert (stats["db_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 2)
+
+def test_put_reaches_memory_only_once_remembered():
+    cache = ReviewCache(max_entries=10, max_bytes=10 ** 6, ttl_seconds=60, max_rows=100)
+    asyncio.run(cache.put("key", SUGGESTIONS, "python", FakeSession()))
+    # The commit could still fail: nothing is served from memory yet
+    assert asyncio.run(cache.get("key", FakeSession())) is None
+    cache.remember("key", SUGGESTIONS)
+    assert asyncio.run(cache.get("key", FakeSession())) == SUGGESTIONS
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ReviewCache(max_entries=2, max_bytes=10 ** 6, ttl_seconds=60, max_rows=100)
+    for key in ("a", "b", "c"):
+        cache.remember(key, SUGGESTIONS)
+    assert cache._get_memory("a") is None
+    assert cache._get_memory("c") == SUGGESTIONS
+    assert cache.stats()["evictions"] == 1
+
+def test_stores_prune_expired_and_overflow_rows_periodically(monkeypatch):
+    monkeypatch.setattr(review_cache, "REVIEW_CACHE_PRUNE_EVERY", 3)
+    cache = ReviewCache(max_entries=10, max_bytes=10 ** 6, ttl_seconds=60, max_rows=100)
+    db = FakeSession()
+    for i in range(4):
+        asyncio.run(cache.put(f"key{i}", SUGGESTIONS, "python", db))
+    deletes = [statement for statement in db.statements if statement.is_delete]
+    assert len(deletes) == 2  # expired rows, then rows beyond max_rows
+    assert cache.stats()["pruned"] == 4
@@ -0,0 +1,100 @@
+import json
+from review_parser import (
+    parse_review_output, make_stream_parser, resume_review_output, complete_json_prefix,
+    SuggestionMerger, suggestion_line_range, shift_suggestion, sort_by_line
+)
+
+MARKDOWN_OUTPUT = """--- SUGGESTION 1 ---
+- **Line(s):** 2-3
+- **Severity:** High
+- **Issue:** Division by zero when the list is empty
+- **Improved Code (if applicable):** ```python
+return sum(values) / len(values) if values else 0
+```
+--- SUGGESTION 2 ---
+- **Line(s):** General
+- **Severity:** Low
+- **Issue:** Add a docstring
+"""
+
+STRUCTURED = [
+    {"line_start": 2, "line_end": 3, "severity": "high", "category": "Logic Error",
+     "issue": "Division by zero when the list is empty", "improved_code": "return sum(values) / len(values) if values else 0\n"},
+    {"line_start": None, "line_end": None, "severity": "Low", "category": "Documentation Issue", "issue": "Add a docstring"},
+]
+
+def test_markdown_blocks_keep_line_range_and_improved_code():
+    parsed = parse_review_output(MARKDOWN_OUTPUT, "python", set(), output_format="markdown")
+    # ids follow block position; the empty text before the first delimiter is block 1
+    assert [item["id"] for item in parsed] == [2, 3]
+    assert parsed[0]["severity"] == "High"
+    assert (parsed[0]["line_start"], parsed[0]["line_end"]) == (2, 3)
+    assert parsed[0]["improved_code"] == "return sum(values) / len(values) if values else 0"
+    assert (parsed[1]["line_start"], parsed[1]["improved_code"]) == (None, None)
+
+def test_structured_items_keep_fields_and_render_markdown():
+    parsed = parse_review_output(json.dumps(STRUCTURED), "python", set(), output_format="json", line_offset=10)
+    first = parsed[0]
+    assert (first["line_start"], first["line_end"]) == (12, 13)
+    assert first["severity"] == "High"
+    assert first["improved_code"] == "return sum(values) / len(values) if values else 0"
+    assert first["text"].startswith("- **Line(s):** 12-13\n- **Severity:** High\n")
+    assert "```python\nreturn sum(values)" in first["text"]
+    assert parsed[1]["line_start"] is None and "General" in parsed[1]["text"]
+
+def test_structured_line_end_defaults_to_line_start():
+    parsed = parse_review_output(json.dumps([{"line_start": 5, "severity": "Low", "issue": "x"}]), "python", set(), output_format="json")
+    assert (parsed[0]["line_start"], parsed[0]["line_end"]) == (5, 5)
+
+def test_rejected_suggestions_are_skipped_but_keep_their_id():
+    rendered = parse_review_output(json.dumps(STRUCTURED), "python", set(), output_format="json")
+    parsed = parse_review_output(json.dumps(STRUCTURED), "python", {rendered[0]["text"]}, output_format="json")
+    assert [item["id"] for item in parsed] == [2]
+
+def test_stream_parsers_match_batch_parsing():
+    for output_format, raw in (("markdown", MARKDOWN_OUTPUT), ("json", json.dumps(STRUCTURED))):
+        parser = make_stream_parser("python", set(), output_format)
+        streamed = []
+        for i in range(0, len(raw), 7):
+            streamed.extend(parser.feed(raw[i:i + 7]))
+        streamed.extend(parser.close())
+        assert streamed == parse_review_output(raw, "python", set(), output_format=output_format)
+
+def test_structured_stream_emits_objects_as_they_complete():
+    parser = make_stream_parser("python", set(), "json")
+    raw = json.dumps(STRUCTURED)
+    cut = raw.index("}, {") + 1
+    assert [item["id"] for item in parser.feed(raw[:cut])] == [1]
+    assert [item["id"] for item in parser.feed(raw[cut:])] == [2]
+
+def test_truncated_json_keeps_complete_objects():
+    raw = json.dumps(STRUCTURED)
+    truncated = raw[:raw.index("}, {") + 20]
+    assert len(parse_review_output(truncated, "python", set(), output_format="json")) == 1
+    kept, count = complete_json_prefix(truncated)
+    assert count == 1 and kept.endswith("}")
+
+def test_resume_review_output_cuts_back_to_last_complete_block():
+    kept, instruction = resume_review_output(MARKDOWN_OUTPUT[:-20], output_format="markdown")
+    assert kept == MARKDOWN_OUTPUT[:MARKDOWN_OUTPUT.index("--- SUGGESTION 2 ---")]
+    assert "SUGGESTION 2" in instruction
+
+def test_merger_drops_repeated_issues_and_renumbers():
+    parsed = parse_review_output(json.dumps(STRUCTURED), "python", set(), output_format="json")
+    moved = shift_suggestion(parsed[0], 40)
+    merged = SuggestionMerger().add([parsed[1], moved, parsed[0]])
+    assert [item["id"] for item in merged] == [1, 2]
+    assert merged[1]["line_start"] == 42
+
+def test_shift_suggestion_moves_text_and_fields():
+    parsed = parse_review_output(MARKDOWN_OUTPUT, "python", set(), output_format="markdown")
+    moved = shift_suggestion(parsed[0], 5)
+    assert (moved["line_start"], moved["line_end"]) == (7, 8)
+    assert "**Line(s):** 7-8" in moved["text"]
+    assert suggestion_line_range(moved) == (7, 8)
+
+def test_line_range_of_items_parsed_before_structured_fields():
+    legacy = {"id": 1, "text": "- **Line(s):** 9, 4\n- **Issue:** x", "severity": "Low", "error_category": "Other Issue"}
+    general = {"id": 2, "text": "- **Line(s):** General", "severity": "Low", "error_category": "Other Issue"}
+    assert suggestion_line_range(legacy) == (4, 9)
+    assert [item["id"] for item in sort_by_line([general, legacy])] == [1, 2]
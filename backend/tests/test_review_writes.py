@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+from database import AISuggestion, RepoFile, SuggestionLatency
+from review_writes import ReviewWriteBatch, ReviewWriteQueue
+
+class FakeSession:
+    """Records what a review write executes; COPY goes through the raw asyncpg connection"""
+
+    def __init__(self, driver: str = "asyncpg", fail: bool = False):
+        self.bind = SimpleNamespace(dialect=SimpleNamespace(driver=driver))
+        self.fail = fail
+        self.inserts = []  # (table, row count)
+        self.copies = []  # (table, row count)
+        self.staged = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def execute(self, statement, rows=None):
+        if self.fail:
+            raise RuntimeError("database is down")
+        self.inserts.append((statement.table.name, len(rows or [])))
+
+    async def connection(self):
+        session = self
+
+        async def copy_records_to_table(table, records, columns):
+            session.copies.append((table, len(records)))
+
+        raw = SimpleNamespace(driver_connection=SimpleNamespace(copy_records_to_table=copy_records_to_table))
+
+        async def get_raw_connection():
+            return raw
+
+        return SimpleNamespace(get_raw_connection=get_raw_connection)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+def file_writes(file_path: str, suggestions: int) -> ReviewWriteBatch:
+    writes = ReviewWriteBatch()
+    writes.add(RepoFile, repo_id=1, session_id="s", file_path=file_path,
+               content_sha256=writes.add_code(f"# {file_path}\n"), language="python")
+    writes.add(SuggestionLatency, session_id="s", latency_ms=10.0)
+    writes.extend(AISuggestion, [
+        {"session_id": "s", "suggestion_id": i + 1, "suggestion_text": "x", "file_path": file_path}
+        for i in range(suggestions)
+    ])
+    return writes
+
+def test_batch_copies_tables_past_the_threshold():
+    writes = ReviewWriteBatch(copy_min_rows=5)
+    writes.merge(file_writes("a.py", 3))
+    writes.merge(file_writes("b.py", 3))
+    db = FakeSession()
+    asyncio.run(writes.flush(db))
+    assert db.copies == [("ai_suggestions", 6)]
+    assert db.inserts == [("code_blobs", 2), ("repo_files", 2), ("suggestion_latency", 2)]
+    assert len(writes) == 0
+
+def test_batch_inserts_when_copy_is_unavailable():
+    writes = file_writes("a.py", 8)
+    writes.copy_min_rows = 5
+    db = FakeSession(driver="psycopg2")
+    asyncio.run(writes.flush(db))
+    assert db.copies == []
+    assert ("ai_suggestions", 8) in db.inserts
+
+def test_queue_writes_files_in_groups_of_one_transaction():
+    sessions = []
+
+    def session_factory():
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    async def review():
+        queue = ReviewWriteQueue(session_factory, files_per_flush=3, copy_min_rows=6)
+        for i in range(7):
+            async def stage(db, i=i):
+                db.staged.append(i)
+            queue.add(f"f{i}.py", file_writes(f"f{i}.py", 2), stage)
+        await queue.close()
+        return queue
+
+    queue = asyncio.run(review())
+    assert [db.staged for db in sessions] == [[0, 1, 2], [3, 4, 5], [6]]
+    assert [db.commits for db in sessions] == [1, 1, 1]
+    assert sessions[0].copies == [("ai_suggestions", 6)]
+    assert sessions[2].copies == [] and ("ai_suggestions", 2) in sessions[2].inserts
+    assert queue.failed == {}
+
+def test_failed_group_reports_every_file_in_it():
+    sessions = [FakeSession(), FakeSession(fail=True)]
+
+    async def review():
+        queue = ReviewWriteQueue(lambda: sessions.pop(0), files_per_flush=2)
+
+        async def stage(db):
+            pass
+
+        for i in range(4):
+            queue.add(f"f{i}.py", file_writes(f"f{i}.py", 1), stage)
+        await queue.close()
+        return queue
+
+    queue = asyncio.run(review())
+    assert sorted(queue.failed) == ["f2.py", "f3.py"]
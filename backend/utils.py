@@ -1,7 +1,5 @@
-from database import UserPattern
 from schemas import UserCreate
 import bcrypt
-from typing import List
 import os
 from dotenv import load_dotenv
 
@@ -28,37 +26,6 @@ def hash_password(password: str) -> bytes:
 def verify_password(password: bytes, hashed: bytes) -> bool:
     return bcrypt.checkpw(password, hashed)
 
-def summarize_user_patterns(patterns: List[UserPattern]) -> str:
-    if not patterns:
-        return "No prior feedback available."
-
-    accepted = []
-    rejected = []
-    modified = []
-
-    for p in patterns:
-        data = p.pattern_data or {}
-        if p.pattern_type == "accepted":
-            accepted.append(data.get("suggestion_text", "")[:100])
-        elif p.pattern_type == "rejected":
-            reason = data.get("reject_reason", "No reason given")
-            suggestion = data.get("suggestion_text", "")[:100]
-            rejected.append(f"'{suggestion}' (Reason: {reason})")
-        elif p.pattern_type == "modified":
-            orig = data.get("original_text", "")[:80]
-            mod = data.get("modified_text", "")[:80]
-            modified.append(f"Original: '{orig}' → Modified: '{mod}'")
-
-    summary = []
-    if accepted:
-        summary.append(f"User has accepted suggestions like: {'; '.join(accepted[:3])}.")
-    if rejected:
-        summary.append(f"User has rejected suggestions such as: {'; '.join(rejected[:3])}.")
-    if modified:
-        summary.append(f"User tends to modify suggestions, e.g.: {'; '.join(modified[:2])}.")
-
-    return " ".join(summary) if summary else "User has provided feedback but no clear pattern yet."
-
 def get_google_client_config():
     return {
         "web": {
@@ -392,8 +392,10 @@ const SubmitPage = () => {
 
         if (response.ok) {
           const data = await response.json();
-          if (data.modified_code) {
-            setModifiedCode(data.modified_code);
+          // The acceptance is stored; applying it with the LLM may still be running
+          const modifiedCode = data.job_id ? await waitForFollowupJob(data.job_id) : data.modified_code;
+          if (modifiedCode) {
+            setModifiedCode(modifiedCode);
           }
         }
       } catch (error) {
@@ -456,6 +458,19 @@ const SubmitPage = () => {
     );
   };
 
+  const waitForFollowupJob = async (jobId) => {
+    // Long-poll the background follow-up until it finishes
+    while (true) {
+      const response = await fetch(`http://localhost:8000/followup-jobs/${jobId}?wait=25`);
+      if (!response.ok) {
+        throw new Error(`Follow-up job request failed with status ${response.status}`);
+      }
+      const job = await response.json();
+      if (job.status === 'done') return job.result;
+      if (job.status === 'failed') throw new Error(job.detail || 'Follow-up job failed');
+    }
+  };
+
   const handleModifySuggestion = async (suggestionId, filePath, modifiedText) => {
     const suggestion = aiSuggestions.find((s) => s.id === suggestionId && s.file_path === filePath);
     if (suggestion) {
@@ -482,16 +497,23 @@ const SubmitPage = () => {
 
         if (response.ok) {
           const data = await response.json();
+          // The modification is stored; the follow-up suggestions may still be generating
+          const modifiedSuggestion = data.job_id ? await waitForFollowupJob(data.job_id) : data.modified_suggestion;
           setAiSuggestions((prev) =>
             prev.map((s) =>
               s.id === suggestionId && s.file_path === filePath
-                ? { ...s, text: data.modified_suggestion, modifiedText: '', status: null, loadingAction: null }
+                ? { ...s, text: modifiedSuggestion, modifiedText: '', status: null, loadingAction: null }
                 : s
             )
           );
         }
       } catch (error) {
         console.error("Error modifying suggestion:", error);
+        setAiSuggestions((prev) =>
+          prev.map((s) =>
+            s.id === suggestionId && s.file_path === filePath ? { ...s, loadingAction: null } : s
+          )
+        );
       }
     }
   };